@@ -1,7 +1,5 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.firefox.service import Service as FirefoxService
@@ -9,11 +7,25 @@ from selenium.webdriver.firefox.options import Options as FirefoxOptions
 import time
 import os
 import json
-import re
 import random
 import string
 import datetime
 import sys
+import asyncio
+import threading
+from step_profiler import profiled
+import deadline
+import activation_events
+import activation_links
+import browser_processes
+import pipeline_metrics
+import navigation_timing
+import page_objects
+import webdriver_trace
+import check_messages
+import webhook_receiver
+from message_store import load_message, stored_ids
+from run_state import get_email, get_section, save_section, state_path
 
 class EmbyILAccountActivation:
     def __init__(self, headless=True):
@@ -28,6 +40,7 @@ class EmbyILAccountActivation:
     def setup_driver(self):
         """Setup WebDriver - Firefox first, Chrome as fallback"""
         print("🔧 Setting up WebDriver for account activation...")
+        browser_processes.prepare()
         
         methods = [
             ('Firefox', self._try_firefox),
@@ -37,8 +50,14 @@ class EmbyILAccountActivation:
         for browser_name, method in methods:
             try:
                 print(f"🔄 Attempting {browser_name}...")
-                self.driver = method()
+                started = time.monotonic()
+                with deadline.span('start browser'):
+                    self.driver = method()
+                pipeline_metrics.DRIVER_START.observe(time.monotonic() - started, browser=browser_name,
+                                                      outcome='ok' if self.driver else 'failed')
                 if self.driver:
+                    browser_processes.register(self.driver, f"activation {browser_name}")
+                    webdriver_trace.trace(self.driver, f"activation {browser_name}")
                     print(f"✅ {browser_name} initialized successfully")
                     self.browser_type = browser_name
                     
@@ -52,7 +71,7 @@ class EmbyILAccountActivation:
                 print(f"❌ {browser_name} failed: {str(e)}")
                 if self.driver:
                     try:
-                        self.driver.quit()
+                        browser_processes.quit_driver(self.driver)
                     except:
                         pass
                     self.driver = None
@@ -102,23 +121,17 @@ class EmbyILAccountActivation:
         try:
             signup_email = None
             
-            # Try to read from signup_info.json first (most reliable)
-            if os.path.exists('signup_info.json'):
-                with open('signup_info.json', 'r') as f:
-                    signup_data = json.load(f)
-                    signup_email = signup_data.get('email')
-                    if signup_email:
-                        print(f"📧 Found email from signup_info.json: {signup_email}")
-            
-            # Fallback to email_info.txt
-            if not signup_email and os.path.exists('email_info.txt'):
-                with open('email_info.txt', 'r') as f:
-                    content = f.read()
-                    for line in content.split('\n'):
-                        if 'EMAIL_ADDRESS=' in line:
-                            signup_email = line.split('=')[1].strip()
-                            print(f"📧 Found email from email_info.txt: {signup_email}")
-                            break
+            # Try the signup details first (most reliable)
+            signup_data = get_section('signup') or {}
+            signup_email = signup_data.get('email')
+            if signup_email:
+                print(f"📧 Found email from signup info: {signup_email}")
+            
+            # Fallback to the temporary email itself
+            if not signup_email:
+                signup_email = get_email()[1]
+                if signup_email:
+                    print(f"📧 Found email from email info: {signup_email}")
             
             if not signup_email:
                 print("❌ Could not find email address")
@@ -137,66 +150,47 @@ class EmbyILAccountActivation:
             return None, None
 
     def find_activation_link(self):
-        """Find activation link from message details JSON files"""
+        """Find activation link recorded at ingest, else in the message details JSON files"""
         try:
+            # Ingest records the link as soon as the mail is seen (see activation_events)
+            activation_link = activation_events.recorded_link()
+            if activation_link:
+                print(f"✅ Found activation link recorded at ingest: {activation_link}")
+                return activation_link
+
             print("🔍 Looking for activation link in message details...")
             
-            # Find all message_details_*.json files
-            import glob
-            json_files = glob.glob("message_details_*.json")
+            # Every message saved by Step 4 or by ingest (archive or JSON files)
+            message_ids = stored_ids()
             
-            if not json_files:
-                print("❌ No message details files found")
+            if not message_ids:
+                print("❌ No stored message details found")
                 return None
             
-            print(f"📄 Found {len(json_files)} message detail files")
-            
-            activation_link = None
-            
-            for json_file in json_files:
-                print(f"🔍 Checking {json_file}...")
+            print(f"📄 Found {len(message_ids)} stored messages")
+            address = get_email()[1]
+
+            for message_id in message_ids:
+                print(f"🔍 Checking message {message_id}...")
                 try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        message_data = json.load(f)
-                    
-                    # Look for activation link in different fields
-                    fields_to_check = []
-                    
-                    # Add different possible fields
-                    if 'text' in message_data:
-                        fields_to_check.append(message_data['text'])
-                    if 'html' in message_data:
-                        fields_to_check.append(message_data['html'])
-                    if 'body' in message_data:
-                        fields_to_check.append(message_data['body'])
-                    
-                    # Also check the entire JSON as string
-                    fields_to_check.append(json.dumps(message_data))
-                    
-                    for field in fields_to_check:
-                        if field and isinstance(field, str):
-                            # Look for confirmation token link
-                            patterns = [
-                                r'https://client\.embyiltv\.io/confirmation-token/[a-zA-Z0-9-]+',
-                                r'https://client\.embyiltv\.io/confirmation-token/[a-zA-Z0-9_-]+',
-                                r'client\.embyiltv\.io/confirmation-token/[a-zA-Z0-9-]+'
-                            ]
-                            
-                            for pattern in patterns:
-                                match = re.search(pattern, field)
-                                if match:
-                                    activation_link = match.group(0)
-                                    # Make sure it starts with https
-                                    if not activation_link.startswith('https://'):
-                                        activation_link = 'https://' + activation_link
-                                    print(f"✅ Found activation link: {activation_link}")
-                                    return activation_link
+                    message = load_message(message_id)
+                    if message is None:
+                        continue
+                    # Mail of an earlier build's mailbox carries an already used token
+                    if address and message.recipient and message.recipient.lower() != address.lower():
+                        continue
+
+                    # Look in the bodies (aliases resolved by Message), then the entire JSON
+                    activation_link = activation_events.find_activation_link_in(message)
+                    if activation_link:
+                        print(f"✅ Found activation link: {activation_link}")
+                        return activation_link
                                 
-                except json.JSONDecodeError:
-                    print(f"⚠️ Could not parse {json_file}")
+                except (json.JSONDecodeError, ValueError):
+                    print(f"⚠️ Could not parse stored message {message_id}")
                     continue
                 except Exception as e:
-                    print(f"⚠️ Error reading {json_file}: {e}")
+                    print(f"⚠️ Error reading stored message {message_id}: {e}")
                     continue
             
             print("❌ No activation link found in any message")
@@ -207,6 +201,55 @@ class EmbyILAccountActivation:
             print(f"❌ Error searching for activation link: {e}")
             return None
 
+    async def follow_activation_link(self, timeout):
+        """
+        Watch the mailbox and return the activation link the moment ingest sees it
+
+        The watch (polling, or pushes when WEBHOOK_PORT is set) runs in a
+        worker thread; this coroutine subscribes to the ACTIVATION_LINK
+        event and stops the watch as soon as the link is published.
+
+        Args:
+            timeout (float): Seconds to wait for the activation mail
+
+        Returns:
+            str: The activation link, or None if it did not arrive in time
+        """
+        email_id, _, expires_at = get_email()
+        if not email_id:
+            print("❌ No temporary email in the run state to watch")
+            return None
+
+        print(f"👂 Waiting up to {timeout:.0f}s for the activation mail...")
+        stop = threading.Event()
+        loop = asyncio.get_running_loop()
+        with webhook_receiver.receiving(email_id) as receiver:
+            link_wait = asyncio.ensure_future(activation_events.wait_for_activation_link(timeout))
+            watch = loop.run_in_executor(None, lambda: check_messages.watch_messages(
+                email_id, expires_at, duration=timeout,
+                interval=float(os.environ.get('MESSAGE_POLL_INTERVAL', '10')),
+                stop_on_new=False, receiver=receiver, stop_event=stop))
+            try:
+                await asyncio.wait([link_wait, watch], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not link_wait.done():
+                    link_wait.cancel()
+                stop.set()
+                if receiver is not None:
+                    receiver.wake()
+                await asyncio.gather(watch, return_exceptions=True)
+
+        if link_wait.cancelled():
+            # The watch ended first (e.g. mailbox expiry) - it may still have published on the way out
+            event = activation_events.get_bus().last(activation_events.ACTIVATION_LINK)
+        else:
+            event = link_wait.result()
+        if not event:
+            print("⌛ Activation mail did not arrive in time")
+            return None
+        print(f"✅ Activation link received: {event['link']}")
+        return event['link']
+
     def generate_username(self):
         """Generate username: 3 letters + 4 numbers + !"""
         letters = ''.join(random.choices(string.ascii_lowercase, k=3))
@@ -219,10 +262,12 @@ class EmbyILAccountActivation:
         """Perform the full account activation process"""
         try:
             print(f"🌐 Opening activation link: {activation_link}")
-            self.driver.get(activation_link)
+            deadline.bound_driver(self.driver)
+            with deadline.span('load activation page'):
+                navigation_timing.load(self.driver, activation_link, 'activation')
             
-            wait = WebDriverWait(self.driver, 20)
-            time.sleep(3)
+            wait = WebDriverWait(self.driver, deadline.wait_timeout(20))
+            deadline.sleep(3)
             
             # Take screenshot of activation page
             self.driver.save_screenshot("activation_step1_page.png")
@@ -233,38 +278,22 @@ class EmbyILAccountActivation:
             print(f"📧 Email: {email}")
             print(f"🔐 Password: {password} (website signup password)")
             
-            # Find email field
-            email_selectors = [
-                'input[name="email"]',
-                'input[type="email"]',
-                'input[placeholder*="email" i]',
-                'input[placeholder*="Email"]',
-                'input[id*="email"]'
-            ]
-            
-            email_field = self.find_element_by_selectors(email_selectors)
+            # One snapshot resolves the step's fields (see page_objects.py)
+            page = page_objects.take(self.driver, page_objects.ACTIVATION_LOGIN, timeout=8)
+            email_field = page.element('email')
             if email_field:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", email_field)
-                time.sleep(1)
+                deadline.sleep(1)
                 email_field.clear()
                 email_field.send_keys(email)
                 print("✅ Email entered successfully")
             else:
                 print("❌ Email field not found")
             
-            # Find password field
-            password_selectors = [
-                'input[name="password"]',
-                'input[type="password"]',
-                'input[placeholder*="password" i]',
-                'input[placeholder*="Password"]',
-                'input[id*="password"]'
-            ]
-            
-            password_field = self.find_element_by_selectors(password_selectors)
+            password_field = page.element('password')
             if password_field:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", password_field)
-                time.sleep(1)
+                deadline.sleep(1)
                 password_field.clear()
                 password_field.send_keys(password)
                 print(f"✅ Website password entered: {password}")
@@ -275,25 +304,15 @@ class EmbyILAccountActivation:
             self.driver.save_screenshot("activation_step1_filled.png")
             print("📸 Screenshot saved: activation_step1_filled.png")
             
-            # Find and click submit button
-            submit_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                'button:contains("Submit")',
-                'button:contains("Continue")',
-                'button:contains("Next")',
-                '.btn-submit',
-                '.btn-primary',
-                '.submit-button'
-            ]
-            
-            submit_button = self.find_element_by_selectors(submit_selectors)
+            # Find and click submit button (re-read: it may only be enabled once the form is filled)
+            page = page.refresh(timeout=8, wait_for=('submit',))
+            submit_button = page.element('submit')
             if submit_button:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", submit_button)
-                time.sleep(1)
+                deadline.sleep(1)
                 submit_button.click()
                 print("✅ Step 1 submit clicked")
-                time.sleep(5)  # Wait for page to load
+                deadline.sleep(5)  # Wait for page to load
             else:
                 print("❌ Submit button not found for step 1")
                 return False
@@ -308,59 +327,31 @@ class EmbyILAccountActivation:
             # Generate username
             username = self.generate_username()
             
-            # Find username field
-            username_selectors = [
-                'input[name="username"]',
-                'input[name="userName"]',
-                'input[placeholder*="username" i]',
-                'input[placeholder*="Username"]',
-                'input[id*="username"]',
-                'input[type="text"]:first-of-type'
-            ]
-            
-            username_field = self.find_element_by_selectors(username_selectors)
+            page = page_objects.take(self.driver, page_objects.ACTIVATION_ACCOUNT, timeout=8)
+            username_field = page.element('username')
             if username_field:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", username_field)
-                time.sleep(1)
+                deadline.sleep(1)
                 username_field.clear()
                 username_field.send_keys(username)
                 print(f"✅ Username entered: {username}")
             else:
                 print("❌ Username field not found")
             
-            # Find new password field
-            new_password_selectors = [
-                'input[name="password"]',
-                'input[name="newPassword"]',
-                'input[type="password"]:first-of-type',
-                'input[placeholder*="password" i]',
-                'input[id*="password"]'
-            ]
-            
-            new_password_field = self.find_element_by_selectors(new_password_selectors)
+            new_password_field = page.element('new_password')
             if new_password_field:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", new_password_field)
-                time.sleep(1)
+                deadline.sleep(1)
                 new_password_field.clear()
                 new_password_field.send_keys("rh1234")
                 print("✅ New password entered: rh1234")
             else:
                 print("❌ New password field not found")
             
-            # Find password confirmation field
-            confirm_password_selectors = [
-                'input[name="confirmPassword"]',
-                'input[name="password_confirmation"]',
-                'input[name="confirm_password"]',
-                'input[type="password"]:nth-of-type(2)',
-                'input[placeholder*="confirm" i]',
-                'input[id*="confirm"]'
-            ]
-            
-            confirm_password_field = self.find_element_by_selectors(confirm_password_selectors)
+            confirm_password_field = page.element('confirm_password')
             if confirm_password_field:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", confirm_password_field)
-                time.sleep(1)
+                deadline.sleep(1)
                 confirm_password_field.clear()
                 confirm_password_field.send_keys("rh1234")
                 print("✅ Password confirmation entered: rh1234")
@@ -372,13 +363,14 @@ class EmbyILAccountActivation:
             print("📸 Screenshot saved: activation_step2_filled.png")
             
             # Find and click final submit button
-            final_submit_button = self.find_element_by_selectors(submit_selectors)
+            page = page.refresh(timeout=8, wait_for=('submit',))
+            final_submit_button = page.element('submit')
             if final_submit_button:
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", final_submit_button)
-                time.sleep(1)
+                deadline.sleep(1)
                 final_submit_button.click()
                 print("✅ Final submit clicked")
-                time.sleep(8)  # Wait for completion
+                deadline.sleep(8)  # Wait for completion
             else:
                 print("❌ Final submit button not found")
             
@@ -389,7 +381,9 @@ class EmbyILAccountActivation:
             # Save activation details
             activation_info = {
                 'timestamp': datetime.datetime.now().isoformat(),
-                'activation_link': activation_link,
+                # Not 'activation_link': a used token must not be offered again
+                'used_activation_link': activation_link,
+                'email_id': get_email()[0],
                 'email': email,
                 'website_signup_password': password,
                 'username': username,
@@ -399,18 +393,9 @@ class EmbyILAccountActivation:
                 'note': 'Used website signup password for activation, then set new account password'
             }
             
-            # Save with timestamp
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"activation_{timestamp}.json"
-            
-            with open(filename, 'w') as f:
-                json.dump(activation_info, f, indent=2)
-            print(f"💾 Activation info saved to: {filename}")
-            
-            # Also save as activation_info.json for Jenkins
-            with open('activation_info.json', 'w') as f:
-                json.dump(activation_info, f, indent=2)
-            print("💾 Also saved as: activation_info.json")
+            activation_events.observe_activation(get_section('activation'))
+            save_section('activation', activation_info)
+            print(f"💾 Activation info saved to: {state_path()}")
             
             print("🎉 Account activation completed successfully!")
             print(f"📋 Final credentials:")
@@ -428,33 +413,35 @@ class EmbyILAccountActivation:
                 print("📸 Error screenshot saved: activation_error.png")
             return False
 
-    def find_element_by_selectors(self, selectors):
-        """Try to find element using multiple selectors"""
-        for selector in selectors:
-            try:
-                wait = WebDriverWait(self.driver, 8)
-                element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                
-                if element.is_displayed() and element.is_enabled():
-                    return element
-            except Exception:
-                continue
-        return None
-
     def close(self):
         """Close the browser"""
         if self.driver:
+            webdriver_trace.report(self.driver)
             try:
-                self.driver.quit()
+                browser_processes.quit_driver(self.driver)
                 print(f"🔒 {self.browser_type} browser closed successfully")
             except Exception as e:
                 print(f"⚠️ Error closing browser: {e}")
 
 def main():
-    """Main function for account activation"""
+    """
+    Main function for account activation
+
+    With --follow, the mailbox is watched until the activation mail arrives
+    (up to ACTIVATION_WAIT_SECONDS, default 240) instead of requiring Step 4
+    to have saved it; the browser is already up while waiting.
+    """
+    follow = '--follow' in sys.argv[1:]
     print("🚀 Starting EmbyIL Account Activation")
     print("=" * 60)
-    
+
+    # Bad ACTIVATION_SITE(S): stop before the browser is started
+    try:
+        activation_links.matcher()
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
     bot = None
     try:
         # Initialize activation bot
@@ -468,6 +455,9 @@ def main():
         
         # Find activation link from message details
         activation_link = bot.find_activation_link()
+        if not activation_link and follow:
+            timeout = float(os.environ.get('ACTIVATION_WAIT_SECONDS', '240'))
+            activation_link = asyncio.run(bot.follow_activation_link(timeout))
         if not activation_link:
             print("❌ Could not find activation link")
             print("💡 Make sure Step 4 (message processing) completed successfully")
@@ -499,4 +489,5 @@ def main():
         print("🏁 Activation script finished")
 
 if __name__ == "__main__":
-    main()
+    with profiled('activate_account'), deadline.step_deadline('activate_account'):
+        main()
@@ -0,0 +1,255 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+import activation_links
+import deadline
+import pipeline_metrics
+from pipeline_log import get_logger
+from run_state import get_email, get_section, save_section
+from temp_mailbox import parse_expiry
+
+log = get_logger('activation_events')
+
+# In-process event channel between mail ingest and account activation.
+#
+# check_messages.ingest_new_message (polled or pushed mail) looks for the
+# EmbyIL confirmation link (patterns per site, see activation_links) in
+# every new message as soon as it is parsed and publishes an
+# ACTIVATION_LINK event:
+#
+#     {"link": ..., "message_id": ..., "address": ..., "published_at": <time.monotonic()>}
+#
+# Publishing is thread-safe (ingest runs in the watch thread or the
+# webhook receiver's handler threads); subscribers are asyncio coroutines,
+# woken through their loop's call_soon_threadsafe, so the activation step
+# can await the link with a timeout instead of waiting for Step 4 to write
+# files. The last event of each topic is replayed to late subscribers.
+#
+# The link is also recorded in the run state's 'activation' section, so
+# an activation run in another process finds it without scanning
+# the message store. The record names the mailbox it came from and is only
+# handed out for that mailbox; activation moves a used link to
+# used_activation_link, and create_email drops the section with each new
+# mailbox, so a later build never clicks a spent token. The section keeps
+# when the mail was received, for the mail-to-activation latency metric
+# (see pipeline_metrics).
+ACTIVATION_LINK = 'activation_link'
+
+class EventBus:
+    def __init__(self):
+        """Topic-based publish/subscribe between threads and asyncio subscribers"""
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.latest = {}
+
+    def publish(self, topic, event):
+        """
+        Deliver an event to every current subscriber of a topic (any thread)
+
+        Args:
+            topic (str): Topic name
+            event (dict): Event payload
+
+        Returns:
+            int: Number of subscribers it was delivered to
+        """
+        with self.lock:
+            self.latest[topic] = event
+            targets = list(self.subscribers.get(topic, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has already closed
+                pass
+        return len(targets)
+
+    @contextlib.contextmanager
+    def subscription(self, topic, replay=True):
+        """
+        Subscribe the running event loop to a topic for the block
+
+        Args:
+            topic (str): Topic name
+            replay (bool): Start with the topic's last event, if any
+
+        Yields:
+            asyncio.Queue: Events of the topic, in publish order
+        """
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers.setdefault(topic, set()).add(entry)
+            latest = self.latest.get(topic) if replay else None
+        if latest is not None:
+            entry[1].put_nowait(latest)
+        try:
+            yield entry[1]
+        finally:
+            with self.lock:
+                self.subscribers.get(topic, set()).discard(entry)
+
+    async def wait_for(self, topic, timeout=None, predicate=None, replay=True):
+        """
+        Wait for the next event of a topic
+
+        Args:
+            topic (str): Topic name
+            timeout (float): Seconds to wait (None = forever)
+            predicate (callable): Only accept events for which it returns True
+            replay (bool): Accept the topic's last event if it was published already
+
+        Returns:
+            dict: The event, or None on timeout
+        """
+        with self.subscription(topic, replay) as queue:
+            async def next_match():
+                while True:
+                    event = await queue.get()
+                    if predicate is None or predicate(event):
+                        return event
+            try:
+                return await asyncio.wait_for(next_match(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+    def last(self, topic):
+        """The last event published on a topic, or None"""
+        with self.lock:
+            return self.latest.get(topic)
+
+    def clear(self, topic=None):
+        """Forget the last event of one topic (or of all topics)"""
+        with self.lock:
+            if topic is None:
+                self.latest.clear()
+            else:
+                self.latest.pop(topic, None)
+
+_bus = EventBus()
+
+def get_bus():
+    """The process-wide event bus"""
+    return _bus
+
+def extract_activation_link(*texts, site=None):
+    """
+    Find the site's activation link in message text
+
+    Args:
+        *texts (str): Candidate texts (e.g. text body, HTML body, raw JSON), searched in order
+        site (str): Site whose patterns to use (default: ACTIVATION_SITE, see activation_links)
+
+    Returns:
+        str: The link (https:// unless the pattern matched another scheme), or None
+    """
+    links = activation_links.matcher(site)
+    for text in texts:
+        link = links.search(text)
+        if link:
+            return link
+    return None
+
+def find_activation_link_in(message, site=None):
+    """Activation link of a Message (text, then HTML, then the raw JSON), or None"""
+    links = activation_links.matcher(site)
+    link = links.search(message.text) or links.search(message.html)
+    if link:
+        return link
+    return links.search(message.raw)
+
+def publish_message(message):
+    """
+    Publish an ACTIVATION_LINK event if a freshly ingested message carries the link
+
+    Args:
+        message (Message): The new message
+
+    Returns:
+        str: The link that was published, or None
+    """
+    try:
+        link = find_activation_link_in(message)
+    except ValueError as e:
+        # Bad ACTIVATION_SITE(S): the message is still stored and indexed
+        log.warning(f"⚠️ Could not look for an activation link in message {message.id}: {e}")
+        return None
+    if not link:
+        return None
+    event = {
+        'link': link,
+        'message_id': message.id,
+        'address': message.recipient,
+        'published_at': time.monotonic()
+    }
+    delivered = _bus.publish(ACTIVATION_LINK, event)
+    log.info(f"⚡ Activation link found in message {message.id} "
+             f"({delivered} subscriber{'s' if delivered != 1 else ''} notified)")
+    # The message's own date when the API gives one, else the time it was ingested
+    received = parse_expiry(message.date)
+    received_at = received.timestamp() if received else time.time()
+    email_id, address, _ = get_email()
+    try:
+        save_section('activation', {'activation_link': link, 'message_id': message.id,
+                                    'email_id': email_id, 'address': message.recipient or address,
+                                    'received_at': received_at}, merge=True)
+    except OSError as e:
+        log.warning(f"⚠️ Could not record the activation link in the run state: {e}")
+    return link
+
+def recorded_link():
+    """
+    Activation link recorded in the run state by an earlier ingest
+
+    Returns:
+        str: The link, or None unless it was recorded for the current mailbox
+    """
+    activation = get_section('activation') or {}
+    link = activation.get('activation_link')
+    if not link:
+        return None
+    email_id, address, _ = get_email()
+    if email_id and activation.get('email_id'):
+        return link if activation['email_id'] == email_id else None
+    if address and activation.get('address'):
+        return link if activation['address'].lower() == address.lower() else None
+    # Recorded without a mailbox (or none is current): can't tell it is ours
+    return None
+
+def observe_activation(activation, now=None):
+    """
+    Record the mail-to-activation latency once an account is activated
+
+    Args:
+        activation (dict): The run state's 'activation' section as publish_message left it
+        now (float): Unix time of the activation (default: now)
+
+    Returns:
+        float: Seconds from the mail being received, or None when unknown
+    """
+    received_at = (activation or {}).get('received_at')
+    if not isinstance(received_at, (int, float)):
+        return None
+    latency = max((now or time.time()) - received_at, 0.0)
+    pipeline_metrics.MAIL_TO_ACTIVATION.observe(latency)
+    log.info(f"📈 Account activated {latency:.1f}s after the activation mail arrived")
+    return latency
+
+async def wait_for_activation_link(timeout):
+    """
+    Await the next ACTIVATION_LINK event (or one already published in this process)
+
+    Args:
+        timeout (float): Seconds to wait, capped by the step deadline
+
+    Returns:
+        dict: The event, or None on timeout
+    """
+    timeout = deadline.wait_timeout(timeout, 'activation mail')
+    with deadline.span('waiting for activation mail'):
+        event = await _bus.wait_for(ACTIVATION_LINK, timeout)
+    if event:
+        log.info(f"⚡ Activation link handed over "
+                 f"{(time.monotonic() - event['published_at']) * 1000:.1f} ms after ingest")
+    return event
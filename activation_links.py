@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import threading
+
+# Activation link patterns, per site.
+#
+# Each site has:
+#     marker    - literal text every activation link contains; a text
+#                 without it is skipped before any pattern runs, which
+#                 keeps the scan of large newsletters at substring-search
+#                 speed
+#     patterns  - regexes for the link, tried in order; a match without a
+#                 scheme gets https://
+#     example   - a link the patterns must find; a site whose patterns
+#                 don't (typo, over-tight change) is rejected when loaded
+#                 instead of silently finding nothing
+#
+# Mail bodies wrapped quoted-printable style (soft line breaks "=\n" in
+# their first QP_SNIFF characters) are unfolded first, and so is any body
+# where a match runs into a soft break, so a link wrapped by the sender's
+# mailer is found whole rather than truncated.
+#
+#     ACTIVATION_SITE=embyil       site whose links are extracted
+#     ACTIVATION_SITES=sites.json  extra or replacement sites, same shape:
+#                                  {"<site>": {"marker": ..., "patterns": [...], "example": ...}}
+#
+# The offline corpus in benchmarks/link_corpus.py and the `extract`
+# benchmark scenario check a pattern change for correctness and
+# worst-case scan time.
+ACTIVATION_SITE_ENV = 'ACTIVATION_SITE'
+ACTIVATION_SITES_ENV = 'ACTIVATION_SITES'
+DEFAULT_SITE = 'embyil'
+QP_SNIFF = 2048
+
+SITES = {
+    'embyil': {
+        'marker': 'confirmation-token/',
+        'patterns': [r'client\.embyiltv\.io/confirmation-token/[a-zA-Z0-9_-]+'],
+        'example': 'https://client.embyiltv.io/confirmation-token/3f2a9c1e-8b7d-4e6f-a1b2-c3d4e5f60718'
+    }
+}
+
+_SOFT_BREAK = re.compile(r'=\r?\n')
+_cache = {}
+_cache_lock = threading.Lock()
+
+def unfold_quoted_printable(text):
+    """Undo quoted-printable soft line breaks and =3D (other escapes are left alone)"""
+    return _SOFT_BREAK.sub('', text).replace('=3D', '=').replace('=3d', '=')
+
+class LinkMatcher:
+    def __init__(self, site, marker, patterns, example=None):
+        """
+        Compiled link patterns of one site
+
+        Args:
+            site (str): Site name
+            marker (str): Literal every link contains ('' = no pre-check)
+            patterns (list): Regex strings, tried in order
+            example (str): Link the patterns must find
+
+        Raises:
+            ValueError: A pattern doesn't compile, matches the empty
+                string, or the patterns miss the example
+        """
+        self.site = site
+        self.marker = marker or ''
+        if not patterns:
+            raise ValueError(f"Site {site!r} has no activation link patterns")
+        self.patterns = []
+        for pattern in patterns:
+            try:
+                compiled = re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"Site {site!r}: bad activation link pattern {pattern!r}: {e}")
+            if compiled.search(''):
+                raise ValueError(f"Site {site!r}: pattern {pattern!r} matches the empty string")
+            self.patterns.append(compiled)
+        if example is not None:
+            found = self.search(example)
+            if found is None:
+                raise ValueError(f"Site {site!r}: patterns don't match the example link {example!r}")
+            if self.marker and self.marker not in found:
+                raise ValueError(f"Site {site!r}: marker {self.marker!r} is not part of the links found")
+
+    def search(self, text):
+        """
+        The first activation link in a text
+
+        Args:
+            text (str): Message text, HTML or raw JSON
+
+        Returns:
+            str: The link (with a scheme), or None
+        """
+        if not text or not isinstance(text, str):
+            return None
+        # Only the head is sniffed: '=' is everywhere in HTML, so a full
+        # substring scan for it costs more than the patterns themselves
+        head = text[:QP_SNIFF]
+        if '=\n' in head or '=\r\n' in head:
+            text = unfold_quoted_printable(text)
+        match = self._match(text)
+        if match and text.startswith(('=\n', '=\r\n'), match.end()):
+            match = self._match(unfold_quoted_printable(text))
+        if not match:
+            return None
+        link = match.group(0)
+        return link if '://' in link else 'https://' + link
+
+    def _match(self, text):
+        if self.marker and self.marker not in text:
+            return None
+        for pattern in self.patterns:
+            match = pattern.search(text)
+            if match:
+                return match
+        return None
+
+def _load_sites():
+    sites = dict(SITES)
+    path = os.environ.get(ACTIVATION_SITES_ENV)
+    if path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                extra = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Could not read {ACTIVATION_SITES_ENV}={path}: {e}")
+        if not isinstance(extra, dict):
+            raise ValueError(f"{ACTIVATION_SITES_ENV}={path} must hold an object of sites")
+        sites.update(extra)
+    return sites
+
+def matcher(site=None):
+    """
+    The LinkMatcher of a site (compiled once per process)
+
+    Args:
+        site (str): Site name (default: ACTIVATION_SITE, else embyil)
+
+    Returns:
+        LinkMatcher: The site's matcher
+
+    Raises:
+        ValueError: Unknown site or invalid patterns
+    """
+    site = site or os.environ.get(ACTIVATION_SITE_ENV) or DEFAULT_SITE
+    key = (site, os.environ.get(ACTIVATION_SITES_ENV))
+    with _cache_lock:
+        if key not in _cache:
+            sites = _load_sites()
+            if site not in sites:
+                raise ValueError(f"Unknown activation site {site!r} (known: {', '.join(sorted(sites))})")
+            spec = sites[site]
+            _cache[key] = LinkMatcher(site, spec.get('marker'), spec.get('patterns'), spec.get('example'))
+        return _cache[key]
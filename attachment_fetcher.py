@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+import boomlify_api
+import deadline
+from message_store import load_message, store_dir, stored_ids
+from pipeline_log import get_logger, clip
+from run_state import get_email
+
+log = get_logger('attachment_fetcher')
+
+# Attachment downloads for stored messages.
+#
+#     ATTACHMENT_DIR=attachments        where files go (default: <MESSAGE_STORE_DIR>/attachments)
+#     ATTACHMENT_WORKERS=4              downloads at once
+#     ATTACHMENT_MAX_BYTES=52428800     largest attachment accepted (50 MB)
+#
+# Each attachment is streamed to a temporary file in CHUNK_SIZE pieces
+# while it is hashed, so memory use is at most one chunk per worker however
+# large the file. It is then stored by content:
+#
+#     attachments/objects/<sha256[:2]>/<sha256>
+#     attachments/manifest.json          "<message id>/<n>" -> filename, size, type, sha256
+#
+# so a file attached to many messages is kept once. Nothing is fetched
+# twice: attachments already in the manifest (or whose metadata names a
+# sha256 that is already stored) are skipped, and attachments with the
+# same sha256 (or the same source) in one run share one download. The byte count is checked against the metadata
+# size (and Content-Length) - a short or oversized download is discarded.
+#
+# Where an attachment comes from: its download_url/url when the metadata
+# has one, else the API path ATTACHMENT_API_PATH built from its id.
+#
+#     python3 attachment_fetcher.py fetch [--workers N] [--json]
+#     python3 attachment_fetcher.py list
+ATTACHMENT_DIR_ENV = 'ATTACHMENT_DIR'
+ATTACHMENT_WORKERS_ENV = 'ATTACHMENT_WORKERS'
+ATTACHMENT_MAX_BYTES_ENV = 'ATTACHMENT_MAX_BYTES'
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+MANIFEST_FILE = 'manifest.json'
+OBJECTS_DIR = 'objects'
+ATTACHMENT_API_PATH = 'emails/{email_id}/messages/{message_id}/attachments/{attachment_id}'
+
+URL_KEYS = ('download_url', 'downloadUrl', 'url')
+ID_KEYS = ('id', 'attachment_id', 'attachmentId')
+NAME_KEYS = ('filename', 'name', 'fileName')
+SIZE_KEYS = ('size', 'size_bytes', 'length')
+TYPE_KEYS = ('content_type', 'contentType', 'mime_type', 'mimeType')
+HASH_KEYS = ('sha256', 'checksum')
+
+class AttachmentError(Exception):
+    def __init__(self, reason, detail=''):
+        """
+        An attachment that could not be fetched
+
+        Args:
+            reason (str): Short machine-readable cause (http_<status>, size_mismatch, too_large, ...)
+            detail (str): Human-readable detail
+        """
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def attachment_dir():
+    """Directory holding downloaded attachments"""
+    return os.environ.get(ATTACHMENT_DIR_ENV) or os.path.join(store_dir(), 'attachments')
+
+def _first(attachment, keys):
+    for key in keys:
+        value = attachment.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+def expected_size(value):
+    """Byte size from attachment metadata (int or digit string), else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+def describe(attachment):
+    """
+    Normalize one attachment's metadata
+
+    Returns:
+        dict: filename, size (int or None), content_type, sha256, url, attachment_id
+    """
+    sha256 = _first(attachment, HASH_KEYS)
+    if isinstance(sha256, str) and sha256.lower().startswith('sha256:'):
+        sha256 = sha256[7:]
+    return {
+        'filename': str(_first(attachment, NAME_KEYS) or 'attachment'),
+        'size': expected_size(_first(attachment, SIZE_KEYS)),
+        'content_type': _first(attachment, TYPE_KEYS),
+        'sha256': sha256.lower() if isinstance(sha256, str) and len(sha256) == 64 else None,
+        'url': _first(attachment, URL_KEYS),
+        'attachment_id': _first(attachment, ID_KEYS)
+    }
+
+class AttachmentStore:
+    def __init__(self, directory=None):
+        """
+        Content-addressed attachment files plus the manifest that names them
+
+        Args:
+            directory (str): Attachment directory (default: attachment_dir())
+        """
+        self.directory = directory or attachment_dir()
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, OBJECTS_DIR), exist_ok=True)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        try:
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def object_path(self, sha256):
+        """Path of a stored file by its sha256"""
+        return os.path.join(self.directory, OBJECTS_DIR, sha256[:2], sha256)
+
+    def has_object(self, sha256):
+        return bool(sha256) and os.path.exists(self.object_path(sha256))
+
+    def lookup(self, key):
+        """Manifest entry of an attachment whose file is still stored, else None"""
+        with self.lock:
+            entry = self.manifest.get(key)
+        if entry and self.has_object(entry.get('sha256')):
+            return entry
+        return None
+
+    def temp_file(self):
+        """Open a temporary file next to the objects (same filesystem, so adding is a rename)"""
+        fd, path = tempfile.mkstemp(prefix='.download-', dir=os.path.join(self.directory, OBJECTS_DIR))
+        return os.fdopen(fd, 'wb'), path
+
+    def add_file(self, tmp_path, sha256):
+        """
+        Move a finished download into place
+
+        Returns:
+            bool: False when the content was already stored (the temp file is dropped)
+        """
+        path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, path)
+            return True
+
+    def record(self, key, entry):
+        with self.lock:
+            self.manifest[key] = entry
+
+    def save(self):
+        """Write the manifest atomically"""
+        with self.lock:
+            data = json.dumps(self.manifest, indent=2, sort_keys=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.manifest_path)
+
+def _open_stream(email_id, message_id, info):
+    """Streaming GET of an attachment's source"""
+    url = info['url']
+    if url and not url.startswith(boomlify_api.API_BASE_URL):
+        # Not the API: don't send the RapidAPI key along
+        return boomlify_api.get_session().get(url, stream=True, timeout=deadline.http_timeout('GET attachment'))
+    if url:
+        path = url[len(boomlify_api.API_BASE_URL):]
+    else:
+        path = ATTACHMENT_API_PATH.format(email_id=quote(str(email_id), safe=''),
+                                          message_id=quote(str(message_id), safe=''),
+                                          attachment_id=quote(str(info['attachment_id']), safe=''))
+    return boomlify_api.request('GET', path, stream=True)
+
+def download(email_id, message_id, info, store, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Stream one attachment into the store
+
+    Args:
+        email_id (str): Mailbox ID
+        message_id (str): Message ID
+        info (dict): Attachment metadata from describe()
+        store (AttachmentStore): Where the file goes
+        max_bytes (int): Largest size accepted
+
+    Returns:
+        tuple: (sha256, size, new) - new is False when the content was already stored
+
+    Raises:
+        AttachmentError: HTTP error, size mismatch, too large, or checksum mismatch
+        requests.exceptions.RequestException: Network errors and deadline.DeadlineExceeded
+    """
+    expected = info['size']
+    if expected is not None and expected > max_bytes:
+        raise AttachmentError('too_large', f"{expected} bytes (limit {max_bytes})")
+    limit = expected if expected is not None else max_bytes
+    check = deadline.checker('attachment download')
+
+    response = _open_stream(email_id, message_id, info)
+    try:
+        if response.status_code != 200:
+            raise AttachmentError(f"http_{response.status_code}", clip(response.text, 200))
+        announced = expected_size(response.headers.get('Content-Length'))
+        if announced is not None and expected is not None and announced != expected:
+            raise AttachmentError('size_mismatch', f"server announces {announced} bytes, metadata says {expected}")
+        if announced is not None and announced > max_bytes:
+            raise AttachmentError('too_large', f"{announced} bytes")
+
+        digest = hashlib.sha256()
+        size = 0
+        f, tmp_path = store.temp_file()
+        try:
+            with f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if check:
+                        check()
+                    size += len(chunk)
+                    if size > limit:
+                        raise AttachmentError('too_large' if expected is None else 'size_mismatch',
+                                              f"more than {limit} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+            if expected is not None and size != expected:
+                raise AttachmentError('size_mismatch', f"received {size} bytes, metadata says {expected}")
+            sha256 = digest.hexdigest()
+            if info['sha256'] and info['sha256'] != sha256:
+                raise AttachmentError('checksum_mismatch', f"received {sha256}")
+            return sha256, size, store.add_file(tmp_path, sha256)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        response.close()
+
+class AttachmentFetcher:
+    def __init__(self, email_id, store=None, workers=None, max_bytes=None):
+        """
+        Bounded pool of attachment downloads
+
+        Args:
+            email_id (str): Mailbox the messages belong to
+            store (AttachmentStore): Destination (default: AttachmentStore())
+            workers (int): Downloads at once (default: ATTACHMENT_WORKERS or 4)
+            max_bytes (int): Largest attachment accepted (default: ATTACHMENT_MAX_BYTES or 50 MB)
+        """
+        self.email_id = email_id
+        self.store = store or AttachmentStore()
+        self.workers = max(int(workers or _env_int(ATTACHMENT_WORKERS_ENV, DEFAULT_WORKERS)), 1)
+        self.max_bytes = max_bytes or _env_int(ATTACHMENT_MAX_BYTES_ENV, DEFAULT_MAX_BYTES)
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def _source_key(self, message_id, info):
+        if info['sha256']:
+            return info['sha256']
+        if info['url']:
+            return info['url']
+        return f"{message_id}/{info['attachment_id']}"
+
+    def fetch_one(self, message_id, info):
+        """Download one source once per run, however many attachments name it"""
+        key = self._source_key(message_id, info)
+        with self.lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.inflight[key] = future
+        if not owner:
+            sha256, size, _ = future.result()
+            return sha256, size, False
+        try:
+            result = download(self.email_id, message_id, info, self.store, self.max_bytes)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def fetch(self, messages):
+        """
+        Download the attachments of some messages
+
+        Args:
+            messages (list): Message objects
+
+        Returns:
+            dict: The report - attachments, downloaded, deduplicated, cached,
+                skipped, failed {key: error}, bytes_downloaded, seconds
+        """
+        started = time.monotonic()
+        report = self.new_report()
+        jobs = self.plan(messages, report)
+
+        if jobs:
+            log.info(f"📎 Downloading {len(jobs)} attachments ({self.workers} at a time)...")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                       thread_name_prefix='attachment') as pool:
+                futures = {pool.submit(self.fetch_one, message_id, info): (key, message_id, info)
+                           for key, message_id, info in jobs}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        self.settle(futures[future], report, future.result())
+                    except (AttachmentError, requests.exceptions.RequestException, OSError) as e:
+                        self.settle(futures[future], report, error=e)
+            self.store.save()
+
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+    def new_report(self):
+        """Empty fetch report (see fetch)"""
+        return {'attachments': 0, 'downloaded': 0, 'deduplicated': 0, 'cached': 0, 'skipped': 0,
+                'failed': {}, 'bytes_downloaded': 0, 'workers': self.workers, 'seconds': 0.0}
+
+    def plan(self, messages, report):
+        """
+        Sort the messages' attachments into already stored, skipped and to download
+
+        Args:
+            messages (list): Message objects
+            report (dict): Fetch report, counts updated in place
+
+        Returns:
+            list: (key, message_id, info) of each download needed, for fetch_one()
+        """
+        jobs = []
+        for message in messages:
+            for n, attachment in enumerate(message.attachments or [], 1):
+                if not isinstance(attachment, dict):
+                    continue
+                report['attachments'] += 1
+                key = f"{message.id}/{n}"
+                info = describe(attachment)
+                if self.store.lookup(key):
+                    report['cached'] += 1
+                elif self.store.has_object(info['sha256']):
+                    self._record(key, message.id, info, info['sha256'], info['size'])
+                    report['deduplicated'] += 1
+                elif not info['url'] and info['attachment_id'] is None:
+                    report['skipped'] += 1
+                    log.warning(f"⚠️ Attachment {key} has neither a URL nor an id - skipped")
+                else:
+                    jobs.append((key, message.id, info))
+        return jobs
+
+    def settle(self, job, report, result=None, error=None):
+        """
+        Record the outcome of one download from plan()
+
+        Args:
+            job (tuple): (key, message_id, info)
+            report (dict): Fetch report, updated in place
+            result (tuple): What fetch_one() returned
+            error (Exception): What it raised instead
+        """
+        key, message_id, info = job
+        if error is not None:
+            log.error(f"❌ Attachment {key} ({clip(info['filename'], 80)}): {error}")
+            report['failed'][key] = str(error)
+            return
+        sha256, size, new = result
+        self._record(key, message_id, info, sha256, size)
+        if new:
+            report['downloaded'] += 1
+            report['bytes_downloaded'] += size
+        else:
+            report['deduplicated'] += 1
+        log.info(f"💾 {clip(info['filename'], 80)} ({size:,} bytes) -> {self.store.object_path(sha256)}")
+
+    def _record(self, key, message_id, info, sha256, size):
+        self.store.record(key, {
+            'message_id': message_id,
+            'filename': info['filename'],
+            'content_type': info['content_type'],
+            'size': size,
+            'sha256': sha256,
+            'fetched_at': datetime.datetime.now().isoformat()
+        })
+
+def fetch_stored_attachments(email_id=None, message_ids=None, workers=None):
+    """
+    Download the attachments of stored messages
+
+    Args:
+        email_id (str): Mailbox ID (default: the one in the run state)
+        message_ids (list): Messages to cover (default: every stored message)
+        workers (int): Downloads at once
+
+    Returns:
+        dict: The fetch report (see AttachmentFetcher.fetch)
+    """
+    email_id = email_id or get_email()[0]
+    messages = []
+    for message_id in (stored_ids() if message_ids is None else message_ids):
+        message = load_message(message_id)
+        if message is not None and message.attachments:
+            messages.append(message)
+    report = AttachmentFetcher(email_id, workers=workers).fetch(messages)
+    log.info(f"✅ Attachments: {report['downloaded']} downloaded ({report['bytes_downloaded']:,} bytes), "
+             f"{report['deduplicated']} deduplicated, {report['cached']} already stored, "
+             f"{len(report['failed'])} failed")
+    return report
+
+def main(argv=None):
+    """Command line: fetch, list"""
+    parser = argparse.ArgumentParser(description='Attachments of stored messages')
+    sub = parser.add_subparsers(dest='command', required=True)
+    fetch = sub.add_parser('fetch', help='Download attachments not stored yet')
+    fetch.add_argument('--workers', type=int, help=f"Downloads at once (default: ${ATTACHMENT_WORKERS_ENV} or {DEFAULT_WORKERS})")
+    fetch.add_argument('--json', action='store_true', help='Print the report as JSON')
+    sub.add_parser('list', help='Stored attachments')
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        store = AttachmentStore()
+        for key, entry in sorted(store.manifest.items()):
+            print(f"📎 {key}  {entry['filename']}  {entry['size']:,} bytes  {store.object_path(entry['sha256'])}")
+        return 0
+
+    report = fetch_stored_attachments(workers=args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    return 1 if report['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""
+Offline benchmark suite for the email/signup pipeline.
+
+- boomlify_server: local stand-in for the Boomlify temp-mail API
+- fixtures/: static copies of the sign-up and confirmation-token forms
+- run_benchmarks: scenarios reporting p50/p95 latency and throughput
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks
+"""
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for the Boomlify temp-mail API
+
+Implements the endpoints the pipeline uses:
+    POST /api/v1/emails/create?time=10min
+    GET  /api/v1/emails/{email_id}/messages?limit=25&offset=0
+    GET  /api/v1/emails/{email_id}/messages/{message_id}/attachments/{attachment_id}
+
+Mailboxes are generated on demand with a configurable number of messages
+and body size, so client code can be measured without network access.
+With attachments per message, every newsletter carries the same logo
+(identical content) plus unique seeded files of the configured size.
+Latency, 429s, 5xx bursts, truncated JSON and slow-drip bodies can be
+injected per endpoint with a seeded fault plan (see benchmarks/faults.py).
+With a quota (e.g. --quota 60/10) every response carries RapidAPI-style
+X-RateLimit-Requests-* headers and requests over the quota get a 429
+with Retry-After.
+'''
+
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import random
+import string
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.faults import load_fault_plan, PRESETS
+
+API_PREFIX = '/api/v1'
+ACTIVATION_LINK_BASE = 'https://client.embyiltv.io/confirmation-token/'
+
+class MailboxConfig:
+    def __init__(self, message_count=10, body_size=2000, seed=0, lifetime_minutes=10,
+                 attachment_count=0, attachment_size=256 * 1024):
+        """
+        Shape of the mailboxes served by the stand-in
+
+        Args:
+            message_count (int): Messages in every mailbox
+            body_size (int): Approximate characters in each text and HTML body
+            seed (int): Seed for the generated content (same seed, same mail)
+            lifetime_minutes (int): Reported lifetime of created mailboxes
+            attachment_count (int): Attachments on every newsletter (0 = none)
+            attachment_size (int): Bytes in each unique attachment
+        """
+        self.message_count = message_count
+        self.body_size = body_size
+        self.seed = seed
+        self.lifetime_minutes = lifetime_minutes
+        self.attachment_count = attachment_count
+        self.attachment_size = attachment_size
+
+def _filler(rng, size):
+    """Generate newsletter-like filler text of roughly `size` characters"""
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+LOGO_SIZE = 4096
+
+def attachment_content(attachment_id, size):
+    """
+    Deterministic bytes of a generated attachment
+
+    Args:
+        attachment_id (str): Attachment ID (the content is derived from it)
+        size (int): Bytes to produce
+
+    Returns:
+        bytes: The content
+    """
+    return random.Random(attachment_id).randbytes(size)
+
+def _attachments(rng, config):
+    """Attachment metadata of one newsletter: the shared logo, then unique files"""
+    if not config.attachment_count:
+        return []
+    attachments = [{'id': 'logo', 'filename': 'logo.png', 'size': LOGO_SIZE, 'content_type': 'image/png'}]
+    for n in range(1, config.attachment_count):
+        attachment_id = f"att-{rng.getrandbits(64):016x}"
+        attachments.append({'id': attachment_id, 'filename': f"report-{n}.pdf",
+                            'size': config.attachment_size, 'content_type': 'application/pdf'})
+    for attachment in attachments:
+        content = attachment_content(attachment['id'], attachment['size'])
+        attachment['sha256'] = hashlib.sha256(content).hexdigest()
+    return attachments
+
+def generate_messages(email_id, address, config):
+    """
+    Generate the messages of one mailbox
+
+    The first message is always the EmbyIL confirmation mail, so link
+    extraction has something to find; the rest are filler newsletters.
+
+    Args:
+        email_id (str): Mailbox ID
+        address (str): Mailbox address
+        config (MailboxConfig): Mailbox shape
+
+    Returns:
+        list: Message dictionaries in the API's response format
+    """
+    rng = random.Random(f"{config.seed}:{email_id}")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    messages = []
+
+    for i in range(config.message_count):
+        message_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        text = _filler(rng, config.body_size)
+        html = f"<html><body><p>{_filler(rng, max(config.body_size - 30, 0))}</p></body></html>"
+
+        if i == 0:
+            token = str(uuid.UUID(int=rng.getrandbits(128)))
+            link = ACTIVATION_LINK_BASE + token
+            subject = 'Confirm your EmbyIL account'
+            text = f"Welcome! Confirm your account: {link}\n\n{text}"
+            html = f'<html><body><a href="{link}">Confirm account</a>{html}</body></html>'
+        else:
+            subject = f"Newsletter #{i}"
+        attachments = _attachments(rng, config) if i else []
+
+        messages.append({
+            'id': message_id,
+            'from': f"sender{i % 7}@example.com",
+            'to': address,
+            'subject': subject,
+            'date': (now - datetime.timedelta(seconds=30 * i)).isoformat(),
+            'text': text,
+            'html': html,
+            'attachments': attachments,
+            'read': False,
+            'flagged': False
+        })
+
+    return messages
+
+class BoomlifyState:
+    def __init__(self, config):
+        """
+        Mailboxes known to the stand-in
+
+        Args:
+            config (MailboxConfig): Shape of generated mailboxes
+        """
+        self.config = config
+        self.lock = threading.Lock()
+        self.mailboxes = {}
+        self.page_cache = {}
+        self.request_count = 0
+        self.quota = None
+        self.window_start = time.monotonic()
+        self.window_count = 0
+
+    def take_quota(self):
+        """
+        Count one request against the quota
+
+        Returns:
+            tuple: (allowed, headers) - headers is empty when no quota is set
+        """
+        if not self.quota:
+            return True, {}
+        limit, window = self.quota
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= window:
+                self.window_start = now
+                self.window_count = 0
+            reset = max(window - (now - self.window_start), 0)
+            allowed = self.window_count < limit
+            if allowed:
+                self.window_count += 1
+            remaining = limit - self.window_count
+        headers = {
+            'X-RateLimit-Requests-Limit': str(limit),
+            'X-RateLimit-Requests-Remaining': str(remaining),
+            'X-RateLimit-Requests-Reset': str(int(math.ceil(reset)))
+        }
+        if not allowed:
+            headers['Retry-After'] = str(int(math.ceil(reset)) or 1)
+        return allowed, headers
+
+    def create_mailbox(self):
+        """Create a new mailbox and return its API record"""
+        email_id = str(uuid.uuid4())
+        address = f"{email_id[:8]}@boomlify.local"
+        expires_at = (datetime.datetime.now(datetime.timezone.utc)
+                      + datetime.timedelta(minutes=self.config.lifetime_minutes))
+        record = {'id': email_id, 'address': address, 'expires_at': expires_at.isoformat()}
+        with self.lock:
+            self.mailboxes[email_id] = generate_messages(email_id, address, self.config)
+        return record
+
+    def attachment(self, email_id, message_id, attachment_id):
+        """
+        Content of one attachment
+
+        Returns:
+            bytes: The content, or None when the message has no such attachment
+        """
+        with self.lock:
+            messages = self.mailboxes.get(email_id) or []
+        for message in messages:
+            if message['id'] != message_id:
+                continue
+            for attachment in message['attachments']:
+                if attachment['id'] == attachment_id:
+                    return attachment_content(attachment_id, attachment['size'])
+        return None
+
+    def messages_page(self, email_id, limit, offset):
+        """
+        Return the encoded JSON body of one messages page
+
+        Unknown mailbox IDs get a generated mailbox, so clients can poll any
+        ID without creating it first. Pages are encoded once and cached.
+        """
+        key = (email_id, limit, offset)
+        with self.lock:
+            body = self.page_cache.get(key)
+            if body is not None:
+                return body
+            messages = self.mailboxes.get(email_id)
+            if messages is None:
+                messages = generate_messages(email_id, f"{email_id[:8]}@boomlify.local", self.config)
+                self.mailboxes[email_id] = messages
+
+        page = messages[offset:offset + limit]
+        body = json.dumps({
+            'success': True,
+            'messages': page,
+            'total': len(messages),
+            'limit': limit,
+            'offset': offset
+        }).encode('utf-8')
+
+        with self.lock:
+            self.page_cache[key] = body
+        return body
+
+class BoomlifyHandler(BaseHTTPRequestHandler):
+    server_version = 'BoomlifyStandIn/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """Silence the default per-request stderr logging"""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, extra_headers=None, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, endpoint, status, body, content_type='application/json'):
+        """Send a response, applying the fault plan's decision for the endpoint"""
+        allowed, quota_headers = self.server.state.take_quota()
+        if not allowed:
+            self._send_json(429, {'success': False, 'error': 'Quota exceeded'}, quota_headers)
+            return
+
+        decision = self.server.faults.decide(endpoint)
+        if decision.delay:
+            time.sleep(decision.delay)
+
+        if decision.action == 'rate_limit':
+            self._send_json(429, {'success': False, 'error': 'Too many requests'},
+                            {'Retry-After': str(decision.retry_after)})
+            return
+        if decision.action == 'error':
+            self._send_json(decision.status, {'success': False, 'error': 'Injected server error'}, quota_headers)
+            return
+
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        if decision.action == 'truncate':
+            # Content-Length matches what is sent, so the client sees
+            # a complete response holding invalid JSON
+            self._send_json(status, body[:int(len(body) * decision.keep)], quota_headers, content_type)
+        elif decision.action == 'drip':
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in quota_headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            step = max(decision.chunk_bytes, 1)
+            for start in range(0, len(body), step):
+                self.wfile.write(body[start:start + step])
+                self.wfile.flush()
+                time.sleep(decision.chunk_delay)
+        else:
+            self._send_json(status, body, quota_headers, content_type)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+    def do_POST(self):
+        self._read_body()
+        state = self.server.state
+        with state.lock:
+            state.request_count += 1
+
+        path = urlparse(self.path).path
+        if path == f"{API_PREFIX}/emails/create":
+            record = state.create_mailbox()
+            self._respond('create', 201, {'success': True, 'email': record})
+        else:
+            self._send_json(404, {'success': False, 'error': 'Not found'})
+
+    def do_GET(self):
+        state = self.server.state
+        with state.lock:
+            state.request_count += 1
+
+        parsed = urlparse(self.path)
+        parts = parsed.path[len(API_PREFIX):].strip('/').split('/')
+        if parsed.path.startswith(API_PREFIX) and len(parts) == 3 and parts[0] == 'emails' and parts[2] == 'messages':
+            query = parse_qs(parsed.query)
+            limit = int(query.get('limit', ['25'])[0])
+            offset = int(query.get('offset', ['0'])[0])
+            self._respond('messages', 200, state.messages_page(parts[1], limit, offset))
+        elif (parsed.path.startswith(API_PREFIX) and len(parts) == 6 and parts[0] == 'emails'
+              and parts[2] == 'messages' and parts[4] == 'attachments'):
+            content = state.attachment(parts[1], parts[3], parts[5])
+            if content is None:
+                self._send_json(404, {'success': False, 'error': 'Attachment not found'})
+            else:
+                self._respond('attachment', 200, content, 'application/octet-stream')
+        else:
+            self._send_json(404, {'success': False, 'error': 'Not found'})
+
+class BoomlifyServer:
+    def __init__(self, config=None, host='127.0.0.1', port=0, verbose=False, faults=None, quota=None):
+        """
+        Threaded local Boomlify API server
+
+        Args:
+            config (MailboxConfig): Shape of generated mailboxes
+            faults (FaultPlan): Fault plan (default: no faults)
+            quota (tuple): (requests, window seconds) allowed per window (default: no quota)
+            host (str): Interface to bind
+            port (int): Port to bind (0 picks a free port)
+            verbose (bool): Log every request to stderr
+        """
+        self.config = config or MailboxConfig()
+        self.httpd = ThreadingHTTPServer((host, port), BoomlifyHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = BoomlifyState(self.config)
+        self.httpd.verbose = verbose
+        self.httpd.faults = faults or load_fault_plan(None)
+        self.httpd.state.quota = quota
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def faults(self):
+        return self.httpd.faults
+
+    @property
+    def base_url(self):
+        """Value for BOOMLIFY_API_BASE that points clients at this server"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+def parse_quota(value):
+    """Parse a 'requests/seconds' quota, e.g. '60/10'"""
+    try:
+        limit, _, window = value.partition('/')
+        return int(limit), float(window or 60)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid quota: {value} (expected requests/seconds)")
+
+def main():
+    """Run the stand-in in the foreground"""
+    parser = argparse.ArgumentParser(description='Local Boomlify API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--messages', type=int, default=10, help='Messages per mailbox')
+    parser.add_argument('--body-size', type=int, default=2000, help='Characters per message body')
+    parser.add_argument('--attachments', type=int, default=0, help='Attachments per newsletter')
+    parser.add_argument('--attachment-size', type=int, default=256 * 1024, help='Bytes per unique attachment')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--faults', help=f"Fault plan: JSON file or preset ({', '.join(sorted(PRESETS))})")
+    parser.add_argument('--quota', type=parse_quota, help='Requests per window, e.g. 60/10 (60 every 10s)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    config = MailboxConfig(message_count=args.messages, body_size=args.body_size, seed=args.seed,
+                           attachment_count=args.attachments, attachment_size=args.attachment_size)
+    faults = load_fault_plan(args.faults, args.seed)
+    server = BoomlifyServer(config, host=args.host, port=args.port, verbose=args.verbose, faults=faults,
+                            quota=args.quota)
+
+    print(f"🚀 Boomlify stand-in listening on {server.base_url}")
+    print(f"💡 export BOOMLIFY_API_BASE={server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping stand-in")
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+'''
+Scripted fault and latency injection for the local Boomlify stand-in
+
+A fault plan is configured per endpoint ("create", "messages",
+"attachment") and is fully determined by its seed: the same plan and the
+same request order produce the same latencies and failures on every run.
+
+Plan format (JSON file or dict):
+    {
+      "seed": 42,
+      "endpoints": {
+        "messages": {
+          "latency": {"dist": "lognormal", "median_ms": 150, "sigma": 0.6},
+          "rate_limit": {"probability": 0.05, "retry_after": 2},
+          "error_burst": {"probability": 0.02, "length": 3, "status": 503},
+          "truncate": {"probability": 0.02, "keep": 0.5},
+          "slow_drip": {"probability": 0.02, "chunk_bytes": 256, "delay_ms": 50},
+          "script": ["ok", "429", "503", "truncate", "drip"]
+        }
+      }
+    }
+
+"script" is played first, one entry per request, before the probabilistic
+rules take over. Latency distributions: fixed (ms), uniform (min_ms,
+max_ms), exponential (mean_ms) and lognormal (median_ms, sigma).
+'''
+
+import json
+import math
+import os
+import random
+import threading
+
+ENDPOINTS = ('create', 'messages', 'attachment')
+
+# Named plans for the common failure modes seen in builds
+PRESETS = {
+    'none': {'endpoints': {}},
+    'slow': {
+        'endpoints': {
+            'create': {'latency': {'dist': 'lognormal', 'median_ms': 300, 'sigma': 0.5}},
+            'messages': {'latency': {'dist': 'lognormal', 'median_ms': 200, 'sigma': 0.8}}
+        }
+    },
+    'throttled': {
+        'endpoints': {
+            'create': {'rate_limit': {'probability': 0.2, 'retry_after': 1}},
+            'messages': {'rate_limit': {'probability': 0.3, 'retry_after': 1}}
+        }
+    },
+    'flaky': {
+        'endpoints': {
+            'create': {'error_burst': {'probability': 0.1, 'length': 2, 'status': 502}},
+            'messages': {
+                'latency': {'dist': 'exponential', 'mean_ms': 30},
+                'error_burst': {'probability': 0.1, 'length': 3, 'status': 503},
+                'truncate': {'probability': 0.05, 'keep': 0.5}
+            }
+        }
+    },
+    'drip': {
+        'endpoints': {
+            'messages': {'slow_drip': {'probability': 0.5, 'chunk_bytes': 512, 'delay_ms': 20}}
+        }
+    }
+}
+
+class FaultDecision:
+    def __init__(self, delay=0.0, action='ok', status=200, retry_after=None, keep=1.0,
+                 chunk_bytes=0, chunk_delay=0.0):
+        """
+        What the server should do with one request
+
+        Args:
+            delay (float): Seconds to wait before responding
+            action (str): 'ok', 'rate_limit', 'error', 'truncate' or 'drip'
+            status (int): HTTP status for 'error'
+            retry_after (int): Retry-After seconds for 'rate_limit'
+            keep (float): Fraction of the body sent for 'truncate'
+            chunk_bytes (int): Chunk size for 'drip'
+            chunk_delay (float): Seconds between chunks for 'drip'
+        """
+        self.delay = delay
+        self.action = action
+        self.status = status
+        self.retry_after = retry_after
+        self.keep = keep
+        self.chunk_bytes = chunk_bytes
+        self.chunk_delay = chunk_delay
+
+class EndpointFaults:
+    def __init__(self, rules, seed):
+        """
+        Fault rules of one endpoint with their own seeded random stream
+
+        Args:
+            rules (dict): The endpoint's section of the plan
+            seed (str): Seed for this endpoint's random stream
+        """
+        self.rules = rules or {}
+        self.rng = random.Random(seed)
+        self.script = list(self.rules.get('script', []))
+        self.burst_left = 0
+        self.burst_status = 503
+
+    def _latency(self):
+        spec = self.rules.get('latency')
+        if not spec:
+            return 0.0
+        dist = spec.get('dist', 'fixed')
+        if dist == 'fixed':
+            ms = spec.get('ms', 0)
+        elif dist == 'uniform':
+            ms = self.rng.uniform(spec.get('min_ms', 0), spec.get('max_ms', 0))
+        elif dist == 'exponential':
+            ms = self.rng.expovariate(1.0 / spec['mean_ms']) if spec.get('mean_ms') else 0
+        elif dist == 'lognormal':
+            ms = self.rng.lognormvariate(math.log(spec.get('median_ms', 1)), spec.get('sigma', 0.5))
+        else:
+            raise ValueError(f"Unknown latency distribution: {dist}")
+        return ms / 1000.0
+
+    def _scripted(self, entry, delay):
+        entry = str(entry)
+        if entry == 'ok':
+            return FaultDecision(delay)
+        if entry == '429':
+            retry_after = self.rules.get('rate_limit', {}).get('retry_after', 1)
+            return FaultDecision(delay, 'rate_limit', 429, retry_after=retry_after)
+        if entry.isdigit():
+            return FaultDecision(delay, 'error', int(entry))
+        if entry == 'truncate':
+            return FaultDecision(delay, 'truncate', keep=self.rules.get('truncate', {}).get('keep', 0.5))
+        if entry == 'drip':
+            drip = self.rules.get('slow_drip', {})
+            return FaultDecision(delay, 'drip', chunk_bytes=drip.get('chunk_bytes', 256),
+                                 chunk_delay=drip.get('delay_ms', 50) / 1000.0)
+        raise ValueError(f"Unknown script entry: {entry}")
+
+    def decide(self):
+        """Draw the decision for the next request"""
+        delay = self._latency()
+
+        if self.script:
+            return self._scripted(self.script.pop(0), delay)
+
+        if self.burst_left > 0:
+            self.burst_left -= 1
+            return FaultDecision(delay, 'error', self.burst_status)
+
+        # Every rule draws on every request so the stream stays aligned
+        # no matter which rule fires
+        rolls = {name: self.rng.random() for name in ('rate_limit', 'error_burst', 'truncate', 'slow_drip')}
+
+        rate_limit = self.rules.get('rate_limit')
+        if rate_limit and rolls['rate_limit'] < rate_limit.get('probability', 0):
+            return FaultDecision(delay, 'rate_limit', 429, retry_after=rate_limit.get('retry_after', 1))
+
+        burst = self.rules.get('error_burst')
+        if burst and rolls['error_burst'] < burst.get('probability', 0):
+            self.burst_status = burst.get('status', 503)
+            self.burst_left = max(burst.get('length', 1) - 1, 0)
+            return FaultDecision(delay, 'error', self.burst_status)
+
+        truncate = self.rules.get('truncate')
+        if truncate and rolls['truncate'] < truncate.get('probability', 0):
+            return FaultDecision(delay, 'truncate', keep=truncate.get('keep', 0.5))
+
+        drip = self.rules.get('slow_drip')
+        if drip and rolls['slow_drip'] < drip.get('probability', 0):
+            return FaultDecision(delay, 'drip', chunk_bytes=drip.get('chunk_bytes', 256),
+                                 chunk_delay=drip.get('delay_ms', 50) / 1000.0)
+
+        return FaultDecision(delay)
+
+class FaultPlan:
+    def __init__(self, plan=None, seed=None):
+        """
+        Per-endpoint fault plan
+
+        Args:
+            plan (dict): Plan in the format described in the module docstring
+            seed (int): Overrides the plan's seed
+        """
+        plan = plan or {}
+        self.seed = seed if seed is not None else plan.get('seed', 0)
+        self.plan = plan
+        self.lock = threading.Lock()
+        self.endpoints = {
+            name: EndpointFaults(plan.get('endpoints', {}).get(name), f"{self.seed}:{name}")
+            for name in ENDPOINTS
+        }
+        self.counts = {}
+
+    def decide(self, endpoint):
+        """
+        Draw the decision for the next request to an endpoint
+
+        Args:
+            endpoint (str): 'create', 'messages' or 'attachment'
+
+        Returns:
+            FaultDecision: What to do with the request
+        """
+        with self.lock:
+            decision = self.endpoints[endpoint].decide()
+            key = f"{endpoint}:{decision.action}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+        return decision
+
+def load_fault_plan(spec, seed=None):
+    """
+    Load a fault plan from a preset name, a JSON file path or a dict
+
+    Args:
+        spec: Preset name (see PRESETS), path to a JSON file, dict or None
+        seed (int): Overrides the plan's seed
+
+    Returns:
+        FaultPlan: The loaded plan
+    """
+    if spec is None:
+        return FaultPlan(seed=seed)
+    if isinstance(spec, dict):
+        return FaultPlan(spec, seed)
+    if spec in PRESETS:
+        return FaultPlan(PRESETS[spec], seed)
+    if os.path.exists(spec):
+        with open(spec, 'r') as f:
+            return FaultPlan(json.load(f), seed)
+    raise ValueError(f"Unknown fault plan: {spec} (presets: {', '.join(sorted(PRESETS))})")
@@ -0,0 +1,145 @@
+'''
+Synthetic mailboxes for activation-link extraction
+
+Each mailbox is a list of messages in the API's JSON format plus the link
+the extraction must find in it (None when there is none). The shapes
+cover what the scan meets in practice:
+
+    plain              text and HTML bodies, link near the top
+    html_only          no text body, link in an <a href> deep in a long HTML body
+    quoted_printable   bodies wrapped quoted-printable style ("=\\n" soft
+                       breaks, =3D), link split across a soft break
+    raw_only           link only in a field outside the bodies (found in the raw JSON)
+    newsletters        large newsletters first, the confirmation mail last
+    no_link            large newsletters and near misses (other EmbyIL
+                       URLs, confirmation-token/ on another host), no link
+
+The newsletters carry no marker, so they measure the pre-check; the
+near misses make the patterns run over the whole body, which is the
+worst case. Generation is seeded, so a corpus is identical across runs.
+'''
+
+import json
+import random
+import string
+import uuid
+
+LINK_BASE = 'https://client.embyiltv.io/confirmation-token/'
+
+def _words(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+def _html(rng, size, inner=''):
+    """Newsletter-like HTML of roughly `size` characters with `inner` in the middle"""
+    blocks = []
+    length = 0
+    while length < size:
+        block = (f'<tr><td class="col-{rng.randint(1, 12)}" style="padding:8px;font-family:Arial">'
+                 f'<a href="https://news.example.com/item/{rng.getrandbits(32):x}?utm_source=mail">'
+                 f'{_words(rng, 60)}</a><p>{_words(rng, 240)}</p></td></tr>')
+        blocks.append(block)
+        length += len(block)
+    middle = len(blocks) // 2
+    blocks.insert(middle, inner)
+    return f'<html><body><table>{"".join(blocks)}</table></body></html>'
+
+def _quoted_printable(text, width=76):
+    """Wrap text with quoted-printable soft line breaks and escape '='"""
+    text = text.replace('=', '=3D')
+    lines = []
+    for start in range(0, len(text), width - 1):
+        lines.append(text[start:start + width - 1])
+    return '=\n'.join(lines)
+
+def _message(rng, index, address, subject, text, html, **extra):
+    message = {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'from': f"sender{index % 7}@example.com",
+        'to': address,
+        'subject': subject,
+        'date': f"2026-01-01T00:{index // 60 % 60:02d}:{index % 60:02d}+00:00",
+        'text': text,
+        'html': html,
+        'attachments': [],
+        'read': False,
+        'flagged': False
+    }
+    message.update(extra)
+    return message
+
+def _newsletter(rng, index, address, size):
+    return _message(rng, index, address, f"Newsletter #{index}", _words(rng, size), _html(rng, size))
+
+def build_corpus(seed=0, newsletters=5, newsletter_size=200000, body_size=2000):
+    """
+    Generate the mailboxes
+
+    Args:
+        seed (int): Seed for all generated content
+        newsletters (int): Large newsletters in the newsletters / no_link mailboxes
+        newsletter_size (int): Approximate characters per newsletter body
+        body_size (int): Approximate characters per ordinary body
+
+    Returns:
+        list: (name, list of message JSON texts, expected link or None), in scan order
+    """
+    rng = random.Random(f"link-corpus:{seed}")
+    address = 'bench@boomlify.local'
+    mailboxes = []
+
+    def link():
+        return LINK_BASE + str(uuid.UUID(int=rng.getrandbits(128)))
+
+    expected = link()
+    mailboxes.append(('plain', [
+        _message(rng, 0, address, 'Confirm your EmbyIL account',
+                 f"Welcome! Confirm your account: {expected}\n\n{_words(rng, body_size)}",
+                 f'<html><body><a href="{expected}">Confirm account</a><p>{_words(rng, body_size)}</p></body></html>')
+    ], expected))
+
+    expected = link()
+    anchor = f'<a class="btn" href="{expected}" target="_blank" rel="noopener">אישור חשבון</a>'
+    mailboxes.append(('html_only', [
+        _message(rng, 0, address, 'Confirm your EmbyIL account', None, _html(rng, body_size * 20, anchor))
+    ], expected))
+
+    expected = link()
+    # Offset the link so the soft break falls inside the token
+    text = f"{_words(rng, 61)}\nConfirm: {expected}\n{_words(rng, body_size)}"
+    html = f'<html><body><p>{_words(rng, 40)}</p><a href="{expected}">Confirm</a></body></html>'
+    mailboxes.append(('quoted_printable', [
+        _message(rng, 0, address, 'Confirm your EmbyIL account', _quoted_printable(text), _quoted_printable(html))
+    ], expected))
+
+    expected = link()
+    mailboxes.append(('raw_only', [
+        _message(rng, 0, address, 'Confirm your EmbyIL account', 'Use the button below.',
+                 '<html><body><p>Use the button below.</p></body></html>',
+                 headers={'X-Confirm-Url': expected})
+    ], expected))
+
+    expected = link()
+    messages = [_newsletter(rng, i, address, newsletter_size) for i in range(1, newsletters + 1)]
+    messages.append(_message(rng, 0, address, 'Confirm your EmbyIL account',
+                             f"Confirm your account: {expected}", f'<a href="{expected}">Confirm</a>'))
+    mailboxes.append(('newsletters', messages, expected))
+
+    near_misses = ('https://client.embyiltv.io/sign-up <br> https://client.embyiltv.io/login '
+                   'https://other.example.com/confirmation-token/not-ours '
+                   'client.embyiltv.io/confirmation-token')
+    messages = []
+    for i in range(1, newsletters + 1):
+        message = _newsletter(rng, i, address, newsletter_size)
+        message['text'] = f"{message['text']}\n{near_misses}"
+        message['html'] = message['html'].replace('</table>', f'</table><p>{near_misses}</p>')
+        messages.append(message)
+    mailboxes.append(('no_link', messages, None))
+
+    return [(name, [json.dumps(message, ensure_ascii=False) for message in messages], link_)
+            for name, messages, link_ in mailboxes]
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+'''
+Offline benchmark scenarios for the email/signup pipeline
+
+Every scenario runs the real pipeline functions against the local Boomlify
+stand-in (benchmarks/boomlify_server.py) and the static form fixtures, so
+results are reproducible on a machine with no network. With --faults the
+stand-in injects latency, 429s, 5xx bursts, truncated JSON or slow-drip
+bodies (see benchmarks/faults.py) so tail latency and failure handling of
+the API clients can be measured.
+
+Scenarios:
+    poll     - check_messages.get_email_messages on an already-ingested mailbox
+    ingest   - check_messages.get_email_messages on a fresh mailbox (all new)
+    detail   - get_message_details fetch, filter, display and save
+    push     - webhook notification to ingested message (webhook_receiver + sender stand-in)
+    link     - activate_account.find_activation_link over saved message files
+    extract  - activation link extraction over the synthetic mailboxes of
+               benchmarks/link_corpus.py; reports the slowest mailbox and fails
+               on a wrong link (--max-extract-ms bounds the slowest mailbox)
+    attach   - attachment_fetcher download of a mailbox's attachments (shared logo + unique files)
+    page     - page_objects parse and field resolution of fixtures/signup.html (no browser)
+    session  - boomlify_async mailbox session: every page and attachment with calls
+               overlapped; reports the sum of call times against the wall time
+    form     - website_signup form fill against fixtures/signup.html (needs a browser);
+               reports WebDriver round trips per fill (see webdriver_trace.py)
+
+Usage:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scenario poll --messages 200 --body-size 20000
+    python -m benchmarks.run_benchmarks --json bench_results.json
+    python -m benchmarks.run_benchmarks --scenario poll --faults flaky --seed 7
+    python -m benchmarks.run_benchmarks --scenario poll --quota 50/5
+    python -m benchmarks.run_benchmarks --record bench.cassette.jsonl
+    python -m benchmarks.run_benchmarks --replay recorded.cassette.jsonl --replay-timing 0
+    python -m benchmarks.run_benchmarks --scenario form --max-round-trips 40
+    python -m benchmarks.run_benchmarks --scenario extract --newsletter-size 1000000 --max-extract-ms 50
+    python -m benchmarks.run_benchmarks --scenario session --faults slow --messages 100 --concurrency 8
+
+With --replay the API clients are answered from a cassette recorded with
+BOOMLIFY_RECORD or --record (see http_cassette.py) instead of the
+stand-in, so scenarios run against real recorded payloads and, with
+--replay-timing, their recorded latency. Item counts still assume
+--messages per mailbox.
+'''
+
+import argparse
+import contextlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+import boomlify_api
+import http_cassette
+import webdriver_trace
+from benchmarks.boomlify_server import BoomlifyServer, MailboxConfig, parse_quota
+from benchmarks.faults import load_fault_plan, PRESETS
+
+FIXTURES_DIR = pathlib.Path(__file__).resolve().parent / 'fixtures'
+
+class ScenarioSkipped(Exception):
+    """Raised when a scenario cannot run in this environment"""
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile
+
+    Args:
+        values (list): Samples
+        pct (float): Percentile in the range 0-100
+
+    Returns:
+        float: The percentile value (0.0 for no samples)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+@contextlib.contextmanager
+def quiet():
+    """Send the pipeline's console output to /dev/null while measuring"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+@contextlib.contextmanager
+def workdir():
+    """Run inside a scratch directory so pipeline files don't touch the repo"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='bench_') as path:
+        os.chdir(path)
+        try:
+            yield path
+        finally:
+            os.chdir(previous)
+
+def measure(operation, iterations, warmup=1):
+    """
+    Time an operation
+
+    Args:
+        operation (callable): Runs one iteration, returns the number of items
+            handled, or None when the pipeline call failed
+        iterations (int): Measured iterations
+        warmup (int): Unmeasured iterations run first
+
+    Returns:
+        tuple: (list of per-iteration seconds, total items handled, failed iterations)
+    """
+    with quiet():
+        for _ in range(warmup):
+            try:
+                operation()
+            except Exception:
+                pass
+
+        timings = []
+        items = 0
+        errors = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            try:
+                handled = operation()
+            except Exception:
+                handled = None
+            timings.append(time.perf_counter() - start)
+            if handled is None:
+                errors += 1
+            else:
+                items += handled
+
+    return timings, items, errors
+
+def setup_call(operation, attempts=20):
+    """
+    Run an unmeasured setup call, retrying while the fault plan rejects it
+
+    Args:
+        operation (callable): Returns a truthy value on success
+        attempts (int): Maximum attempts
+
+    Returns:
+        The operation's first truthy result
+    """
+    with quiet():
+        for _ in range(attempts):
+            result = operation()
+            if result:
+                return result
+    raise RuntimeError('Setup call kept failing against the local stand-in')
+
+def create_mailbox():
+    """Create a mailbox on the stand-in through the real client"""
+    import create_email
+
+    def attempt():
+        email_id, email_address = create_email.create_temp_email()
+        return (email_id, email_address) if email_id else None
+
+    return setup_call(attempt)
+
+def scenario_poll(server, args):
+    """Steady-state polling: every message is already processed"""
+    import check_messages
+
+    email_id, _ = create_mailbox()
+    setup_call(lambda: check_messages.get_email_messages(email_id, limit=args.page_size) is not None)
+
+    def poll():
+        if check_messages.get_email_messages(email_id, limit=args.page_size) is None:
+            return None
+        return min(args.page_size, server.config.message_count)
+
+    return measure(poll, args.iterations)
+
+def scenario_ingest(server, args):
+    """First poll of a mailbox: every message is new and gets ingested"""
+    import check_messages
+
+    email_id, _ = create_mailbox()
+
+    def ingest():
+        if os.path.exists('message_ids.txt'):
+            os.remove('message_ids.txt')
+        new_messages = check_messages.get_email_messages(email_id, limit=args.page_size)
+        return None if new_messages is None else len(new_messages)
+
+    return measure(ingest, args.iterations)
+
+def scenario_detail(server, args):
+    """Step 4: fetch, filter, display and save every stored message"""
+    import check_messages
+    import get_message_details
+
+    email_id, _ = create_mailbox()
+    setup_call(lambda: check_messages.get_email_messages(email_id, limit=args.page_size) is not None)
+    with quiet():
+        target_ids = get_message_details.read_message_ids()
+
+    def detail():
+        all_messages = get_message_details.get_all_messages(email_id, limit=args.page_size, only_ids=target_ids)
+        if all_messages is None:
+            return None
+        filtered = get_message_details.filter_messages_by_ids(all_messages, target_ids)
+        for i, message in enumerate(filtered, 1):
+            get_message_details.display_message_details(message, i)
+            get_message_details.save_message_details(message.id, message)
+        return len(filtered)
+
+    return measure(detail, args.iterations)
+
+def scenario_push(server, args):
+    """Push intake: one notification delivered, stored, handed to the waiter and ingested"""
+    import check_messages
+    import webhook_receiver
+    from benchmarks.webhook_sender import generate_notifications, send
+
+    email_id = 'bench-push'
+    payloads = iter(generate_notifications(email_id, count=args.iterations + 1, body_size=args.body_size))
+
+    with webhook_receiver.WebhookReceiver(email_id=email_id, host='127.0.0.1') as receiver:
+        def push():
+            status, _ = send(receiver.url, next(payloads))
+            messages, _ = receiver.wait(5)
+            if status != 200 or not messages:
+                return None
+            return len(check_messages.ingest_pushed_messages(messages))
+
+        return measure(push, args.iterations)
+
+def scenario_link(server, args):
+    """Activation link search over the stored messages"""
+    try:
+        import activate_account
+    except ImportError as e:
+        raise ScenarioSkipped(f"activate_account not importable: {e}")
+    import get_message_details
+
+    email_id, _ = create_mailbox()
+    messages = setup_call(lambda: get_message_details.get_all_messages(email_id, limit=args.page_size))
+    with quiet():
+        for message in messages:
+            get_message_details.save_message_details(message.id, message)
+
+    # Only the scan itself is measured - no browser is started
+    bot = activate_account.EmbyILAccountActivation.__new__(activate_account.EmbyILAccountActivation)
+    file_count = min(args.page_size, server.config.message_count)
+
+    def find_link():
+        if not bot.find_activation_link():
+            raise RuntimeError('Activation link not found in generated mailbox')
+        return file_count
+
+    return measure(find_link, args.iterations)
+
+def scenario_extract(server, args):
+    """Activation link extraction engine over the synthetic corpus (messages/s, slowest mailbox)"""
+    import activation_events
+    import activation_links
+    from benchmarks.link_corpus import build_corpus
+    from mail_message import Message
+
+    corpus = build_corpus(args.seed, newsletter_size=args.newsletter_size, body_size=args.body_size)
+    message_count = sum(len(messages) for _, messages, _ in corpus)
+    activation_links.matcher()
+    slowest = {}
+    wrong = {}
+
+    def extract():
+        for name, messages, expected in corpus:
+            start = time.perf_counter()
+            link = None
+            # As find_activation_link does: messages in order, built from their JSON
+            for raw in messages:
+                link = activation_events.find_activation_link_in(Message.from_json(raw))
+                if link:
+                    break
+            seconds = time.perf_counter() - start
+            slowest[name] = max(slowest.get(name, 0.0), seconds)
+            if link != expected:
+                wrong[name] = link
+        return None if wrong else message_count
+
+    timings, items, errors = measure(extract, args.iterations)
+    worst = max(slowest, key=slowest.get)
+    return timings, items, errors, {
+        'mailbox_max_ms': {name: round(seconds * 1000, 3) for name, seconds in slowest.items()},
+        'worst_mailbox': worst,
+        'worst_mailbox_ms': round(slowest[worst] * 1000, 3),
+        'wrong_links': wrong
+    }
+
+def scenario_attach(server, args):
+    """Attachment downloads: streamed, size-checked, content-addressed (each iteration into an empty store)"""
+    import attachment_fetcher
+    import get_message_details
+
+    previous = server.config.attachment_count
+    server.config.attachment_count = max(args.attachments, 2)
+    try:
+        email_id, _ = create_mailbox()
+    finally:
+        server.config.attachment_count = previous
+    messages = setup_call(lambda: get_message_details.get_all_messages(email_id, limit=args.page_size))
+    count = sum(len(message.attachments or []) for message in messages)
+    stores = iter(range(args.iterations + 1))
+
+    def fetch():
+        store = attachment_fetcher.AttachmentStore(f"attachments_{next(stores)}")
+        report = attachment_fetcher.AttachmentFetcher(email_id, store=store).fetch(messages)
+        if report['failed']:
+            return None
+        return count
+
+    return measure(fetch, args.iterations)
+
+def scenario_page(server, args):
+    """Sign-up page snapshot parsed and resolved locally, as page_objects does after its one round trip"""
+    import page_objects
+
+    html = (FIXTURES_DIR / 'signup.html').read_text(encoding='utf-8')
+    fields = list(page_objects.SIGN_UP.fields)
+
+    def resolve():
+        snapshot = page_objects.from_html(html, page_objects.SIGN_UP)
+        missing = [field for field in fields if not snapshot.found(field)]
+        if missing:
+            raise RuntimeError(f"Fields not resolved from the fixture: {', '.join(missing)}")
+        return len(fields)
+
+    return measure(resolve, args.iterations)
+
+def scenario_session(server, args):
+    """Concurrent mailbox session (pages read ahead, attachments alongside), each iteration into an empty store"""
+    import attachment_fetcher
+    import boomlify_async
+
+    previous = server.config.attachment_count
+    server.config.attachment_count = max(args.attachments, 2)
+    try:
+        email_id, _ = create_mailbox()
+    finally:
+        server.config.attachment_count = previous
+    stores = iter(range(args.iterations + 1))
+    sessions = []
+
+    def session():
+        store = attachment_fetcher.AttachmentStore(f"attachments_{next(stores)}")
+        result = boomlify_async.fetch_mailbox(email_id, args.page_size, True, args.concurrency, store)
+        if result['errors'] or result['attachments']['failed']:
+            return None
+        sessions.append(result)
+        return len(result['messages'])
+
+    timings, items, errors = measure(session, args.iterations)
+    if not sessions:
+        return timings, items, errors
+    return timings, items, errors, {
+        'calls': round(sum(r['calls'] for r in sessions) / len(sessions), 1),
+        'sum_call_ms': round(sum(r['sum_call_seconds'] for r in sessions) / len(sessions) * 1000, 3),
+        'slowest_call_ms': round(max(r['slowest_call_seconds'] for r in sessions) * 1000, 3)
+    }
+
+def scenario_form(server, args):
+    """Sign-up form fill against the static fixture (needs Firefox or Chrome)"""
+    try:
+        import website_signup
+    except ImportError as e:
+        raise ScenarioSkipped(f"website_signup not importable: {e}")
+
+    website_signup.SIGNUP_URL = (FIXTURES_DIR / 'signup.html').as_uri()
+    bot = website_signup.EmbyILRegistration.__new__(website_signup.EmbyILRegistration)
+    bot.headless = True
+    bot.driver = None
+    with quiet():
+        for name, method in [('Firefox', bot._try_firefox), ('Chrome', bot._try_chrome_minimal)]:
+            try:
+                bot.driver = method()
+            except Exception:
+                bot.driver = None
+            if bot.driver:
+                bot.browser_type = name
+                break
+    if not bot.driver:
+        raise ScenarioSkipped('no working Firefox or Chrome driver')
+
+    tracer = webdriver_trace.trace(bot.driver, f"form {bot.browser_type}", force=True)
+    tracer.reset()
+
+    def fill():
+        bot.fill_registration_form('John', 'Smith', 'bench@boomlify.local', 'Aa123456!', 'Aa123456!')
+        return 1
+
+    try:
+        timings, items, errors = measure(fill, args.form_iterations, warmup=0)
+        round_trips = tracer.round_trips() / max(len(timings), 1)
+        return timings, items, errors, {'round_trips': round(round_trips, 1),
+                                        'commands': {command: total['calls'] for command, total in tracer.by_command().items()}}
+    finally:
+        bot.close()
+
+SCENARIOS = {
+    'poll': scenario_poll,
+    'ingest': scenario_ingest,
+    'detail': scenario_detail,
+    'push': scenario_push,
+    'link': scenario_link,
+    'extract': scenario_extract,
+    'attach': scenario_attach,
+    'page': scenario_page,
+    'session': scenario_session,
+    'form': scenario_form
+}
+
+def summarize(name, timings, items, errors, extra=None):
+    """Build the result record for one scenario (plus any scenario-specific fields)"""
+    total = sum(timings)
+    record = {
+        'scenario': name,
+        'iterations': len(timings),
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3) if timings else 0.0,
+        'ops_per_sec': round(len(timings) / total, 2) if total else 0.0,
+        'items_per_sec': round(items / total, 2) if total else 0.0
+    }
+    record.update(extra or {})
+    return record
+
+def print_report(results, skipped):
+    """Print the results table"""
+    print(f"\n{'Scenario':<10} {'Iter':>6} {'Errors':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'ops/s':>10} {'items/s':>12}")
+    print('-' * 82)
+    for r in results:
+        print(f"{r['scenario']:<10} {r['iterations']:>6} {r['errors']:>7} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} "
+              f"{r['max_ms']:>10.2f} {r['ops_per_sec']:>10.2f} {r['items_per_sec']:>12.1f}")
+    for r in results:
+        if 'round_trips' in r:
+            busiest = ', '.join(f"{command}={calls}" for command, calls in list(r['commands'].items())[:5])
+            print(f"🔌 {r['scenario']}: {r['round_trips']:g} WebDriver round trips per iteration ({busiest})")
+        if 'worst_mailbox' in r:
+            print(f"🔗 {r['scenario']}: slowest mailbox {r['worst_mailbox']} {r['worst_mailbox_ms']:.2f} ms "
+                  f"({', '.join(f'{name}={ms:.2f}' for name, ms in r['mailbox_max_ms'].items())})")
+            for name, link in r['wrong_links'].items():
+                print(f"❌ {r['scenario']}: {name} gave {link!r}")
+        if 'sum_call_ms' in r:
+            print(f"🧵 {r['scenario']}: {r['calls']:g} calls taking {r['sum_call_ms']:.1f} ms in total, "
+                  f"{r['p50_ms']:.1f} ms wall (p50), slowest call {r['slowest_call_ms']:.1f} ms")
+    for name, reason in skipped.items():
+        print(f"⏭️ {name}: skipped ({reason})")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline pipeline benchmarks')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--messages', type=int, default=25, help='Messages per mailbox')
+    parser.add_argument('--body-size', type=int, default=2000, help='Characters per message body')
+    parser.add_argument('--page-size', type=int, default=25, help='limit= used for message list calls')
+    parser.add_argument('--attachments', type=int, default=3, help='Attachments per newsletter in the attach scenario')
+    parser.add_argument('--attachment-size', type=int, default=256 * 1024, help='Bytes per unique attachment')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--newsletter-size', type=int, default=200000,
+                        help='Characters per newsletter body in the extract scenario')
+    parser.add_argument('--concurrency', type=int,
+                        help='Calls at once in the session scenario (default: BOOMLIFY_CONCURRENCY or 4)')
+    parser.add_argument('--form-iterations', type=int, default=1, help='Iterations for browser scenarios')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for generated mail and fault plan')
+    parser.add_argument('--faults', help=f"Fault plan: JSON file or preset ({', '.join(sorted(PRESETS))})")
+    parser.add_argument('--quota', type=parse_quota, help='Stand-in rate limit, e.g. 50/5 (50 requests every 5s)')
+    parser.add_argument('--record', help='Append the API traffic to this cassette')
+    parser.add_argument('--replay', help='Answer API calls from this cassette instead of the stand-in')
+    parser.add_argument('--replay-timing', type=float, default=1.0,
+                        help='Scale of the recorded timings on replay (0 = instant, default: 1)')
+    parser.add_argument('--max-round-trips', type=float,
+                        help='Fail if a browser scenario needs more WebDriver round trips per iteration')
+    parser.add_argument('--max-extract-ms', type=float,
+                        help='Fail if the slowest mailbox of the extract scenario takes longer')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the selected scenarios and report p50/p95 latency and throughput"""
+    args = parse_args(argv)
+    names = args.scenario or list(SCENARIOS)
+    config = MailboxConfig(message_count=args.messages, body_size=args.body_size, seed=args.seed,
+                           attachment_size=args.attachment_size)
+
+    print("🚀 Offline pipeline benchmarks")
+    print(f"📬 Mailbox: {args.messages} messages x {args.body_size} chars, page size {args.page_size}")
+    if args.faults:
+        print(f"💥 Fault plan: {args.faults} (seed {args.seed})")
+    if args.quota:
+        print(f"🚦 Quota: {args.quota[0]} requests every {args.quota[1]:g}s")
+    transport = None
+    if args.replay:
+        transport = http_cassette.ReplayAdapter(args.replay, args.replay_timing)
+        print(f"📼 Replaying {args.replay} (timing x{args.replay_timing:g})")
+    elif args.record:
+        transport = http_cassette.RecordingAdapter(os.path.abspath(args.record), [boomlify_api.API_KEY])
+        print(f"📼 Recording to {args.record}")
+
+    results = []
+    skipped = {}
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    faults = load_fault_plan(args.faults, args.seed)
+
+    with BoomlifyServer(config, faults=faults, quota=args.quota) as server:
+        previous_base = boomlify_api.API_BASE_URL
+        boomlify_api.API_BASE_URL = server.base_url
+        boomlify_api.use_transport(transport)
+        try:
+            for name in names:
+                print(f"⏱️ Running {name}...")
+                with workdir():
+                    try:
+                        outcome = SCENARIOS[name](server, args)
+                    except ScenarioSkipped as e:
+                        skipped[name] = str(e)
+                        continue
+                    finally:
+                        # Each scenario starts with an unpaced limiter and
+                        # leaves its quota in its own scratch directory
+                        boomlify_api.reset_limiter()
+                results.append(summarize(name, *outcome))
+        finally:
+            boomlify_api.API_BASE_URL = previous_base
+            boomlify_api.use_transport()
+
+    print_report(results, skipped)
+    if faults.counts:
+        print(f"💥 Injected: {', '.join(f'{k}={v}' for k, v in sorted(faults.counts.items()))}")
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results, 'skipped': skipped,
+                       'faults': faults.counts}, f, indent=2)
+        print(f"💾 Results saved to: {json_path}")
+
+    if args.max_round_trips is not None:
+        over = [r for r in results if r.get('round_trips', 0) > args.max_round_trips]
+        for r in over:
+            print(f"❌ {r['scenario']}: {r['round_trips']:g} WebDriver round trips per iteration "
+                  f"(limit {args.max_round_trips:g})")
+        if over:
+            return 1
+    if any(r.get('wrong_links') for r in results):
+        return 1
+    if args.max_extract_ms is not None:
+        over = [r for r in results if r.get('worst_mailbox_ms', 0) > args.max_extract_ms]
+        for r in over:
+            print(f"❌ {r['scenario']}: mailbox {r['worst_mailbox']} took {r['worst_mailbox_ms']:.2f} ms "
+                  f"(limit {args.max_extract_ms:g} ms)")
+        if over:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+'''
+Local stand-in for a mail provider that calls webhooks
+
+Sends inbound-message notifications to a webhook receiver (see
+webhook_receiver.py) the way a provider would: either the full message
+({"email_id": ..., "message": {...}}) or a bare notification
+({"email_id": ..., "message_id": ...}) that only tells the receiver to poll.
+Messages are generated like the Boomlify stand-in's, so the first one of a
+mailbox carries the EmbyIL activation link.
+
+Usage:
+    WEBHOOK_PORT=8766 python3 check_messages.py          (or the Jenkins Step 3 watch)
+    python -m benchmarks.webhook_sender http://127.0.0.1:8766/webhook/boomlify --email-id <id> --delay 2
+    python -m benchmarks.webhook_sender <url> --ping --count 3 --secret s3cret
+'''
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.boomlify_server import MailboxConfig, generate_messages
+
+SECRET_HEADER = 'X-Webhook-Secret'
+
+def message_notification(email_id, message):
+    """Notification carrying the whole message"""
+    return {'event': 'message.received', 'email_id': email_id, 'message': message}
+
+def ping_notification(email_id, message_id):
+    """Notification that only names the new message"""
+    return {'event': 'message.received', 'email_id': email_id, 'message_id': message_id}
+
+def send(url, payload, secret=None, timeout=10):
+    """
+    POST one notification
+
+    Args:
+        url (str): Receiver URL
+        payload: JSON-serialisable notification
+        secret (str): Sent as the X-Webhook-Secret header
+        timeout (float): Seconds
+
+    Returns:
+        tuple: (HTTP status, decoded response body or None)
+    """
+    data = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=data, method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    if secret:
+        request.add_header(SECRET_HEADER, secret)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        try:
+            body = json.loads(e.read() or b'null')
+        except ValueError:
+            body = None
+        return e.code, body
+
+def generate_notifications(email_id, count=1, body_size=2000, ping=False, seed=0):
+    """
+    Notifications for `count` new messages of a mailbox
+
+    Returns:
+        list: Notification payloads, activation mail first
+    """
+    config = MailboxConfig(message_count=count, body_size=body_size, seed=seed)
+    messages = generate_messages(email_id, f"{email_id[:8]}@boomlify.local", config)
+    if ping:
+        return [ping_notification(email_id, message['id']) for message in messages]
+    return [message_notification(email_id, message) for message in messages]
+
+class DelayedSender(threading.Thread):
+    def __init__(self, url, payloads, delay=1.0, spacing=0.0, secret=None):
+        """
+        Send notifications from a background thread after a delay
+
+        Args:
+            url (str): Receiver URL
+            payloads (list): Notifications to send, in order
+            delay (float): Seconds before the first one
+            spacing (float): Seconds between notifications
+            secret (str): Webhook secret
+        """
+        super().__init__(name='webhook-sender', daemon=True)
+        self.url = url
+        self.payloads = payloads
+        self.delay = delay
+        self.spacing = spacing
+        self.secret = secret
+        self.sent_at = []
+        self.results = []
+
+    def run(self):
+        time.sleep(self.delay)
+        for i, payload in enumerate(self.payloads):
+            if i:
+                time.sleep(self.spacing)
+            self.sent_at.append(time.monotonic())
+            try:
+                self.results.append(send(self.url, payload, self.secret))
+            except (OSError, urllib.error.URLError) as e:
+                self.results.append((None, str(e)))
+
+def main():
+    """Send notifications from the command line"""
+    parser = argparse.ArgumentParser(description='Send inbound-message notifications to a webhook receiver')
+    parser.add_argument('url', help='Receiver URL, e.g. http://127.0.0.1:8766/webhook/boomlify')
+    parser.add_argument('--email-id', default='00000000-0000-0000-0000-000000000000',
+                        help='Mailbox the messages belong to (the run state email.id)')
+    parser.add_argument('--count', type=int, default=1, help='Messages to announce')
+    parser.add_argument('--body-size', type=int, default=2000, help='Characters per message body')
+    parser.add_argument('--ping', action='store_true', help='Send bare notifications (receiver polls)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before the first one')
+    parser.add_argument('--spacing', type=float, default=0.0, help='Seconds between notifications')
+    parser.add_argument('--secret', help='Webhook secret (X-Webhook-Secret)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    payloads = generate_notifications(args.email_id, args.count, args.body_size, args.ping, args.seed)
+    sender = DelayedSender(args.url, payloads, args.delay, args.spacing, args.secret)
+    sender.run()
+    for payload, (status, body) in zip(payloads, sender.results):
+        message_id = payload.get('message_id') or payload['message']['id']
+        print(f"{'✅' if status == 200 else '❌'} {message_id}: HTTP {status} {json.dumps(body)}")
+
+if __name__ == "__main__":
+    main()
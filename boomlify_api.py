@@ -0,0 +1,169 @@
+import os
+
+import requests
+
+import deadline
+import http_cassette
+import pipeline_metrics
+from pipeline_log import get_logger
+from rate_limit import RateLimiter, MAX_RETRIES
+
+log = get_logger('boomlify_api')
+
+# Base URL of the Boomlify temp-mail API on RapidAPI.
+# Set BOOMLIFY_API_BASE to point the scripts at another server
+# (for example the local stand-in in benchmarks/boomlify_server.py).
+API_HOST = 'boomlify-temp-mail-api2.p.rapidapi.com'
+API_KEY = 'c815bd8438mshaec3510f9c39d67p1b034bjsn3f4575728890'
+API_BASE_URL = os.environ.get('BOOMLIFY_API_BASE', f'https://{API_HOST}/api/v1').rstrip('/')
+
+def api_url(path):
+    """
+    Build a full API URL for the given endpoint path
+
+    Args:
+        path (str): Endpoint path, e.g. 'emails/create?time=10min'
+
+    Returns:
+        str: Full URL under API_BASE_URL
+    """
+    return f"{API_BASE_URL}/{path.lstrip('/')}"
+
+def api_headers(json_body=False):
+    """
+    Build the RapidAPI headers used for every Boomlify call
+
+    Args:
+        json_body (bool): Add a JSON Content-Type header (for POST requests)
+
+    Returns:
+        dict: Request headers
+    """
+    headers = {
+        'x-rapidapi-host': API_HOST,
+        'x-rapidapi-key': API_KEY
+    }
+    if json_body:
+        headers['Content-Type'] = 'application/json'
+    return headers
+
+_limiter = None
+_session = None
+
+def get_session():
+    """
+    The process-wide HTTP session for Boomlify calls
+
+    Connections are reused across calls. BOOMLIFY_RECORD / BOOMLIFY_REPLAY
+    mount a recording or replaying transport on it (see http_cassette.py).
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        transport = http_cassette.transport_from_env(secrets=[API_KEY])
+        if transport is not None:
+            session.mount('http://', transport)
+            session.mount('https://', transport)
+        _session = session
+    return _session
+
+def use_transport(adapter=None):
+    """
+    Start a new session, optionally with a given transport adapter
+
+    Args:
+        adapter (requests.adapters.HTTPAdapter): Transport for every URL
+            (e.g. http_cassette.ReplayAdapter); None = from the environment
+    """
+    global _session
+    if _session is not None:
+        _session.close()
+    _session = None
+    if adapter is not None:
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+
+def get_limiter():
+    """The process-wide rate limiter for Boomlify calls (see rate_limit.py)"""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter.from_env()
+    return _limiter
+
+def reset_limiter():
+    """Save the current limiter's quota and start over with a fresh one"""
+    global _limiter
+    if _limiter is not None:
+        _limiter.save()
+    _limiter = None
+
+def request(method, path, json_body=None, **kwargs):
+    """
+    Send one Boomlify API request, paced by the rate limiter
+
+    429 responses are retried up to MAX_RETRIES times after waiting for
+    Retry-After; the last response is returned if they keep coming.
+    Unless a timeout is given, connect/read timeouts come from the
+    step's remaining time budget (see deadline.py).
+
+    Args:
+        method (str): 'GET' or 'POST'
+        path (str): Endpoint path, see api_url()
+        json_body (dict): JSON payload (sent with a JSON Content-Type)
+        **kwargs: Passed on to requests.request (e.g. stream=True, timeout=)
+
+    Returns:
+        requests.Response: The response
+
+    Raises:
+        requests.exceptions.RequestException: Network errors, and
+            rate_limit.QuotaExhausted when the request budget is used up and
+            deadline.DeadlineExceeded when the step runs out of time
+    """
+    limiter = get_limiter()
+    session = get_session()
+    url = api_url(path)
+    headers = api_headers(json_body=json_body is not None)
+    label = f"{method} {path.split('?')[0]}"
+    endpoint = pipeline_metrics.endpoint(path)
+    fixed_timeout = kwargs.pop('timeout', None)
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        timeout = fixed_timeout or deadline.http_timeout(label)
+        try:
+            with deadline.span(label), pipeline_metrics.API_LATENCY.time(method=method, endpoint=endpoint):
+                response = session.request(method, url, headers=headers, json=json_body,
+                                           timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            pipeline_metrics.API_REQUESTS.inc(method=method, endpoint=endpoint, status='error')
+            raise
+        _count_response(method, endpoint, response, kwargs.get('stream', False))
+        limiter.update(response)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+        delay = limiter.backoff(response, attempt)
+        response.close()
+        log.warning(f"⏳ Rate limited by the API - retrying in {delay:.1f}s")
+    return response
+
+def _count_response(method, endpoint, response, streamed):
+    pipeline_metrics.API_REQUESTS.inc(method=method, endpoint=endpoint, status=str(response.status_code))
+    # Streamed bodies aren't read yet: those are counted by their Content-Length
+    size = response.headers.get('Content-Length')
+    if size is None and not streamed:
+        size = len(response.content or b'')
+    try:
+        pipeline_metrics.API_BYTES.inc(int(size), method=method, endpoint=endpoint)
+    except (TypeError, ValueError):
+        pass
+
+def quota_status():
+    """Remaining Boomlify quota as seen by this process (see RateLimiter.status)"""
+    return get_limiter().status()
+
+def stretch_interval(interval, horizon, calls_per_poll=1):
+    """Polling interval that keeps a watch inside the quota (see RateLimiter.stretch_interval)"""
+    return get_limiter().stretch_interval(interval, horizon, calls_per_poll)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+import attachment_fetcher
+import boomlify_api
+import check_messages
+import create_email
+import get_message_details
+from pipeline_log import get_logger
+from run_state import get_email
+
+log = get_logger('boomlify_async')
+
+# asyncio client for the Boomlify API.
+#
+# AsyncBoomlify has the same calls as the sync client - create_temp_email,
+# get_email_messages, get_all_messages, fetch_message_page, request and
+# attachment downloads - as coroutines. Each runs the sync function on the
+# client's own thread pool, at most BOOMLIFY_CONCURRENCY (default: 4) at a
+# time, so rate limiting and 429 retries (rate_limit.py), step deadlines,
+# metrics and cassette record/replay behave exactly as in the sync client,
+# and the sync functions stay the ones the scripts call.
+#
+# Independent calls of one mailbox session overlap:
+#
+#     iter_pages()       the next pages are requested while the current one
+#                        is being handled (after a full first page only, so
+#                        a small inbox still costs one request)
+#     fetch_attachments  every download of a page at once
+#     mailbox_session()  both: attachments of page N download while page N+1
+#                        is fetched, so the session takes about as long as
+#                        its slowest call rather than the sum of its calls
+#
+# fetch_mailbox() is the sync wrapper (asyncio.run) for scripts:
+#
+#     python3 boomlify_async.py session [--email-id ID] [--page-size N] [--concurrency N]
+#                                       [--attachments] [--json FILE]
+CONCURRENCY_ENV = 'BOOMLIFY_CONCURRENCY'
+DEFAULT_CONCURRENCY = 4
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+class AsyncBoomlify:
+    def __init__(self, concurrency=None):
+        """
+        Boomlify calls as coroutines, run concurrently on a bounded thread pool
+
+        Use as `async with AsyncBoomlify() as client:` so the pool is shut
+        down with the session.
+
+        Args:
+            concurrency (int): Calls in flight at once (default: BOOMLIFY_CONCURRENCY or 4)
+        """
+        self.concurrency = max(int(concurrency or _env_int(CONCURRENCY_ENV, DEFAULT_CONCURRENCY)), 1)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency,
+                                                          thread_name_prefix='boomlify-async')
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.call_seconds = 0.0
+        self.slowest_call = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    def close(self):
+        """Shut the thread pool down (blocks until calls already running finish)"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def aclose(self):
+        """close() on a helper thread, so the event loop keeps running meanwhile"""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def _timed(self, func, args, kwargs):
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.monotonic() - start
+            with self.lock:
+                self.calls += 1
+                self.call_seconds += seconds
+                self.slowest_call = max(self.slowest_call, seconds)
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking function on the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(self._timed, func, args, kwargs))
+
+    async def request(self, method, path, json_body=None, **kwargs):
+        """boomlify_api.request() - returns the requests.Response"""
+        return await self.call(boomlify_api.request, method, path, json_body, **kwargs)
+
+    async def create_temp_email(self):
+        """create_email.create_temp_email() - returns (email_id, address), (None, None) on failure"""
+        return await self.call(create_email.create_temp_email)
+
+    async def get_email_messages(self, email_id, limit=25, offset=0):
+        """check_messages.get_email_messages() - returns the new Messages, None on failure"""
+        return await self.call(check_messages.get_email_messages, email_id, limit, offset)
+
+    async def get_all_messages(self, email_id, limit=25, offset=0, only_ids=None):
+        """get_message_details.get_all_messages() - returns the Messages, None on failure"""
+        return await self.call(get_message_details.get_all_messages, email_id, limit, offset, only_ids)
+
+    async def fetch_message_page(self, email_id, limit=25, offset=0, only_ids=None):
+        """get_message_details.fetch_message_page() - returns (messages, total), raises like it"""
+        return await self.call(get_message_details.fetch_message_page, email_id, limit, offset, only_ids)
+
+    async def iter_pages(self, email_id, page_size=25, only_ids=None,
+                         max_messages=get_message_details.MAX_EXPORT_MESSAGES):
+        """
+        Pages of the message list in order, the following pages already requested
+
+        Args:
+            email_id (str): Mailbox ID
+            page_size (int): Messages per request
+            only_ids (iterable): Only decode messages with these IDs
+            max_messages (int): Never page past this many messages
+
+        Yields:
+            tuple: (offset, messages, total) - total is the page's message count
+
+        Raises:
+            get_message_details.PageError, requests.exceptions.RequestException,
+            json.JSONDecodeError: As fetch_message_page (the pages still in
+                flight are cancelled)
+        """
+        end = max_messages
+        next_offset = 0
+        # One page first: most mailboxes fit on it, so don't spend quota on more
+        in_flight = 1
+        pending = []
+
+        def top_up():
+            nonlocal next_offset
+            while len(pending) < in_flight and next_offset < end:
+                task = asyncio.ensure_future(self.fetch_message_page(email_id, page_size, next_offset, only_ids))
+                pending.append((next_offset, task))
+                next_offset += page_size
+
+        try:
+            top_up()
+            while pending:
+                offset, task = pending.pop(0)
+                messages, total = await task
+                if total < page_size:
+                    # Short page: the inbox ends here, later requests are wasted
+                    end = min(end, offset + page_size)
+                    for later, extra in pending:
+                        if later >= end:
+                            extra.cancel()
+                    pending = [(later, extra) for later, extra in pending if later < end]
+                else:
+                    in_flight = self.concurrency
+                # Before handing the page over, so the next ones load meanwhile
+                top_up()
+                yield offset, messages, total
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def fetch_attachments(self, fetcher, messages, report=None):
+        """
+        Download the attachments of some messages, all at once (within the pool)
+
+        Args:
+            fetcher (attachment_fetcher.AttachmentFetcher): Store and dedup state
+            messages (list): Message objects
+            report (dict): Fetch report to add to (default: a new one)
+
+        Returns:
+            dict: The fetch report (see AttachmentFetcher.fetch)
+        """
+        report = report if report is not None else fetcher.new_report()
+        jobs = fetcher.plan(messages, report)
+        results = await asyncio.gather(*(self.call(fetcher.fetch_one, message_id, info)
+                                         for _, message_id, info in jobs), return_exceptions=True)
+        for job, result in zip(jobs, results):
+            if isinstance(result, (attachment_fetcher.AttachmentError, requests.exceptions.RequestException, OSError)):
+                fetcher.settle(job, report, error=result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                fetcher.settle(job, report, result)
+        return report
+
+    async def mailbox_session(self, email_id, page_size=25, attachments=False, store=None):
+        """
+        Read a whole mailbox: every page, and optionally every attachment
+
+        Args:
+            email_id (str): Mailbox ID
+            page_size (int): Messages per request
+            attachments (bool): Also download the attachments
+            store (attachment_fetcher.AttachmentStore): Where they go (default: AttachmentStore())
+
+        Returns:
+            dict: messages (list of Message), pages, calls, seconds, slowest_call_seconds,
+                sum_call_seconds, errors, attachments (fetch report or None)
+        """
+        started = time.monotonic()
+        calls_before = self.calls
+        seconds_before = self.call_seconds
+        self.slowest_call = 0.0
+        result = {'email_id': email_id, 'messages': [], 'pages': 0, 'errors': [], 'attachments': None}
+        fetcher = attachment_fetcher.AttachmentFetcher(email_id, store=store, workers=self.concurrency)
+        downloads = []
+        if attachments:
+            result['attachments'] = fetcher.new_report()
+        try:
+            async for offset, messages, total in self.iter_pages(email_id, page_size):
+                result['pages'] += 1
+                result['messages'].extend(messages)
+                log.info(f"📄 Page at offset {offset}: {total} messages")
+                if attachments and messages:
+                    downloads.append(asyncio.ensure_future(
+                        self.fetch_attachments(fetcher, messages, result['attachments'])))
+        except get_message_details.PageError as e:
+            log.error(f"❌ Message list: HTTP {e.status_code}")
+            result['errors'].append(f"HTTP {e.status_code}")
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            log.error(f"❌ Message list failed: {e}")
+            result['errors'].append(str(e))
+        if downloads:
+            await asyncio.gather(*downloads)
+            fetcher.store.save()
+        result['seconds'] = round(time.monotonic() - started, 3)
+        result['calls'] = self.calls - calls_before
+        result['sum_call_seconds'] = round(self.call_seconds - seconds_before, 3)
+        result['slowest_call_seconds'] = round(self.slowest_call, 3)
+        return result
+
+def fetch_mailbox(email_id, page_size=25, attachments=False, concurrency=None, store=None):
+    """
+    Sync wrapper: run a mailbox session (see AsyncBoomlify.mailbox_session)
+
+    Returns:
+        dict: The session result
+    """
+    async def session():
+        async with AsyncBoomlify(concurrency) as client:
+            return await client.mailbox_session(email_id, page_size, attachments, store)
+    return asyncio.run(session())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent Boomlify mailbox session')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    session = subparsers.add_parser('session', help='Read every page (and attachment) of the mailbox')
+    session.add_argument('--email-id', help='Mailbox ID (default: the one in the run state)')
+    session.add_argument('--page-size', type=int, default=25)
+    session.add_argument('--concurrency', type=int, help=f"Calls at once (default: {CONCURRENCY_ENV} or 4)")
+    session.add_argument('--attachments', action='store_true', help='Also download the attachments')
+    session.add_argument('--json', help='Write the session summary to this file')
+    args = parser.parse_args(argv)
+
+    email_id = args.email_id or get_email()[0]
+    if not email_id:
+        print("❌ No email ID given and none in the run state")
+        return 1
+    result = fetch_mailbox(email_id, args.page_size, args.attachments, args.concurrency)
+    summary = {key: value for key, value in result.items() if key != 'messages'}
+    summary['messages'] = len(result['messages'])
+    print(f"📬 {summary['messages']} messages on {result['pages']} pages in {result['seconds']:.2f}s "
+          f"({result['calls']} calls, {result['sum_call_seconds']:.2f}s of calls, "
+          f"slowest {result['slowest_call_seconds']:.2f}s)")
+    if result['attachments'] is not None:
+        report = result['attachments']
+        print(f"📎 Attachments: {report['downloaded']} downloaded ({report['bytes_downloaded']:,} bytes), "
+              f"{report['deduplicated']} deduplicated, {report['cached']} already stored, "
+              f"{len(report['failed'])} failed")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Session summary saved to: {args.json}")
+    return 1 if result['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
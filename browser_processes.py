@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+import atexit
+import datetime
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from pipeline_log import get_logger
+
+log = get_logger('browser_processes')
+
+# Browser and driver processes started by the WebDriver steps.
+#
+# A step killed by the Jenkinsfile's `timeout` never reaches close(), so
+# geckodriver/Firefox/chromedriver/Chrome would stay behind holding RAM and
+# /dev/shm for every later build. Every driver is therefore registered as
+# soon as it starts:
+#
+#     browser_processes.json   [{"owner", "owner_started", "label", "session",
+#                                "pids": [{"pid", "started", "name"}], "dirs": [...]}]
+#
+# (the driver service, the browser it launched and their children, plus
+# the temporary profile directories). Then:
+#
+#   - quit_driver() quits a driver and kills/removes whatever it leaves behind
+#   - SIGTERM/SIGHUP (what `timeout` sends) and interpreter exit kill this
+#     process's registered browsers, then let the step's finally blocks run
+#   - prepare(), called before a driver is started, reaps entries whose
+#     owner process is gone, and orphaned browser/driver processes
+#     (re-parented to PID 1) from earlier runs of this workspace
+#
+# A browser's detached helpers (e.g. chrome_crashpad_handler) are not in
+# the registry, and on a shared agent other builds run the same browsers,
+# so an orphan is never picked by name alone: prepare() puts
+# BROWSER_PROCESSES_OWNER=<registry path>:<pid>:<start time> into the
+# environment every driver and browser inherits, and only orphans carrying
+# this registry's marker, with a dead owner, are killed.
+#
+# Processes are matched on PID *and* start time, so a recycled PID is never
+# killed. Linux /proc is used to find children and orphans; elsewhere only
+# the recorded PIDs are handled.
+#
+#     BROWSER_REGISTRY=browser_processes.json     registry file
+#     BROWSER_REAP_ORPHANS=1                      also kill orphaned browser processes (0 = registry only)
+#
+#     python3 browser_processes.py reap | status
+REGISTRY_ENV = 'BROWSER_REGISTRY'
+REAP_ORPHANS_ENV = 'BROWSER_REAP_ORPHANS'
+OWNER_MARK_ENV = 'BROWSER_PROCESSES_OWNER'
+DEFAULT_REGISTRY = 'browser_processes.json'
+KILL_GRACE_SECONDS = 3.0
+
+BROWSER_NAMES = {'geckodriver', 'firefox', 'firefox-esr', 'firefox-bin', 'chromedriver', 'chrome',
+                 'google-chrome', 'chromium', 'chromium-browser', 'chrome_crashpad_handler'}
+
+_lock = threading.RLock()
+_installed = False
+_prepared = False
+_previous_handlers = {}
+
+def registry_path():
+    """Path of the registry file"""
+    return os.environ.get(REGISTRY_ENV) or DEFAULT_REGISTRY
+
+def _proc_stat(pid):
+    """(name, parent pid, start time in clock ticks) of a live process, or None"""
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The name is in parentheses and may itself contain spaces or ')'
+    name = data[data.index('(') + 1:data.rindex(')')]
+    fields = data[data.rindex(')') + 2:].split()
+    if fields[0] in ('Z', 'X'):
+        # Exited, waiting to be collected: nothing left to kill
+        return None
+    return name, int(fields[1]), int(fields[19])
+
+def _exe_name(pid):
+    try:
+        return os.path.basename(os.readlink(f"/proc/{pid}/exe"))
+    except OSError:
+        return None
+
+def _owner_mark(pid):
+    """(registry path, owner pid, owner start time) from a process's BROWSER_PROCESSES_OWNER, or None"""
+    prefix = f"{OWNER_MARK_ENV}=".encode()
+    try:
+        with open(f"/proc/{pid}/environ", 'rb') as f:
+            variables = f.read().split(b'\0')
+    except OSError:
+        return None
+    for variable in variables:
+        if variable.startswith(prefix):
+            path, _, owner = variable[len(prefix):].decode('utf-8', 'replace').rpartition(':')
+            path, _, owner_pid = path.rpartition(':')
+            try:
+                return path, int(owner_pid), int(owner)
+            except ValueError:
+                return None
+    return None
+
+def _all_pids():
+    try:
+        return [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return []
+
+def descendants(pid):
+    """
+    Every live descendant of a process (Linux only)
+
+    Returns:
+        list: PIDs, children before grandchildren
+    """
+    children = {}
+    for other in _all_pids():
+        stat = _proc_stat(other)
+        if stat:
+            children.setdefault(stat[1], []).append(other)
+    found = []
+    queue = list(children.get(pid, ()))
+    while queue:
+        child = queue.pop(0)
+        found.append(child)
+        queue.extend(children.get(child, ()))
+    return found
+
+def _is_alive(pid, started=None):
+    stat = _proc_stat(pid)
+    if stat is not None:
+        return started is None or stat[2] == started
+    if os.path.isdir('/proc'):
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except (OSError, ProcessLookupError):
+        return False
+
+def _describe(pid):
+    stat = _proc_stat(pid)
+    return {'pid': pid, 'started': stat[2] if stat else None, 'name': (stat[0] if stat else None)}
+
+def terminate(processes, grace=KILL_GRACE_SECONDS):
+    """
+    Stop processes (and their descendants): SIGTERM, then SIGKILL after `grace` seconds
+
+    Args:
+        processes (list): {"pid", "started"} records - a PID whose start time
+            no longer matches belongs to someone else and is left alone
+
+    Returns:
+        int: Processes that were signalled
+    """
+    targets = {}
+    for record in processes:
+        pid, started = record['pid'], record.get('started')
+        if pid == os.getpid() or not _is_alive(pid, started):
+            continue
+        targets[pid] = started
+        for child in descendants(pid):
+            if child != os.getpid():
+                targets.setdefault(child, _describe(child)['started'])
+
+    for pid in targets:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except (OSError, ProcessLookupError):
+            pass
+    end = time.monotonic() + grace
+    while time.monotonic() < end and any(_is_alive(pid, started) for pid, started in targets.items()):
+        time.sleep(0.05)
+    for pid, started in targets.items():
+        if _is_alive(pid, started):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except (OSError, ProcessLookupError):
+                pass
+    # Collect our own children so they don't linger as zombies
+    for pid in targets:
+        try:
+            os.waitpid(pid, os.WNOHANG)
+        except (ChildProcessError, OSError):
+            pass
+    return len(targets)
+
+class _RegistryFile:
+    """Exclusive access to the registry file for a read-modify-write"""
+
+    def __enter__(self):
+        _lock.acquire()
+        self.lock_file = None
+        if fcntl is not None:
+            self.lock_file = open(registry_path() + '.lock', 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            with open(registry_path(), 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = []
+        return self
+
+    def save(self):
+        path = registry_path()
+        fd, tmp_path = tempfile.mkstemp(prefix='.browser_processes-', dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.lock_file is not None:
+            self.lock_file.close()
+        _lock.release()
+
+def _driver_pids(driver):
+    """PIDs of a driver's service, its browser and their children"""
+    pids = []
+    service = getattr(driver, 'service', None)
+    process = getattr(service, 'process', None)
+    if process is not None and getattr(process, 'pid', None):
+        pids.append(process.pid)
+    capabilities = getattr(driver, 'capabilities', None) or {}
+    browser_pid = capabilities.get('moz:processID')
+    if browser_pid:
+        pids.append(int(browser_pid))
+    for pid in list(pids):
+        pids.extend(descendants(pid))
+    return list(dict.fromkeys(pids))
+
+def _driver_dirs(driver):
+    capabilities = getattr(driver, 'capabilities', None) or {}
+    dirs = [capabilities.get('moz:profile'), (capabilities.get('chrome') or {}).get('userDataDir')]
+    return [path for path in dirs if path]
+
+def register(driver, label=None, dirs=()):
+    """
+    Record a freshly started driver's processes and profile directories
+
+    Args:
+        driver: Selenium WebDriver
+        label (str): What started it (for `status`)
+        dirs (iterable): Extra directories to remove with it (e.g. a mkdtemp profile)
+
+    Returns:
+        dict: The registry entry
+    """
+    install_cleanup()
+    me = _describe(os.getpid())
+    entry = {
+        'owner': me['pid'],
+        'owner_started': me['started'],
+        'label': label or type(driver).__name__,
+        'session': getattr(driver, 'session_id', None),
+        'pids': [_describe(pid) for pid in _driver_pids(driver)],
+        'dirs': list(dict.fromkeys(list(dirs) + _driver_dirs(driver))),
+        'registered_at': datetime.datetime.now().isoformat()
+    }
+    with _RegistryFile() as registry:
+        registry.entries.append(entry)
+        registry.save()
+    return entry
+
+def _clean_entry(entry):
+    killed = terminate(entry.get('pids') or [])
+    for path in entry.get('dirs') or []:
+        shutil.rmtree(path, ignore_errors=True)
+    return killed
+
+def _release(session, pids):
+    with _RegistryFile() as registry:
+        mine = [entry for entry in registry.entries
+                if entry['owner'] == os.getpid()
+                and ((session and entry.get('session') == session)
+                     or set(pids) & {record['pid'] for record in entry['pids']})]
+        if mine:
+            registry.entries = [entry for entry in registry.entries if entry not in mine]
+            registry.save()
+    return sum(_clean_entry(entry) for entry in mine)
+
+def release(driver):
+    """
+    Forget a driver after quit(), killing anything it left running
+
+    Returns:
+        int: Leftover processes that had to be killed
+    """
+    return _release(getattr(driver, 'session_id', None), _driver_pids(driver))
+
+def quit_driver(driver):
+    """
+    driver.quit(), then kill and remove whatever the driver left behind
+
+    Raises:
+        Whatever driver.quit() raises (after the cleanup)
+    """
+    # quit() clears session_id and stops the service: note them first
+    session = getattr(driver, 'session_id', None)
+    pids = _driver_pids(driver)
+    try:
+        driver.quit()
+    finally:
+        leftover = _release(session, pids)
+        if leftover:
+            log.info(f"🧹 Killed {leftover} browser process{'es' if leftover != 1 else ''} left after quit()")
+
+def cleanup_own():
+    """
+    Kill every browser this process registered (exit and signal handler)
+
+    Returns:
+        int: Processes killed
+    """
+    try:
+        with _RegistryFile() as registry:
+            mine = [entry for entry in registry.entries if entry['owner'] == os.getpid()]
+            if not mine:
+                return 0
+            registry.entries = [entry for entry in registry.entries if entry['owner'] != os.getpid()]
+            registry.save()
+    except OSError:
+        return 0
+    killed = sum(_clean_entry(entry) for entry in mine)
+    if killed:
+        log.info(f"🧹 Killed {killed} browser/driver process{'es' if killed != 1 else ''} on exit")
+    return killed
+
+def _on_signal(signum, frame):
+    cleanup_own()
+    previous = _previous_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)
+    # Unwind normally so the step's finally blocks (and deadline reports) still run
+    raise SystemExit(128 + signum)
+
+def mark_children():
+    """Set BROWSER_PROCESSES_OWNER, so drivers started from now on can be told apart as ours"""
+    me = _describe(os.getpid())
+    os.environ[OWNER_MARK_ENV] = f"{os.path.abspath(registry_path())}:{me['pid']}:{me['started'] or 0}"
+
+def install_cleanup():
+    """Kill this process's registered browsers at exit and on SIGTERM/SIGHUP (idempotent)"""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        _installed = True
+    mark_children()
+    atexit.register(cleanup_own)
+    for name in ('SIGTERM', 'SIGHUP'):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        try:
+            previous = signal.signal(signum, _on_signal)
+        except ValueError:
+            # Not the main thread: atexit still covers normal exits
+            continue
+        if previous not in (signal.SIG_DFL, signal.SIG_IGN, None, _on_signal):
+            _previous_handlers[signum] = previous
+
+def _owner_alive(entry):
+    return _is_alive(entry['owner'], entry.get('owner_started'))
+
+def orphans():
+    """
+    Browser/driver processes left by dead owners of this registry (re-parented to PID 1)
+
+    Only processes carrying this registry's BROWSER_PROCESSES_OWNER are
+    considered, so other builds' browsers are never included.
+
+    Returns:
+        list: {"pid", "started", "name"} records
+    """
+    found = []
+    registry = os.path.abspath(registry_path())
+    uid = os.getuid() if hasattr(os, 'getuid') else None
+    for pid in _all_pids():
+        stat = _proc_stat(pid)
+        if not stat or stat[1] != 1 or pid == os.getpid():
+            continue
+        name = _exe_name(pid) or stat[0]
+        if name not in BROWSER_NAMES and stat[0] not in BROWSER_NAMES:
+            continue
+        try:
+            if uid is not None and os.stat(f"/proc/{pid}").st_uid != uid:
+                continue
+        except OSError:
+            continue
+        mark = _owner_mark(pid)
+        if mark is None or mark[0] != registry or _is_alive(mark[1], mark[2] or None):
+            continue
+        found.append({'pid': pid, 'started': stat[2], 'name': name})
+    return found
+
+def reap_stale(include_orphans=None):
+    """
+    Kill what earlier runs left behind
+
+    Args:
+        include_orphans (bool): Also kill orphaned browser processes of
+            this registry (default: BROWSER_REAP_ORPHANS, on)
+
+    Returns:
+        dict: entries (stale registry entries), killed (processes), dirs (removed)
+    """
+    if include_orphans is None:
+        include_orphans = os.environ.get(REAP_ORPHANS_ENV, '1') != '0'
+    with _RegistryFile() as registry:
+        stale = [entry for entry in registry.entries if not _owner_alive(entry)]
+        if stale:
+            registry.entries = [entry for entry in registry.entries if entry not in stale]
+            registry.save()
+
+    killed = 0
+    dirs = 0
+    for entry in stale:
+        killed += _clean_entry(entry)
+        dirs += len(entry.get('dirs') or [])
+    if include_orphans:
+        killed += terminate(orphans())
+
+    if stale or killed:
+        log.info(f"🧹 Reaped {len(stale)} stale browser session{'s' if len(stale) != 1 else ''}: "
+                 f"{killed} process{'es' if killed != 1 else ''} killed, {dirs} profile dir{'s' if dirs != 1 else ''} removed")
+    return {'entries': len(stale), 'killed': killed, 'dirs': dirs}
+
+def prepare():
+    """Install the cleanup handlers and reap leftovers of earlier runs (once per process)"""
+    global _prepared
+    install_cleanup()
+    with _lock:
+        if _prepared:
+            return None
+        _prepared = True
+    try:
+        return reap_stale()
+    except OSError as e:
+        log.warning(f"⚠️ Could not reap stale browser processes: {e}")
+        return None
+
+def main(argv=None):
+    """Command line: reap, status"""
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'status'
+    if command == 'reap':
+        result = reap_stale()
+        if not result['entries'] and not result['killed']:
+            print("✅ No stale browser or driver processes")
+        return 0
+    if command == 'status':
+        with _RegistryFile() as registry:
+            entries = list(registry.entries)
+        for entry in entries:
+            state = 'running' if _owner_alive(entry) else 'stale'
+            live = [record for record in entry['pids'] if _is_alive(record['pid'], record.get('started'))]
+            print(f"🌐 {entry['label']} (owner {entry['owner']}, {state}): "
+                  f"{len(live)}/{len(entry['pids'])} processes alive, since {entry.get('registered_at')}")
+        found = orphans()
+        for record in found:
+            print(f"👻 Orphan {record['name']} (pid {record['pid']})")
+        if not entries and not found:
+            print("✅ No registered browsers and no orphans")
+        return 0
+    print(f"Usage: {os.path.basename(sys.argv[0])} reap|status")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+
+import pipeline_metrics
+from run_state import get_email, get_section
+
+# Build performance report (the Jenkinsfile's "Generate Summary Report" stage).
+#
+# Reads what the steps of this build left behind - their metrics files
+# (pipeline_<step>.prom, see pipeline_metrics.py) and the run state - and
+# appends one record per build to a rolling local history:
+#
+#     build_history.jsonl     {"build", "finished_at", "steps": {step: {"duration",
+#                              "budget", "outcome", "spans": {label: seconds}}},
+#                              "api": {endpoint: {...}}, "browser": {...}}
+#
+# From the history it reports, as build_<N>_report.md and .json:
+#   - every step's duration with its p50/p95 and trend over the last builds
+#   - regressions: steps, spans and API endpoints slower than their baseline
+#     (the median of the previous builds) by more than the threshold
+#   - the slowest spans of this build, API latency and browser numbers
+#
+# Metrics files older than the build (steps that didn't run this time) are
+# left out: BUILD_STARTED_AT (Unix time, seconds or milliseconds - Jenkins'
+# currentBuild.startTimeInMillis) or --since, default the last 2 hours.
+#
+#     BUILD_HISTORY=build_history.jsonl     history file
+#     BUILD_HISTORY_SIZE=50                 builds kept in it
+#
+#     python3 build_report.py --build 123 [--baseline 10] [--threshold 0.25] [--fail-on-regression]
+HISTORY_ENV = 'BUILD_HISTORY'
+HISTORY_SIZE_ENV = 'BUILD_HISTORY_SIZE'
+STARTED_AT_ENV = 'BUILD_STARTED_AT'
+DEFAULT_HISTORY = 'build_history.jsonl'
+DEFAULT_HISTORY_SIZE = 50
+DEFAULT_MAX_AGE = 2 * 60 * 60
+DEFAULT_BASELINE = 10
+DEFAULT_THRESHOLD = 0.25
+# Differences below these are noise, whatever the ratio
+MIN_STEP_DELTA = 2.0
+MIN_SPAN_DELTA = 1.0
+MIN_API_DELTA = 0.05
+TREND_LENGTH = 10
+SLOWEST_SPANS = 10
+SPARKS = '▁▂▃▄▅▆▇█'
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse_prom(text):
+    """
+    Samples of a Prometheus text-format file
+
+    Returns:
+        list: (name, labels dict, float value) tuples
+    """
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = {key: re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), raw)
+                  for key, raw in _LABEL.findall(labels or '')}
+        try:
+            samples.append((name, labels, float(value)))
+        except ValueError:
+            continue
+    return samples
+
+def bucket_quantile(buckets, q):
+    """
+    Estimate a quantile from cumulative histogram buckets (like PromQL's histogram_quantile)
+
+    Args:
+        buckets (list): (upper bound, cumulative count), ascending, ending with +Inf
+        q (float): Quantile, 0..1
+
+    Returns:
+        float: The estimate, or None without observations
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float('inf'):
+                # Past the last finite bucket: its bound is the best estimate
+                return lower
+            if count == below:
+                return bound
+            return lower + (bound - lower) * (rank - below) / (count - below)
+        lower, below = bound, count
+    return lower
+
+def _histograms(samples, name, key_labels):
+    """{key: {"buckets": [...], "sum", "count"}} for one histogram metric"""
+    found = {}
+    for sample_name, labels, value in samples:
+        if not sample_name.startswith(name):
+            continue
+        suffix = sample_name[len(name):]
+        key = tuple(labels.get(label, '') for label in key_labels)
+        entry = found.setdefault(key, {'buckets': [], 'sum': 0.0, 'count': 0})
+        if suffix == '_bucket':
+            entry['buckets'].append((float(labels['le']), value))
+        elif suffix == '_sum':
+            entry['sum'] = value
+        elif suffix == '_count':
+            entry['count'] = int(value)
+    return found
+
+def _latency(entry):
+    return {
+        'count': entry['count'],
+        'mean': round(entry['sum'] / entry['count'], 4) if entry['count'] else None,
+        'p50': _round(bucket_quantile(entry['buckets'], 0.5)),
+        'p95': _round(bucket_quantile(entry['buckets'], 0.95))
+    }
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+def collect_build(build, metrics_dir, since):
+    """
+    This build's record, from the metrics files written since `since`
+
+    Args:
+        build (str): Build number
+        metrics_dir (str): Directory of the pipeline_<step>.prom files
+        since (float): Unix time the build started
+
+    Returns:
+        dict: The history record
+    """
+    steps = {}
+    api = {}
+    browser = {'page_load': {}, 'driver_start': {}, 'webdriver_round_trips': 0}
+    for path in sorted(glob.glob(os.path.join(metrics_dir, 'pipeline_*.prom'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            samples = parse_prom(f.read())
+        values = {}
+        for name, labels, value in samples:
+            values.setdefault(name, []).append((labels, value))
+        finished = max((value for _, value in values.get('pipeline_step_last_run_timestamp_seconds', [])), default=0)
+        if finished < since:
+            continue
+        step = os.path.basename(path)[len('pipeline_'):-len('.prom')]
+        outcome = next((labels.get('outcome') for labels, _ in values.get('pipeline_step_success', [])), None)
+        steps[step] = {
+            'duration': next((value for _, value in values.get('pipeline_step_duration_seconds', [])), None),
+            'budget': next((value for _, value in values.get('pipeline_step_budget_seconds', [])), None),
+            'outcome': outcome,
+            'finished_at': finished,
+            'spans': {labels['label']: value for labels, value in values.get('pipeline_span_seconds', [])},
+            'span_calls': {labels['label']: int(value) for labels, value in values.get('pipeline_span_calls', [])}
+        }
+
+        for (method, endpoint), entry in _histograms(samples, 'boomlify_api_request_duration_seconds',
+                                                     ('method', 'endpoint')).items():
+            key = f"{method} {endpoint}"
+            record = api.setdefault(key, {'count': 0, 'errors': 0, 'bytes': 0, 'buckets': {}, 'sum': 0.0})
+            record['count'] += entry['count']
+            record['sum'] += entry['sum']
+            for bound, count in entry['buckets']:
+                record['buckets'][bound] = record['buckets'].get(bound, 0) + count
+        for labels, value in values.get('boomlify_api_requests_total', []):
+            record = api.get(f"{labels.get('method')} {labels.get('endpoint')}")
+            if record is not None and not labels.get('status', '').startswith('2'):
+                record['errors'] += int(value)
+        for labels, value in values.get('boomlify_api_response_bytes_total', []):
+            record = api.get(f"{labels.get('method')} {labels.get('endpoint')}")
+            if record is not None:
+                record['bytes'] += int(value)
+
+        for (page,), entry in _histograms(samples, 'browser_page_load_seconds', ('page',)).items():
+            browser['page_load'][page] = _latency(entry)
+        for (name, outcome_label), entry in _histograms(samples, 'browser_driver_start_seconds',
+                                                        ('browser', 'outcome')).items():
+            browser['driver_start'][f"{name} ({outcome_label})"] = _latency(entry)
+        browser['webdriver_round_trips'] += int(sum(value for _, value in values.get('webdriver_commands_total', [])))
+
+    for key, record in api.items():
+        buckets = sorted(record.pop('buckets').items())
+        latency = _latency({'buckets': buckets, 'sum': record.pop('sum'), 'count': record['count']})
+        record.update({name: latency[name] for name in ('mean', 'p50', 'p95')})
+
+    return {
+        'build': str(build),
+        'finished_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'steps': steps,
+        'api': dict(sorted(api.items())),
+        'browser': browser
+    }
+
+def history_path():
+    """Path of the history file"""
+    return os.environ.get(HISTORY_ENV) or DEFAULT_HISTORY
+
+def load_history(path):
+    """Records of earlier builds, oldest first (unreadable lines are skipped)"""
+    records = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return records
+
+def save_history(path, records, keep):
+    """Write the last `keep` records (atomically)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records[-keep:]:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+    os.replace(tmp_path, path)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None when empty)"""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def sparkline(values):
+    """Unicode sparkline of a series (oldest first)"""
+    values = [value for value in values if value is not None]
+    if not values:
+        return ''
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARKS[0] * len(values)
+    return ''.join(SPARKS[int((value - low) / (high - low) * (len(SPARKS) - 1))] for value in values)
+
+def _baseline(previous, pick):
+    values = [value for value in (pick(record) for record in previous) if value is not None]
+    return statistics.median(values) if values else None
+
+def _check(kind, name, current, baseline, threshold, min_delta):
+    if current is None or baseline is None or baseline <= 0:
+        return None
+    delta = current - baseline
+    if delta <= min_delta or current <= baseline * (1 + threshold):
+        return None
+    return {'kind': kind, 'name': name, 'current': round(current, 3), 'baseline': round(baseline, 3),
+            'change': round(delta / baseline, 3)}
+
+def analyze(current, history, baseline_builds=DEFAULT_BASELINE, threshold=DEFAULT_THRESHOLD):
+    """
+    Trends and regressions of the current build against the history
+
+    Args:
+        current (dict): This build's record
+        history (list): Earlier records, oldest first (the current build excluded)
+        baseline_builds (int): Previous builds whose median is the baseline
+        threshold (float): Relative slowdown that counts as a regression (0.25 = 25%)
+
+    Returns:
+        dict: steps (with p50/p95/trend), regressions, slowest_spans
+    """
+    window = history + [current]
+    # Only successful runs make a baseline: a failed step may stop early
+    def ok_runs(step):
+        return [record for record in history[-baseline_builds * 3:]
+                if (record.get('steps', {}).get(step) or {}).get('outcome') == 'ok'][-baseline_builds:]
+
+    steps = {}
+    regressions = []
+    for step, info in sorted(current['steps'].items()):
+        durations = [(record.get('steps', {}).get(step) or {}).get('duration') for record in window]
+        durations = [value for value in durations if value is not None]
+        previous = ok_runs(step)
+        baseline = _baseline(previous, lambda record: record['steps'][step].get('duration'))
+        steps[step] = {
+            'outcome': info.get('outcome'),
+            'duration': info.get('duration'),
+            'budget': info.get('budget'),
+            'p50': _round(percentile(durations, 50), 3),
+            'p95': _round(percentile(durations, 95), 3),
+            'baseline': _round(baseline, 3),
+            'runs': len(durations),
+            'trend': sparkline(durations[-TREND_LENGTH:])
+        }
+        if info.get('outcome') == 'ok':
+            found = _check('step', step, info.get('duration'), baseline, threshold, MIN_STEP_DELTA)
+            if found:
+                regressions.append(found)
+            for label, seconds in info.get('spans', {}).items():
+                span_baseline = _baseline(previous, lambda record: record['steps'][step].get('spans', {}).get(label))
+                found = _check('span', f"{step}: {label}", seconds, span_baseline, threshold, MIN_SPAN_DELTA)
+                if found:
+                    regressions.append(found)
+
+    for endpoint, stats in current.get('api', {}).items():
+        api_baseline = _baseline(history[-baseline_builds:],
+                                 lambda record: (record.get('api', {}).get(endpoint) or {}).get('p95'))
+        found = _check('api p95', endpoint, stats.get('p95'), api_baseline, threshold, MIN_API_DELTA)
+        if found:
+            regressions.append(found)
+
+    spans = []
+    for step, info in current['steps'].items():
+        for label, seconds in info.get('spans', {}).items():
+            spans.append({'step': step, 'label': label, 'seconds': seconds,
+                          'calls': info.get('span_calls', {}).get(label)})
+    spans.sort(key=lambda span: span['seconds'], reverse=True)
+    regressions.sort(key=lambda found: found['change'], reverse=True)
+    return {'steps': steps, 'regressions': regressions, 'slowest_spans': spans[:SLOWEST_SPANS]}
+
+def run_summary():
+    """What the build did, from the run state and the message store"""
+    signup = get_section('signup') or {}
+    activation = get_section('activation') or {}
+    summary = {
+        'email': get_email()[1],
+        'signup_success': signup.get('success'),
+        'activation_success': activation.get('success'),
+        'navigation': {page: {key: timing.get(key) for key in ('ttfb_ms', 'load_ms', 'driver_overhead_ms')}
+                       for page, timing in (get_section('navigation') or {}).items() if isinstance(timing, dict)},
+        'python': platform.python_version()
+    }
+    try:
+        from message_store import stored_ids
+        summary['stored_messages'] = len(list(stored_ids()))
+    except Exception:
+        summary['stored_messages'] = None
+    try:
+        import selenium
+        summary['selenium'] = selenium.__version__
+    except ImportError:
+        summary['selenium'] = None
+    return summary
+
+def _seconds(value):
+    return f"{value:.1f}s" if value is not None else '-'
+
+def _millis(value):
+    return f"{value * 1000:.0f}ms" if value is not None else '-'
+
+def render_markdown(report):
+    """The report as Markdown"""
+    current = report['current']
+    analysis = report['analysis']
+    lines = [f"# Build {current['build']} performance report", '',
+             f"Generated {report['generated_at']} from {report['history_builds']} builds of history.", '']
+
+    lines += ['## Steps', '',
+              f"| Step | Outcome | Duration | Budget | p50 | p95 | Baseline | Trend (last {TREND_LENGTH}) |",
+              '|---|---|---:|---:|---:|---:|---:|---|']
+    for step, info in analysis['steps'].items():
+        lines.append(f"| {step} | {info['outcome'] or '-'} | {_seconds(info['duration'])} | {_seconds(info['budget'])} "
+                     f"| {_seconds(info['p50'])} | {_seconds(info['p95'])} | {_seconds(info['baseline'])} | {info['trend']} |")
+    if not analysis['steps']:
+        lines.append('| (no step metrics for this build) | | | | | | | |')
+
+    lines += ['', '## Regressions', '']
+    if analysis['regressions']:
+        for found in analysis['regressions']:
+            unit = _millis if found['kind'] == 'api p95' else _seconds
+            lines.append(f"- ⚠️ **{found['kind']}** {found['name']}: {unit(found['current'])} "
+                         f"vs baseline {unit(found['baseline'])} (+{found['change'] * 100:.0f}%)")
+    else:
+        lines.append(f"None (threshold +{report['threshold'] * 100:.0f}% over the median of the last "
+                     f"{report['baseline_builds']} successful builds).")
+
+    lines += ['', '## Slowest spans', '', '| Step | Span | Calls | Time |', '|---|---|---:|---:|']
+    for span in analysis['slowest_spans']:
+        lines.append(f"| {span['step']} | {span['label']} | {span['calls'] or '-'} | {_seconds(span['seconds'])} |")
+
+    if current['api']:
+        lines += ['', '## Boomlify API', '', '| Endpoint | Calls | Errors | p50 | p95 | Bytes |',
+                  '|---|---:|---:|---:|---:|---:|']
+        for endpoint, stats in current['api'].items():
+            lines.append(f"| {endpoint} | {stats['count']} | {stats['errors']} | {_millis(stats['p50'])} "
+                         f"| {_millis(stats['p95'])} | {stats['bytes']} |")
+
+    browser = current['browser']
+    if browser['page_load'] or browser['driver_start']:
+        lines += ['', '## Browser', '']
+        for page, stats in browser['page_load'].items():
+            lines.append(f"- Page load {page}: {_seconds(stats['mean'])} ({stats['count']}x)")
+        for name, stats in browser['driver_start'].items():
+            lines.append(f"- Driver start {name}: {_seconds(stats['mean'])} ({stats['count']}x)")
+        for page, timing in report['run']['navigation'].items():
+            lines.append(f"- {page}: TTFB {timing.get('ttfb_ms')}ms, load {timing.get('load_ms')}ms, "
+                         f"driver overhead {timing.get('driver_overhead_ms')}ms")
+        if browser['webdriver_round_trips']:
+            lines.append(f"- WebDriver round trips: {browser['webdriver_round_trips']}")
+
+    run = report['run']
+    lines += ['', '## Run', '',
+              f"- Email: {run['email'] or '-'}",
+              f"- Signup succeeded: {run['signup_success']}",
+              f"- Activation succeeded: {run['activation_success']}",
+              f"- Stored messages: {run['stored_messages'] if run['stored_messages'] is not None else '-'}",
+              f"- Python {run['python']}, Selenium {run['selenium'] or 'not installed'}", '']
+    return '\n'.join(lines)
+
+def _since(value):
+    if value is None:
+        value = os.environ.get(STARTED_AT_ENV)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return datetime.datetime.now().timestamp() - DEFAULT_MAX_AGE
+    # Jenkins gives milliseconds
+    return value / 1000 if value > 1e11 else value
+
+def main(argv=None):
+    """Collect this build, update the history and write the reports"""
+    parser = argparse.ArgumentParser(description='Build performance report with history')
+    parser.add_argument('--build', default=os.environ.get('BUILD_NUMBER', 'local'), help='Build number')
+    parser.add_argument('--since', help=f'Unix time the build started (default: {STARTED_AT_ENV} or 2 hours ago)')
+    parser.add_argument('--metrics-dir', default=os.environ.get(pipeline_metrics.DIR_ENV) or '.',
+                        help='Directory of the pipeline_<step>.prom files')
+    parser.add_argument('--history', default=history_path(), help='History file')
+    parser.add_argument('--keep', type=int, default=int(os.environ.get(HISTORY_SIZE_ENV, DEFAULT_HISTORY_SIZE)),
+                        help='Builds kept in the history')
+    parser.add_argument('--baseline', type=int, default=DEFAULT_BASELINE, help='Builds in the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown over the baseline that counts as a regression (0.25 = 25%%)')
+    parser.add_argument('--out-dir', default='.', help='Directory for the report files')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 when a regression is found')
+    args = parser.parse_args(argv)
+
+    current = collect_build(args.build, args.metrics_dir, _since(args.since))
+    history = [record for record in load_history(args.history) if record.get('build') != current['build']]
+    analysis = analyze(current, history, args.baseline, args.threshold)
+    if current['steps']:
+        save_history(args.history, history + [current], max(args.keep, 1))
+    else:
+        print(f"⚠️ No step metrics newer than the build start in {os.path.abspath(args.metrics_dir)} - history unchanged")
+
+    report = {
+        'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'history_builds': len(history),
+        'baseline_builds': args.baseline,
+        'threshold': args.threshold,
+        'current': current,
+        'analysis': analysis,
+        'run': run_summary()
+    }
+    os.makedirs(args.out_dir, exist_ok=True)
+    base = os.path.join(args.out_dir, f"build_{args.build}_report")
+    markdown = render_markdown(report)
+    with open(f"{base}.md", 'w', encoding='utf-8') as f:
+        f.write(markdown)
+    with open(f"{base}.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(markdown)
+    print(f"📄 Reports: {base}.md, {base}.json (history: {args.history})")
+    if analysis['regressions']:
+        print(f"⚠️ {len(analysis['regressions'])} performance regression(s) against the baseline")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,55 @@
 import requests
+import contextlib
 import json
 import os
+import sys
+import datetime
+import activation_links
+import boomlify_api
+from step_profiler import profiled
+import deadline
+import webhook_receiver
+import activation_events
+import message_index
+import pipeline_metrics
+from pipeline_log import get_logger, clip
+from json_stream import iter_response_items, peek_member
+from mail_message import Message
+from run_state import get_email, state_path
+from temp_mailbox import seconds_remaining, format_remaining, next_poll_delay, POLL_MARGIN
+
+log = get_logger('check_messages')
 
 def read_email_info():
     """
-    Read email information from the text file created by create_email.py
+    Read email information from the run state saved by create_email.py
 
     Returns:
         tuple: (email_id, email_address) if successful, (None, None) if failed
     """
 
-    if not os.path.exists('email_info.txt'):
-        print("❌ Error: 'email_info.txt' file not found!")
-        print("💡 Please run 'create_email.py' first to create a temporary email")
-        return None, None
-
     try:
-        email_id = None
-        email_address = None
-        expires_at = None
+        email_id, email_address, expires_at = get_email()
 
-        with open('email_info.txt', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith('EMAIL_ID='):
-                    email_id = line.split('=', 1)[1]
-                elif line.startswith('EMAIL_ADDRESS='):
-                    email_address = line.split('=', 1)[1]
-                elif line.startswith('EXPIRES_AT='):
-                    expires_at = line.split('=', 1)[1]
+        if email_id is None and email_address is None:
+            log.error(f"❌ Error: no email information in '{state_path()}'!")
+            log.info("💡 Please run 'create_email.py' first to create a temporary email")
+            return None, None
 
         if email_id and email_address:
-            print("📂 Email information loaded from file:")
-            print(f"📧 Email Address: {email_address}")
-            print(f"🆔 Email ID: {email_id}")
+            log.info("📂 Email information loaded from run state:")
+            log.info(f"📧 Email Address: {email_address}")
+            log.info(f"🆔 Email ID: {email_id}")
             if expires_at:
-                print(f"⏰ Expires at: {expires_at}")
+                log.info(f"⏰ Expires at: {expires_at} ({format_remaining(seconds_remaining(expires_at))} left)")
 
             return email_id, email_address
         else:
-            print("❌ Error: Invalid email information in file")
+            log.error("❌ Error: Invalid email information in run state")
             return None, None
 
     except Exception as e:
-        print(f"❌ Error reading file: {e}")
+        log.error(f"❌ Error reading run state: {e}")
         return None, None
 
 def read_processed_messages():
@@ -64,7 +70,7 @@ def read_processed_messages():
                         message_id = line.split('=', 1)[1]
                         processed_ids.add(message_id)
         except Exception as e:
-            print(f"⚠️ Warning: Error reading message_ids.txt: {e}")
+            log.warning(f"⚠️ Warning: Error reading message_ids.txt: {e}")
 
     return processed_ids
 
@@ -74,144 +80,305 @@ def save_message_id(message_id, message_info):
 
     Args:
         message_id (str): The message ID
-        message_info (dict): Message information dictionary
+        message_info (Message): The message
     """
     try:
         with open('message_ids.txt', 'a') as f:
             # Write message ID and basic info
             f.write(f"MESSAGE_ID={message_id}\n")
-            f.write(f"FROM={message_info.get('from', 'N/A')}\n")
-            f.write(f"SUBJECT={message_info.get('subject', 'No Subject')}\n")
-            f.write(f"DATE={message_info.get('date', message_info.get('created_at', 'N/A'))}\n")
+            f.write(f"FROM={message_info.sender or 'N/A'}\n")
+            f.write(f"SUBJECT={message_info.subject or 'No Subject'}\n")
+            f.write(f"DATE={message_info.date or 'N/A'}\n")
             f.write(f"PROCESSED_AT={json.dumps({'timestamp': __import__('datetime').datetime.now().isoformat()})}\n")
             f.write("---\n")  # Separator between messages
 
-        print(f"💾 Message ID saved to message_ids.txt: {message_id}")
+        log.info(f"💾 Message ID saved to message_ids.txt: {message_id}")
 
     except Exception as e:
-        print(f"❌ Error saving message ID: {e}")
+        log.error(f"❌ Error saving message ID: {e}")
+
+def ingest_new_message(message, index):
+    """
+    Display a new message (bodies clipped - see pipeline_log) and save its ID
+
+    Args:
+        message (Message): Message from the API
+        index (int): Position among the new messages of this check
+    """
+    message_id = message.id or 'N/A'
+    sender = message.sender or 'N/A'
+    subject = message.subject or 'No Subject'
+    date = message.date or 'N/A'
+    content = message.text or ''
+    html_content = message.html or ''
+    attachments = message.attachments or []
+
+    lines = [
+        f"\n{'='*50}",
+        f"📨 New Message {index}",
+        f"{'='*50}",
+        f"🆔 Message ID: {message_id}",
+        f"📤 From: {clip(sender)}",
+        f"📧 To: {clip(message.recipient or 'N/A')}",
+        f"📋 Subject: {clip(subject)}",
+        f"📅 Date: {date}"
+    ]
+    if content:
+        lines.append(f"📄 Content ({len(content)} characters): {clip(content)}")
+    if html_content:
+        lines.append(f"🌐 HTML Content: Available ({len(html_content)} characters)")
+    if attachments:
+        lines.append(f"📎 Attachments: {len(attachments)} file(s)")
+
+    # One record per message keeps console writes (and the Jenkins log pipe) small
+    log.info('\n'.join(lines), extra={'summary': f"📨 New Message {index}", 'fields': {
+        'event': 'new_message',
+        'message_id': message_id,
+        'from': sender,
+        'subject': subject,
+        'date': date,
+        'content': content,
+        'content_length': len(content or ''),
+        'html_length': len(html_content or ''),
+        'attachments': len(attachments)
+    }})
+
+    # Save message ID to file
+    if message_id != 'N/A':
+        save_message_id(message_id, message)
+
+    # Hand the confirmation link to a waiting activation step straight away
+    activation_events.publish_message(message)
+
+    # Searchable from the moment it arrives (message_index.py search ...)
+    if message.id:
+        message_index.index_message(message)
 
 def get_email_messages(email_id, limit=25, offset=0):
     """
     Get messages for a temporary email using the Boomlify API and save new message IDs
 
+    The response is decoded incrementally: messages whose ID was already
+    processed are skipped without decoding their bodies, and new messages
+    are ingested as soon as they arrive, so memory use does not grow with
+    the size of the page.
+
     Args:
         email_id (str): The email ID from the text file
         limit (int): Maximum number of messages to retrieve (default: 25)
         offset (int): Number of messages to skip (default: 0)
 
     Returns:
-        list: List of new messages if successful, None if failed
+        list: List of new Message objects if successful, None if failed
     """
 
     if not email_id:
-        print("❌ Error: No email ID provided")
+        log.error("❌ Error: No email ID provided")
         return None
 
     # Read already processed message IDs
     processed_ids = read_processed_messages()
 
     # API endpoint with email_id
-    url = f'https://boomlify-temp-mail-api2.p.rapidapi.com/api/v1/emails/{email_id}/messages?limit={limit}&offset={offset}'
-
-    # Headers
-    headers = {
-        'x-rapidapi-host': 'boomlify-temp-mail-api2.p.rapidapi.com',
-        'x-rapidapi-key': 'c815bd8438mshaec3510f9c39d67p1b034bjsn3f4575728890'
-    }
+    path = f'emails/{email_id}/messages?limit={limit}&offset={offset}'
 
     try:
-        print("🔄 Checking for new messages...")
+        log.info("🔄 Checking for new messages...")
 
-        # Make the GET request
-        response = requests.get(url, headers=headers)
+        # Make the GET request (body is streamed, see json_stream)
+        response = boomlify_api.request('GET', path, stream=True)
 
         # Check if request was successful
         if response.status_code == 200:
-            # Parse the JSON response
-            result = response.json()
-
-            # Handle both possible response structures
-            messages = []
-            if isinstance(result, dict):
-                messages = result.get('messages', result.get('data', []))
-            elif isinstance(result, list):
-                messages = result
-
-            print(f"✅ Messages check completed!")
-            print(f"📬 Total messages found: {len(messages)}")
-
-            # Filter new messages
+            # Handles both {"messages": [...]}/{"data": [...]} and a bare list
+            total_messages = 0
             new_messages = []
-            for message in messages:
-                message_id = message.get('id')
-                if message_id and message_id not in processed_ids:
-                    new_messages.append(message)
-
-            print(f"🆕 New messages: {len(new_messages)}")
-
-            # Display and save new messages
-            if new_messages:
-                print("\n📧 New Messages:")
-                for i, message in enumerate(new_messages, 1):
-                    message_id = message.get('id', 'N/A')
-
-                    print(f"\n{'='*50}")
-                    print(f"📨 New Message {i}")
-                    print(f"{'='*50}")
-                    print(f"🆔 Message ID: {message_id}")
-                    print(f"📤 From: {message.get('from', message.get('sender', 'N/A'))}")
-                    print(f"📧 To: {message.get('to', 'N/A')}")
-                    print(f"📋 Subject: {message.get('subject', 'No Subject')}")
-                    print(f"📅 Date: {message.get('date', message.get('created_at', 'N/A'))}")
-
-                    # Show content if available
-                    content = message.get('text', message.get('body', message.get('content', '')))
-                    if content:
-                        print(f"📄 Content:")
-                        print(f"{content}")
-
-                    # Show HTML content info if available
-                    html_content = message.get('html', message.get('html_body', ''))
-                    if html_content:
-                        print(f"🌐 HTML Content: Available ({len(html_content)} characters)")
-
-                    # Show attachments if any
-                    attachments = message.get('attachments', [])
-                    if attachments:
-                        print(f"📎 Attachments: {len(attachments)} file(s)")
-
-                    # Save message ID to file
-                    if message_id != 'N/A':
-                        save_message_id(message_id, message)
-
-            elif len(messages) > 0:
-                print("📭 No new messages (all messages already processed)")
-                print(f"💡 Processed message IDs are stored in message_ids.txt")
-            else:
-                print("📭 No messages found")
-                print("💡 Tip: Send an email to your temporary address and run this script again")
+            items = iter_response_items(response, check=deadline.checker('reading messages'))
+            for raw_message in items:
+                total_messages += 1
+                message_id = peek_member(raw_message, 'id')
+                if not message_id or message_id in processed_ids:
+                    continue
+
+                message = Message.from_json(raw_message)
+                processed_ids.add(message_id)
+                new_messages.append(message)
+
+                if len(new_messages) == 1:
+                    log.info("\n📧 New Messages:")
+                ingest_new_message(message, len(new_messages))
+
+            log.info(f"✅ Messages check completed!")
+            log.info(f"📬 Total messages found: {total_messages}")
+            log.info(f"🆕 New messages: {len(new_messages)}")
+
+            if not new_messages and total_messages > 0:
+                log.info("📭 No new messages (all messages already processed)")
+                log.info(f"💡 Processed message IDs are stored in message_ids.txt")
+            elif not new_messages:
+                log.info("📭 No messages found")
+                log.info("💡 Tip: Send an email to your temporary address and run this script again")
 
             return new_messages
 
         else:
-            print(f"❌ Error: HTTP {response.status_code}")
-            print(f"Response: {response.text}")
+            log.error(f"❌ Error: HTTP {response.status_code}")
+            log.error(f"Response: {clip(response.text)}")
             return None
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ Request failed: {e}")
+        log.error(f"❌ Request failed: {e}")
         return None
     except json.JSONDecodeError as e:
-        print(f"❌ Failed to parse JSON response: {e}")
+        log.error(f"❌ Failed to parse JSON response: {e}")
         return None
 
+def ingest_pushed_messages(messages):
+    """
+    Ingest messages delivered by the webhook receiver
+
+    Args:
+        messages (list): Pushed Message objects
+
+    Returns:
+        list: The messages that were not processed before
+    """
+    processed_ids = read_processed_messages()
+    new_messages = []
+    for message in messages:
+        if not message.id or message.id in processed_ids:
+            continue
+        processed_ids.add(message.id)
+        new_messages.append(message)
+        if len(new_messages) == 1:
+            log.info("\n📡 Pushed Messages:")
+        ingest_new_message(message, len(new_messages))
+    return new_messages
+
+def watch_messages(email_id, expires_at=None, duration=120, interval=10, stop_on_new=True, receiver=None,
+                   stop_event=None):
+    """
+    Poll a mailbox until new messages arrive, the watch ends or the mailbox expires
+
+    Polls are scheduled so that none is sent within POLL_MARGIN seconds of
+    the mailbox expiry, and spaced out when the API quota would not last
+    the watch at `interval`; the time remaining is logged before every poll.
+
+    With a webhook receiver (see webhook_receiver; started here when
+    WEBHOOK_PORT is set) the watch waits for pushes between polls: pushed
+    messages are ingested the moment they arrive, a bare notification
+    triggers an immediate poll, and polling only continues as a fallback
+    every WEBHOOK_FALLBACK_INTERVAL seconds.
+
+    Args:
+        email_id (str): The email ID from the run state
+        expires_at (str): Mailbox expiry (default: read from the run state)
+        duration (float): Maximum seconds to watch (0 = a single poll)
+        interval (float): Seconds between polls
+        stop_on_new (bool): Stop after the first poll that finds new messages
+        receiver (WebhookReceiver): Running receiver to wait on (default: from WEBHOOK_*)
+        stop_event (threading.Event): Ends the watch early when set (checked between polls)
+
+    Returns:
+        list: New messages found during the watch, None if every poll failed
+    """
+    if expires_at is None:
+        expires_at = get_email()[2]
+
+    remaining = seconds_remaining(expires_at)
+    if remaining is not None and remaining <= POLL_MARGIN:
+        log.warning(f"⌛ Mailbox {'expired' if remaining <= 0 else 'about to expire'} - not polling it")
+        log.info("💡 Run 'create_email.py' to get a new temporary email")
+        return []
+
+    with contextlib.ExitStack() as stack:
+        if receiver is None and duration > 0:
+            receiver = stack.enter_context(webhook_receiver.receiving(email_id))
+        if duration > 0:
+            stack.enter_context(pipeline_metrics.serving())
+        return _watch(email_id, expires_at, duration, interval, stop_on_new, receiver, stop_event)
+
+def _watch(email_id, expires_at, duration, interval, stop_on_new, receiver, stop_event):
+    watch_end = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=max(duration, 0))
+    if receiver is not None:
+        interval = max(interval, webhook_receiver.fallback_interval())
+    found = []
+    polls = 0
+    failures = 0
+    poll_now = True
+
+    while stop_event is None or not stop_event.is_set():
+        if poll_now:
+            log.info(f"⏳ Mailbox time remaining: {format_remaining(seconds_remaining(expires_at))}")
+            new_messages = get_email_messages(email_id)
+            polls += 1
+            pipeline_metrics.MAIL_POLLS.inc(outcome='error' if new_messages is None else 'ok')
+            if new_messages is None:
+                failures += 1
+            else:
+                if new_messages and not found:
+                    pipeline_metrics.POLLS_TO_FIRST_MAIL.observe(polls)
+                found.extend(new_messages)
+                if new_messages and stop_on_new:
+                    break
+
+            quota = boomlify_api.quota_status()
+            if quota['budget_left'] is not None and quota['budget_left'] <= 0:
+                log.warning("🚫 Daily Boomlify request budget used up - stopping the watch")
+                break
+
+        # Poll less often when the remaining quota would not last the watch
+        now = datetime.datetime.now(datetime.timezone.utc)
+        horizon = (watch_end - now).total_seconds()
+        remaining = seconds_remaining(expires_at)
+        if remaining is not None:
+            horizon = min(horizon, remaining - POLL_MARGIN)
+        poll_interval = boomlify_api.stretch_interval(interval, horizon)
+        if poll_interval > interval and poll_now:
+            quota = boomlify_api.quota_status()
+            log.info(f"🐢 Stretching poll interval to {poll_interval:.0f}s to stay within the API quota "
+                     f"(remaining: {quota['remaining']}, daily budget left: {quota['budget_left']})")
+
+        # Never schedules a poll inside the expiry margin or past the deadline
+        delay = next_poll_delay(poll_interval, expires_at, watch_end)
+        if delay is None:
+            if datetime.datetime.now(datetime.timezone.utc) < watch_end:
+                log.warning("⌛ Mailbox about to expire - not polling it again")
+            break
+
+        if receiver is None:
+            log.info(f"💤 Next check in {delay:.0f}s")
+            if stop_event is None:
+                deadline.sleep(delay, 'watch interval')
+            else:
+                with deadline.span('watch interval'):
+                    stop_event.wait(deadline.wait_timeout(delay, 'watch interval'))
+            continue
+
+        if poll_now:
+            log.info(f"📡 Waiting for pushed messages (fallback poll in {delay:.0f}s)")
+        pushed, pinged = receiver.wait(delay)
+        new_messages = ingest_pushed_messages(pushed)
+        if new_messages and not found:
+            pipeline_metrics.POLLS_TO_FIRST_MAIL.observe(polls)
+        found.extend(new_messages)
+        if (new_messages and stop_on_new) or (stop_event is not None and stop_event.is_set()):
+            break
+        if pinged:
+            log.info("📡 New-mail notification received - checking now")
+        # Poll on a bare notification or when the wait timed out
+        poll_now = pinged or not pushed
+
+    if polls and failures == polls and not found:
+        return None
+    return found
+
 def show_message_ids_summary():
     """
     Show summary of all processed message IDs
     """
     if not os.path.exists('message_ids.txt'):
-        print("📄 No message_ids.txt file found - no messages processed yet")
+        log.info("📄 No message_ids.txt file found - no messages processed yet")
         return
 
     try:
@@ -220,9 +387,9 @@ def show_message_ids_summary():
             content = f.read()
             message_count = content.count('MESSAGE_ID=')
 
-        print(f"\n📊 Message IDs Summary:")
-        print(f"📄 File: message_ids.txt")
-        print(f"📈 Total processed messages: {message_count}")
+        log.info(f"\n📊 Message IDs Summary:")
+        log.info(f"📄 File: message_ids.txt")
+        log.info(f"📈 Total processed messages: {message_count}")
 
         # Show last few message IDs
         message_ids = []
@@ -233,15 +400,15 @@ def show_message_ids_summary():
                     message_ids.append(message_id)
 
         if message_ids:
-            print(f"\n🆔 Recent Message IDs:")
+            log.info(f"\n🆔 Recent Message IDs:")
             for i, msg_id in enumerate(message_ids[-5:], 1):  # Show last 5
-                print(f"  {i}. {msg_id}")
+                log.info(f"  {i}. {msg_id}")
 
             if len(message_ids) > 5:
-                print(f"  ... and {len(message_ids) - 5} more")
+                log.info(f"  ... and {len(message_ids) - 5} more")
 
     except Exception as e:
-        print(f"❌ Error reading message summary: {e}")
+        log.error(f"❌ Error reading message summary: {e}")
 
 def check_messages_continuously():
     """
@@ -252,11 +419,11 @@ def check_messages_continuously():
     if not email_id:
         return
 
-    print(f"\n🔄 Monitoring messages for: {email_address}")
-    print("\n🎯 Options:")
-    print("  1. Check once and exit")
-    print("  2. Check continuously (press Enter to check again, 'q' to quit)")
-    print("  3. Show message IDs summary")
+    log.info(f"\n🔄 Monitoring messages for: {email_address}")
+    log.info("\n🎯 Options:")
+    log.info("  1. Check once and exit")
+    log.info("  2. Check continuously (press Enter to check again, 'q' to quit)")
+    log.info("  3. Show message IDs summary")
 
     choice = input("\nChoose option (1, 2, or 3): ").strip()
 
@@ -264,14 +431,20 @@ def check_messages_continuously():
         get_email_messages(email_id)
         show_message_ids_summary()
     elif choice == "2":
-        print("\n🔄 Continuous monitoring started...")
-        print("💡 Press Enter to check for new messages, type 'q' and Enter to quit, 's' for summary")
+        log.info("\n🔄 Continuous monitoring started...")
+        log.info("💡 Press Enter to check for new messages, type 'q' and Enter to quit, 's' for summary")
 
         while True:
-            user_input = input("\nPress Enter to check messages ('q' to quit, 's' for summary): ").strip().lower()
+            remaining = seconds_remaining(get_email()[2])
+            if remaining is not None and remaining <= POLL_MARGIN:
+                log.warning("⌛ Mailbox expired - stopping the monitor")
+                log.info("💡 Run 'create_email.py' to get a new temporary email")
+                break
+
+            user_input = input(f"\nPress Enter to check messages ('q' to quit, 's' for summary) [{format_remaining(remaining)} left]: ").strip().lower()
 
             if user_input == 'q':
-                print("👋 Goodbye!")
+                log.info("👋 Goodbye!")
                 break
             elif user_input == 's':
                 show_message_ids_summary()
@@ -280,14 +453,21 @@ def check_messages_continuously():
     elif choice == "3":
         show_message_ids_summary()
     else:
-        print("❌ Invalid choice, checking once...")
+        log.error("❌ Invalid choice, checking once...")
         get_email_messages(email_id)
         show_message_ids_summary()
 
 def main():
     """Main function"""
-    print("🚀 Starting message checker with ID tracking...")
+    log.info("🚀 Starting message checker with ID tracking...")
+    # A bad ACTIVATION_SITE(S) stops the step here rather than in the middle of ingest
+    try:
+        activation_links.matcher()
+    except ValueError as e:
+        log.error(f"❌ {e}")
+        sys.exit(1)
     check_messages_continuously()
 
 if __name__ == "__main__":
-    main()
+    with profiled('check_messages'), deadline.step_deadline('check_messages'):
+        main()
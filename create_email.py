@@ -1,21 +1,17 @@
 import requests
 import json
+import sys
+import boomlify_api
+from step_profiler import profiled
+import deadline
+from run_state import clear_section, save_section, state_path
+from temp_mailbox import reusable_mailbox, seconds_remaining, format_remaining, min_remaining
 
 def create_temp_email():
     """
-    Create a temporary email using the Boomlify API and save email ID and address to text file
+    Create a temporary email using the Boomlify API and save email ID and address to the run state
     """
 
-    # API endpoint
-    url = 'https://boomlify-temp-mail-api2.p.rapidapi.com/api/v1/emails/create?time=10min'
-
-    # Headers
-    headers = {
-        'Content-Type': 'application/json',
-        'x-rapidapi-host': 'boomlify-temp-mail-api2.p.rapidapi.com',
-        'x-rapidapi-key': 'c815bd8438mshaec3510f9c39d67p1b034bjsn3f4575728890'
-    }
-
     # Data payload
     data = {
         "key1": "value",
@@ -23,8 +19,8 @@ def create_temp_email():
     }
 
     try:
-        # Make the POST request
-        response = requests.post(url, headers=headers, json=data)
+        # Make the POST request (paced by the API rate limiter)
+        response = boomlify_api.request('POST', 'emails/create?time=10min', json_body=data)
 
         # Check if request was successful (200 or 201 for creation)
         if response.status_code in [200, 201]:
@@ -43,13 +39,16 @@ def create_temp_email():
                 print(f"🆔 Email ID: {email_id}")
                 print(f"⏰ Expires at: {expires_at}")
 
-                # Save to text file
-                with open('email_info.txt', 'w') as f:
-                    f.write(f"EMAIL_ID={email_id}\n")
-                    f.write(f"EMAIL_ADDRESS={email_address}\n")
-                    f.write(f"EXPIRES_AT={expires_at}\n")
+                # Save to the run state
+                save_section('email', {
+                    'id': email_id,
+                    'address': email_address,
+                    'expires_at': expires_at
+                })
+                # An activation link recorded for the previous mailbox is spent
+                clear_section('activation')
 
-                print("💾 Email information saved to 'email_info.txt'")
+                print(f"💾 Email information saved to '{state_path()}'")
 
                 return email_id, email_address
             else:
@@ -69,18 +68,42 @@ def create_temp_email():
         print(f"❌ Failed to parse JSON response: {e}")
         return None, None
 
-def main():
-    """Main function"""
+def get_or_create_mailbox(force_new=False):
+    """
+    Reuse the saved mailbox while it has enough lifetime left, otherwise create one
+
+    Args:
+        force_new (bool): Always create a new mailbox
+
+    Returns:
+        tuple: (email_id, email_address) if successful, (None, None) if failed
+    """
+    if not force_new:
+        email_id, email_address, expires_at = reusable_mailbox()
+        if email_id:
+            print("♻️ Reusing existing temporary email (still valid)")
+            print(f"📧 Email Address: {email_address}")
+            print(f"🆔 Email ID: {email_id}")
+            print(f"⏰ Expires at: {expires_at} ({format_remaining(seconds_remaining(expires_at))} left)")
+            return email_id, email_address
+        print(f"🆕 No saved email with at least {format_remaining(min_remaining())} left")
+
     print("🚀 Creating temporary email...")
-    email_id, email_address = create_temp_email()
+    return create_temp_email()
+
+def main():
+    """Main function (pass --new to skip reusing a saved mailbox)"""
+    email_id, email_address = get_or_create_mailbox(force_new='--new' in sys.argv[1:])
 
     if email_id and email_address:
         print(f"\n🎉 Success!")
         print(f"📧 You can now send emails to: {email_address}")
-        print("📂 Email details saved to: email_info.txt")
+        print(f"📂 Email details saved to: {state_path()}")
         print("\n📝 Next step: Run 'check_messages.py' to check for new messages")
     else:
         print("\n❌ Failed to create temporary email")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    with profiled('create_email'), deadline.step_deadline('create_email'):
+        main()
@@ -0,0 +1,262 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import pipeline_metrics
+from pipeline_log import get_logger
+
+log = get_logger('deadline')
+
+# Per-step time budgets.
+#
+# Each entry point runs inside step_deadline('<step>'), which starts a
+# Deadline with the step's budget in seconds: DEADLINE_<STEP> from the
+# environment (e.g. DEADLINE_CHECK_MESSAGES=270), else STEP_BUDGETS below.
+# The budgets sit a little under the Jenkinsfile's `timeout 300s/600s`
+# wrappers so a step ends itself, with a report, before Jenkins kills it.
+#
+# Every HTTP call takes its (connect, read) timeouts from the remaining
+# budget (http_timeout), every WebDriver wait and sleep is capped by it
+# (wait_timeout, sleep), and the time spent is recorded per label. When
+# the budget runs out DeadlineExceeded is raised - it is a
+# requests.exceptions.Timeout, so the scripts' existing request error
+# handling reports it - and the breakdown of where the time went is
+# logged (with LOG_FORMAT=json, as one record with a field per label).
+#
+# Outside step_deadline() (e.g. interactive use) the helpers fall back to
+# the default timeouts and never raise.
+#
+# When the step ends its metrics are written to pipeline_<step>.prom
+# (see pipeline_metrics.py).
+DEADLINE_ENV_PREFIX = 'DEADLINE_'
+STEP_BUDGETS = {
+    'create_email': 60,
+    'website_signup': 540,
+    'check_messages': 270,
+    'get_message_details': 540,
+    'activate_account': 540
+}
+DEFAULT_BUDGET = 300
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+
+_stack = []
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """A step ran out of its time budget"""
+
+class Deadline:
+    def __init__(self, step, budget):
+        """
+        Time budget of one pipeline step
+
+        Args:
+            step (str): Step name, used in reports
+            budget (float): Seconds the step may take
+        """
+        self.step = step
+        self.budget = float(budget)
+        self.started = time.monotonic()
+        self.expires = self.started + self.budget
+        self.lock = threading.Lock()
+        self.spent = {}
+        self.reported = False
+
+    def remaining(self):
+        """Seconds left (never negative)"""
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def elapsed(self):
+        """Seconds since the step started"""
+        return time.monotonic() - self.started
+
+    def record(self, label, seconds):
+        """Add time spent on `label` to the breakdown"""
+        with self.lock:
+            total, count = self.spent.get(label, (0.0, 0))
+            self.spent[label] = (total + seconds, count + 1)
+
+    def check(self, label):
+        """
+        Raise if the budget is used up
+
+        Args:
+            label (str): What was about to run (named in the error)
+        """
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"{self.step}: {self.budget:.0f}s budget used up before {label}")
+
+    @contextlib.contextmanager
+    def span(self, label):
+        """Record the time spent in the block under `label`"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(label, time.monotonic() - start)
+
+    def report(self):
+        """
+        Where the time went
+
+        Returns:
+            str: Multi-line breakdown, largest first
+        """
+        with self.lock:
+            spent = sorted(self.spent.items(), key=lambda item: item[1][0], reverse=True)
+        elapsed = self.elapsed()
+        lines = [f"⏱️ Time budget for {self.step}: {elapsed:.1f}s used of {self.budget:.0f}s"]
+        accounted = 0.0
+        for label, (total, count) in spent:
+            accounted += total
+            lines.append(f"   {total:>8.1f}s  {count:>4}x  {label}")
+        lines.append(f"   {max(elapsed - accounted, 0):>8.1f}s         (untracked)")
+        return '\n'.join(lines)
+
+    def log_report(self, level, headline):
+        """Log the report under a headline (JSON logs get the seconds per label as fields)"""
+        with self.lock:
+            fields = {f"spent.{label}": round(total, 3) for label, (total, _) in self.spent.items()}
+        fields.update({'step': self.step, 'elapsed': round(self.elapsed(), 3), 'budget': self.budget})
+        log.log(level, f"{headline}\n{self.report()}", extra={'summary': headline, 'fields': fields})
+
+def current():
+    """The active step deadline (shared by all threads of the step), or None"""
+    return _stack[-1] if _stack else None
+
+def step_budget(step):
+    """Budget in seconds for a step (DEADLINE_<STEP> overrides STEP_BUDGETS)"""
+    value = os.environ.get(f"{DEADLINE_ENV_PREFIX}{step.upper()}")
+    try:
+        return float(value) if value else STEP_BUDGETS.get(step, DEFAULT_BUDGET)
+    except ValueError:
+        return STEP_BUDGETS.get(step, DEFAULT_BUDGET)
+
+@contextlib.contextmanager
+def step_deadline(step, budget=None):
+    """
+    Run a pipeline step under a time budget
+
+    Logs the breakdown of where the time went if the budget runs out,
+    and writes the step's metrics when it ends.
+
+    Args:
+        step (str): Step name
+        budget (float): Seconds (default: step_budget(step))
+    """
+    deadline = Deadline(step, step_budget(step) if budget is None else budget)
+    _stack.append(deadline)
+    pipeline_metrics.begin_step(step)
+    outcome = 'ok'
+    try:
+        yield deadline
+    except DeadlineExceeded:
+        outcome = 'timeout'
+        deadline.log_report(logging.ERROR, f"⌛ {step} ran out of time")
+        deadline.reported = True
+        raise
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            outcome = 'failed'
+        raise
+    except BaseException:
+        outcome = 'failed'
+        raise
+    finally:
+        _stack.remove(deadline)
+        if not deadline.reported and deadline.remaining() <= 0:
+            deadline.log_report(logging.WARNING, f"⌛ {step} used up its time budget")
+        with deadline.lock:
+            spent = dict(deadline.spent)
+        pipeline_metrics.end_step(step, deadline.elapsed(), deadline.budget, outcome, spent)
+
+def http_timeout(label, connect=CONNECT_TIMEOUT, read=READ_TIMEOUT):
+    """
+    (connect, read) timeouts for one HTTP call
+
+    Args:
+        label (str): What the call is for (recorded against the deadline)
+        connect (float): Maximum connect timeout
+        read (float): Maximum read timeout
+
+    Returns:
+        tuple: (connect, read) seconds, capped by the remaining budget
+    """
+    deadline = current()
+    if deadline is None:
+        return (connect, read)
+    deadline.check(label)
+    remaining = deadline.remaining()
+    return (min(connect, remaining), min(read, remaining))
+
+def wait_timeout(seconds, label='WebDriver wait'):
+    """
+    Timeout for a WebDriverWait (or any bounded wait)
+
+    Args:
+        seconds (float): Timeout the code would normally use
+        label (str): What is being waited for
+
+    Returns:
+        float: `seconds`, capped by the remaining budget
+    """
+    deadline = current()
+    if deadline is None:
+        return seconds
+    deadline.check(label)
+    return min(seconds, deadline.remaining())
+
+def sleep(seconds, label='sleep'):
+    """Sleep for `seconds`, or until the budget runs out, and record it"""
+    deadline = current()
+    if deadline is None:
+        time.sleep(seconds)
+        return
+    deadline.check(label)
+    seconds = min(seconds, deadline.remaining())
+    with deadline.span(label):
+        time.sleep(seconds)
+
+@contextlib.contextmanager
+def span(label):
+    """Record the block's time against the active deadline (no-op without one)"""
+    deadline = current()
+    if deadline is None:
+        yield
+        return
+    deadline.check(label)
+    with deadline.span(label):
+        yield
+
+def checker(label):
+    """
+    Callable that raises DeadlineExceeded once the budget is used up
+
+    Returns:
+        callable: For json_stream's check= hooks, or None without a deadline
+    """
+    deadline = current()
+    if deadline is None:
+        return None
+    return lambda: deadline.check(label)
+
+def bound_driver(driver, label='page load'):
+    """
+    Cap a WebDriver's page load and script timeouts at the remaining budget
+
+    Call before navigations so driver.get() cannot outlive the step.
+    """
+    deadline = current()
+    if deadline is None or driver is None:
+        return
+    deadline.check(label)
+    seconds = max(deadline.remaining(), 1)
+    try:
+        driver.set_page_load_timeout(seconds)
+        driver.set_script_timeout(seconds)
+    except Exception:
+        pass
@@ -1,5 +1,4 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
@@ -9,6 +8,8 @@ import os
 import subprocess
 import sys
 import getpass
+from step_profiler import profiled
+import page_objects
 
 class EmbyILRegistration:
     def __init__(self, headless=True):
@@ -177,127 +178,30 @@ class EmbyILRegistration:
             self.driver.save_screenshot("before_filling.png")
             print("📸 Screenshot saved: before_filling.png")
 
-            # Common field selectors to try
-            field_selectors = {
-                'first_name': [
-                    'input[name="firstName"]',
-                    'input[name="first_name"]', 
-                    'input[id*="first"]',
-                    'input[placeholder*="שם פרטי"]',
-                    'input[placeholder*="First Name"]',
-                    'input[placeholder*="First"]',
-                    'input[type="text"]:nth-of-type(1)'
-                ],
-                'last_name': [
-                    'input[name="lastName"]',
-                    'input[name="last_name"]',
-                    'input[id*="last"]', 
-                    'input[placeholder*="שם משפחה"]',
-                    'input[placeholder*="Last Name"]',
-                    'input[placeholder*="Last"]',
-                    'input[type="text"]:nth-of-type(2)'
-                ],
-                'email': [
-                    'input[name="email"]',
-                    'input[type="email"]',
-                    'input[id*="email"]',
-                    'input[placeholder*="אימייל"]',
-                    'input[placeholder*="Email"]',
-                    'input[placeholder*="mail"]'
-                ],
-                'password': [
-                    'input[name="password"]',
-                    'input[type="password"]',
-                    'input[id*="password"]',
-                    'input[placeholder*="סיסמה"]',
-                    'input[placeholder*="Password"]'
-                ],
-                'password_confirm': [
-                    'input[name="password1"]',
-                    'input[name="confirmPassword"]',
-                    'input[name="password_confirmation"]',
-                    'input[name="confirm_password"]',
-                    'input[id*="password1"]',
-                    'input[id*="confirm"]',
-                    'input[placeholder*="אישור סיסמה"]',
-                    'input[placeholder*="Confirm Password"]',
-                    'input[placeholder*="Repeat Password"]',
-                    'input[type="password"]:nth-of-type(2)'
-                ]
-            }
-
-            # Fill first name
-            print("📝 Filling first name...")
-            first_name_field = self.find_element_by_selectors(field_selectors['first_name'])
-            if first_name_field:
-                first_name_field.clear()
-                first_name_field.send_keys(first_name)
-                print("✅ First name filled successfully")
-            else:
-                print("❌ First name field not found")
-
-            # Fill last name  
-            print("📝 Filling last name...")
-            last_name_field = self.find_element_by_selectors(field_selectors['last_name'])
-            if last_name_field:
-                last_name_field.clear()
-                last_name_field.send_keys(last_name)
-                print("✅ Last name filled successfully")
-            else:
-                print("❌ Last name field not found")
-
-            # Fill email
-            print("📝 Filling email...")
-            email_field = self.find_element_by_selectors(field_selectors['email'])
-            if email_field:
-                email_field.clear()
-                email_field.send_keys(email)
-                print("✅ Email filled successfully")
-            else:
-                print("❌ Email field not found")
-
-            # Fill password
-            print("📝 Filling password...")
-            password_field = self.find_element_by_selectors(field_selectors['password'])
-            if password_field:
-                password_field.clear()
-                password_field.send_keys(password)
-                print("✅ Password filled successfully")
-            else:
-                print("❌ Password field not found")
-
-            # Fill password confirmation
-            print("📝 Filling password confirmation...")
-            password_confirm_field = self.find_element_by_selectors(field_selectors['password_confirm'])
-            if password_confirm_field:
-                password_confirm_field.clear()
-                password_confirm_field.send_keys(password_confirm)
-                print("✅ Password confirmation filled successfully")
-            else:
-                print("❌ Password confirmation field not found")
+            # One snapshot resolves every field (see page_objects.py)
+            page = page_objects.take(self.driver, page_objects.SIGN_UP, timeout=15)
+            field_data = [
+                ('first_name', 'first name', first_name),
+                ('last_name', 'last name', last_name),
+                ('email', 'email', email),
+                ('password', 'password', password),
+                ('password_confirm', 'password confirmation', password_confirm)
+            ]
+            for field_name, label, value in field_data:
+                print(f"📝 Filling {label}...")
+                field = page.element(field_name)
+                if field:
+                    field.clear()
+                    field.send_keys(value)
+                    print(f"✅ {label.capitalize()} filled successfully")
+                else:
+                    print(f"❌ {label.capitalize()} field not found")
 
             # Check for any error messages before submitting
             print("🔍 Checking for pre-submit errors...")
-            error_selectors = [
-                '.error',
-                '.error-message', 
-                '[class*="error"]',
-                '.alert-danger',
-                '.validation-error',
-                '.field-error',
-                '.invalid-feedback',
-                '.form-error'
-            ]
-            
-            for selector in error_selectors:
-                try:
-                    errors = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    if errors:
-                        for error in errors:
-                            if error.is_displayed() and error.text.strip():
-                                print(f"⚠️ Pre-submit error found: {error.text}")
-                except:
-                    continue
+            page = page.refresh(timeout=5, wait_for=('submit',))
+            for error in page.texts('errors'):
+                print(f"⚠️ Pre-submit error found: {error}")
 
             # Take screenshot before clicking submit
             self.driver.save_screenshot("before_submit.png")
@@ -308,93 +212,16 @@ class EmbyILRegistration:
 
             # First, let's see what buttons are available
             print("🔍 Scanning all buttons on page...")
-            all_buttons = self.driver.find_elements(By.TAG_NAME, "button")
-            all_inputs = self.driver.find_elements(By.CSS_SELECTOR, "input[type='submit'], input[type='button']")
-
-            print(f"Found {len(all_buttons)} buttons and {len(all_inputs)} input buttons")
-
-            for i, element in enumerate(all_buttons + all_inputs):
-                try:
-                    if element.is_displayed():
-                        text = element.text or element.get_attribute('value') or 'No text'
-                        classes = element.get_attribute('class') or ''
-                        data_slot = element.get_attribute('data-slot') or ''
-                        print(f"   Button {i+1}: '{text}' | class='{classes}' | data-slot='{data_slot}'")
-                except:
-                    pass
-
-            # Enhanced button selectors
-            xpath_selectors = [
-                # XPath for Hebrew text
-                "//button[contains(text(), 'הרשמה')]",
-                "//input[@value='הרשמה']",
-                "//button[contains(text(), 'רישום')]",
-                "//input[@value='רישום']",
-                "//button[contains(text(), 'Sign Up')]",
-                "//button[contains(text(), 'Register')]",
-                "//button[contains(text(), 'Submit')]"
-            ]
-
-            css_selectors = [
-                '[data-slot="button"]',
-                'button[data-slot="button"]', 
-                'input[data-slot="button"]',
-                'button[type="submit"]',
-                'input[type="submit"]',
-                '.submit-button',
-                '.register-button',
-                '.signup-button',
-                '.btn-submit',
-                '.btn-primary'
-            ]
-
-            submit_button = None
-
-            # Try XPath selectors for Hebrew text
-            for selector in xpath_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        if element.is_displayed():
-                            submit_button = element
-                            print(f"✅ Found submit button with XPath: {selector}")
-                            break
-                    if submit_button:
-                        break
-                except:
-                    continue
-
-            # Try CSS selectors if XPath failed
-            if not submit_button:
-                for selector in css_selectors:
-                    try:
-                        element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                        if element.is_displayed():
-                            submit_button = element
-                            print(f"✅ Found submit button with CSS: {selector}")
-                            break
-                    except:
-                        continue
-
-            # If still not found, try brute force on all buttons
-            if not submit_button:
-                print("⚡ Brute force searching for submit button...")
-                all_clickable = self.driver.find_elements(By.CSS_SELECTOR, "button, input[type='submit'], input[type='button']")
-                
-                for element in all_clickable:
-                    try:
-                        if element.is_displayed():
-                            text = (element.text or element.get_attribute('value') or '').strip()
-                            data_slot = element.get_attribute('data-slot') or ''
-                            
-                            if ('הרשמה' in text or 'רישום' in text or 
-                                'submit' in text.lower() or 'register' in text.lower() or
-                                data_slot == 'button'):
-                                submit_button = element
-                                print(f"✅ Found button by brute force: '{text}'")
-                                break
-                    except:
-                        continue
+            buttons = page.all('buttons')
+            print(f"Found {len(buttons)} visible buttons")
+            for i, node in enumerate(buttons):
+                text = node.label() or 'No text'
+                print(f"   Button {i+1}: '{text}' | class='{node.attrs.get('class', '')}' | "
+                      f"data-slot='{node.attrs.get('data-slot', '')}'")
+
+            submit_button = page.element('submit')
+            if submit_button:
+                print(f"✅ Found submit button with: {page.selector('submit')}")
 
             # Click the button
             if submit_button:
@@ -433,39 +260,16 @@ class EmbyILRegistration:
                         time.sleep(5)
                         
                         # Check for success messages
-                        success_selectors = [
-                            '.success',
-                            '.success-message',
-                            '[class*="success"]',
-                            '.alert-success',
-                            '.confirmation',
-                            '.thank-you',
-                            '.registration-success'
-                        ]
-                        
+                        page = page.refresh()
                         success_found = False
-                        for selector in success_selectors:
-                            try:
-                                success_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                                if success_elements:
-                                    for element in success_elements:
-                                        if element.is_displayed() and element.text.strip():
-                                            print(f"✅ Success message: {element.text}")
-                                            success_found = True
-                            except:
-                                continue
+                        for message in page.texts('success'):
+                            print(f"✅ Success message: {message}")
+                            success_found = True
                         
                         # Check for error messages after submit
                         print("🔍 Checking for post-submit errors...")
-                        for selector in error_selectors:
-                            try:
-                                errors = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                                if errors:
-                                    for error in errors:
-                                        if error.is_displayed() and error.text.strip():
-                                            print(f"❌ Post-submit error: {error.text}")
-                            except:
-                                continue
+                        for error in page.texts('errors'):
+                            print(f"❌ Post-submit error: {error}")
 
                         # Take screenshot after submit
                         self.driver.save_screenshot("after_submit.png")
@@ -502,25 +306,6 @@ class EmbyILRegistration:
                 self.driver.save_screenshot("error_screenshot.png")
                 print("📸 Error screenshot saved: error_screenshot.png")
 
-    def find_element_by_selectors(self, selectors):
-        """
-        Try to find element using multiple selectors
-        
-        Args:
-            selectors (list): List of CSS selectors to try
-            
-        Returns:
-            WebElement or None: Found element or None if not found
-        """
-        for selector in selectors:
-            try:
-                element = self.driver.find_element(By.CSS_SELECTOR, selector)
-                if element.is_displayed():
-                    return element
-            except:
-                continue
-        return None
-
     def close(self):
         """Close the browser"""
         if self.driver:
@@ -590,8 +375,8 @@ def get_user_input():
         'headless': headless
     }
 
-# Example usage
-if __name__ == "__main__":
+def main():
+    """Interactive registration entry point"""
     try:
         # Get user input
         user_data = get_user_input()
@@ -656,3 +441,7 @@ if __name__ == "__main__":
         except:
             pass
         print("🏁 Script finished")
+
+if __name__ == "__main__":
+    with profiled('emby_reg'):
+        main()
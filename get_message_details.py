@@ -1,6 +1,54 @@
 import requests
+import argparse
+import concurrent.futures
 import json
+import logging
 import os
+import sys
+import time
+import boomlify_api
+from step_profiler import profiled
+import deadline
+from pipeline_log import get_logger, clip
+from json_stream import iter_response_items, peek_member
+from mail_message import Message
+from run_state import get_email, state_path
+from temp_mailbox import seconds_remaining
+from message_store import save_message, StoreWriter
+import message_index
+import attachment_fetcher
+
+log = get_logger('get_message_details')
+
+# Batch export (used by the Jenkinsfile):
+#
+#     python3 get_message_details.py export [--workers N] [--page-size N] [--report FILE] [--quiet] [--attachments]
+#
+# Saves every stored message ID to the message store with no prompts.
+# Pages of the message list are fetched by a bounded worker pool (the
+# first page alone, so a small inbox costs one request, then up to
+# EXPORT_WORKERS pages at a time) and the matching messages are written
+# by the store's single writer thread. Counts and timings are written to
+# EXPORT_REPORT as JSON and printed at the end. With --attachments the
+# exported messages' attachments are downloaded too (attachment_fetcher.py).
+#
+#     python3 get_message_details.py search "confirm account" [--from ...] [--since ...] [--limit N]
+#
+# Ranked search over every ingested message (see message_index.py).
+EXPORT_WORKERS_ENV = 'EXPORT_WORKERS'
+EXPORT_REPORT_ENV = 'EXPORT_REPORT'
+DEFAULT_EXPORT_WORKERS = 4
+DEFAULT_EXPORT_REPORT = 'export_report.json'
+# Never page past this many messages, whatever the API says
+MAX_EXPORT_MESSAGES = 1000
+
+class PageError(Exception):
+    """The message list endpoint answered with an error status"""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.body = body
 
 def read_message_ids():
     """
@@ -11,8 +59,8 @@ def read_message_ids():
     """
 
     if not os.path.exists('message_ids.txt'):
-        print("❌ Error: 'message_ids.txt' file not found!")
-        print("💡 Please run 'check_messages.py' first to get some messages")
+        log.error("❌ Error: 'message_ids.txt' file not found!")
+        log.info("💡 Please run 'check_messages.py' first to get some messages")
         return []
 
     try:
@@ -26,114 +74,126 @@ def read_message_ids():
                     message_ids.append(message_id)
 
         if message_ids:
-            print(f"📄 Found {len(message_ids)} message IDs in file:")
+            log.info(f"📄 Found {len(message_ids)} message IDs in file:")
             for i, msg_id in enumerate(message_ids, 1):
-                print(f"  {i}. {msg_id}")
+                log.info(f"  {i}. {msg_id}")
         else:
-            print("📄 message_ids.txt file exists but contains no message IDs")
+            log.info("📄 message_ids.txt file exists but contains no message IDs")
 
         return message_ids
 
     except Exception as e:
-        print(f"❌ Error reading message_ids.txt: {e}")
+        log.error(f"❌ Error reading message_ids.txt: {e}")
         return []
 
 def read_email_info():
     """
-    Read email ID from email_info.txt (needed for the API call)
+    Read email ID from the run state (needed for the API call)
 
     Returns:
         str: email_id if successful, None if failed
     """
 
-    if not os.path.exists('email_info.txt'):
-        print("❌ Error: 'email_info.txt' file not found!")
-        print("💡 Please run 'create_email.py' first to create a temporary email")
-        return None
-
     try:
-        email_id = None
-
-        with open('email_info.txt', 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith('EMAIL_ID='):
-                    email_id = line.split('=', 1)[1]
-                    break
+        email_id, _, expires_at = get_email()
 
         if email_id:
-            print(f"📧 Using email ID from file: {email_id}")
+            log.info(f"📧 Using email ID from run state: {email_id}")
+            remaining = seconds_remaining(expires_at)
+            if remaining is not None and remaining <= 0:
+                log.warning(f"⌛ Mailbox expired at {expires_at} - its messages may already be gone")
             return email_id
         else:
-            print("❌ Error: No EMAIL_ID found in email_info.txt")
+            log.error(f"❌ Error: No email ID found in '{state_path()}'")
+            log.info("💡 Please run 'create_email.py' first to create a temporary email")
             return None
 
     except Exception as e:
-        print(f"❌ Error reading email_info.txt: {e}")
+        log.error(f"❌ Error reading run state: {e}")
         return None
 
-def get_all_messages(email_id, limit=25, offset=0):
+def get_all_messages(email_id, limit=25, offset=0, only_ids=None):
     """
     Get all messages for the email using the correct API endpoint
 
+    The response is decoded incrementally; with only_ids, messages with
+    other IDs are skipped without decoding their bodies.
+
     Args:
-        email_id (str): The email ID from email_info.txt
+        email_id (str): The email ID from the run state
         limit (int): Maximum number of messages to retrieve (default: 25)
         offset (int): Number of messages to skip (default: 0)
+        only_ids (iterable): Only decode and return messages with these IDs
 
     Returns:
-        list: List of all messages if successful, None if failed
+        list: List of Message objects if successful, None if failed
     """
 
-    # Use the correct API endpoint that we know works
-    url = f'https://boomlify-temp-mail-api2.p.rapidapi.com/api/v1/emails/{email_id}/messages?limit={limit}&offset={offset}'
+    try:
+        log.info(f"🔄 Fetching all messages from email...")
+        messages, total_messages = fetch_message_page(email_id, limit, offset, only_ids)
+        log.info(f"✅ Retrieved {total_messages} total messages from API")
+        return messages
+
+    except PageError as e:
+        log.error(f"❌ Error: HTTP {e.status_code}")
+        log.error(f"Response: {clip(e.body)}")
+        return None
+    except requests.exceptions.RequestException as e:
+        log.error(f"❌ Request failed: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        log.error(f"❌ Failed to parse JSON response: {e}")
+        return None
 
-    # Headers
-    headers = {
-        'x-rapidapi-host': 'boomlify-temp-mail-api2.p.rapidapi.com',
-        'x-rapidapi-key': 'c815bd8438mshaec3510f9c39d67p1b034bjsn3f4575728890'
-    }
+def fetch_message_page(email_id, limit=25, offset=0, only_ids=None):
+    """
+    Fetch one page of the message list
 
-    try:
-        print(f"🔄 Fetching all messages from email...")
+    Args:
+        email_id (str): The email ID from the run state
+        limit (int): Page size
+        offset (int): Number of messages to skip
+        only_ids (iterable): Only decode and return messages with these IDs
 
-        # Make the GET request
-        response = requests.get(url, headers=headers)
+    Returns:
+        tuple: (messages, total) - the decoded Message objects and the number
+            of messages on the page
 
-        # Check if request was successful
-        if response.status_code == 200:
-            # Parse the JSON response
-            result = response.json()
+    Raises:
+        PageError: The API answered with an error status
+        requests.exceptions.RequestException: The request failed
+        json.JSONDecodeError: The response was not valid JSON
+    """
 
-            # Handle both possible response structures
-            messages = []
-            if isinstance(result, dict):
-                messages = result.get('messages', result.get('data', []))
-            elif isinstance(result, list):
-                messages = result
+    # Use the correct API endpoint that we know works
+    path = f'emails/{email_id}/messages?limit={limit}&offset={offset}'
 
-            print(f"✅ Retrieved {len(messages)} total messages from API")
+    # Make the GET request (body is streamed, see json_stream)
+    response = boomlify_api.request('GET', path, stream=True)
+    if response.status_code != 200:
+        raise PageError(response.status_code, response.text)
 
-            return messages
+    wanted = set(only_ids) if only_ids is not None else None
 
-        else:
-            print(f"❌ Error: HTTP {response.status_code}")
-            print(f"Response: {response.text}")
-            return None
+    # Handles both {"messages": [...]}/{"data": [...]} and a bare list
+    total_messages = 0
+    messages = []
+    items = iter_response_items(response, check=deadline.checker('reading messages'))
+    for raw_message in items:
+        total_messages += 1
+        if wanted is not None and peek_member(raw_message, 'id') not in wanted:
+            continue
+        messages.append(Message.from_json(raw_message))
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Request failed: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"❌ Failed to parse JSON response: {e}")
-        return None
+    return messages, total_messages
 
 def filter_messages_by_ids(all_messages, target_message_ids):
     """
     Filter messages to only include those with IDs from our list
 
     Args:
-        all_messages (list): All messages from the API
+        all_messages (list): All Message objects from the API
         target_message_ids (list): Message IDs we want to find
 
     Returns:
@@ -144,18 +204,18 @@ def filter_messages_by_ids(all_messages, target_message_ids):
     found_ids = []
 
     for message in all_messages:
-        message_id = message.get('id')
+        message_id = message.id
         if message_id in target_message_ids:
             filtered_messages.append(message)
             found_ids.append(message_id)
 
     missing_ids = set(target_message_ids) - set(found_ids)
 
-    print(f"✅ Found {len(filtered_messages)} messages matching our stored IDs")
+    log.info(f"✅ Found {len(filtered_messages)} messages matching our stored IDs")
     if missing_ids:
-        print(f"⚠️ Missing {len(missing_ids)} messages (may have expired or been deleted):")
+        log.warning(f"⚠️ Missing {len(missing_ids)} messages (may have expired or been deleted):")
         for missing_id in missing_ids:
-            print(f"  - {missing_id}")
+            log.info(f"  - {missing_id}")
 
     return filtered_messages
 
@@ -163,63 +223,88 @@ def display_message_details(message_data, index=None):
     """
     Display detailed message information in a formatted way
 
+    Text content, HTML and header values are clipped to LOG_FIELD_MAX
+    characters; headers are only shown at LOG_LEVEL=DEBUG. The full message
+    is kept by save_message_details.
+
     Args:
-        message_data (dict): The message data from API
+        message_data (Message): The message from the API
         index (int): Optional index number for display
     """
 
-    message_id = message_data.get('id', 'N/A')
+    message_id = message_data.id or 'N/A'
+    sender = message_data.sender or 'N/A'
+    recipient = message_data.recipient or 'N/A'
+    subject = message_data.subject or 'No Subject'
+    date = message_data.date or 'N/A'
+    text_content = message_data.text or ''
+    html_content = message_data.html or ''
+    headers = message_data.headers or {}
+    attachments = message_data.attachments or []
 
     header_text = f"📧 MESSAGE DETAILS"
     if index is not None:
         header_text = f"📧 MESSAGE {index} DETAILS"
 
-    print(f"\n{'='*60}")
-    print(header_text)
-    print(f"{'='*60}")
-    print(f"🆔 Message ID: {message_id}")
-
-    # Display basic information
-    print(f"📤 From: {message_data.get('from', message_data.get('sender', 'N/A'))}")
-    print(f"📧 To: {message_data.get('to', message_data.get('recipient', 'N/A'))}")
-    print(f"📋 Subject: {message_data.get('subject', 'No Subject')}")
-    print(f"📅 Date: {message_data.get('date', message_data.get('created_at', 'N/A'))}")
+    lines = [
+        f"\n{'='*60}",
+        header_text,
+        f"{'='*60}",
+        f"🆔 Message ID: {message_id}",
+        f"📤 From: {clip(sender)}",
+        f"📧 To: {clip(recipient)}",
+        f"📋 Subject: {clip(subject)}",
+        f"📅 Date: {date}"
+    ]
 
     # Display content
-    text_content = message_data.get('text', message_data.get('body', message_data.get('content', '')))
     if text_content:
-        print(f"\n📄 Text Content:")
-        print(f"{'-'*40}")
-        print(text_content)
-        print(f"{'-'*40}")
+        lines.append(f"\n📄 Text Content ({len(text_content)} characters):")
+        lines.append(f"{'-'*40}")
+        lines.append(clip(text_content))
+        lines.append(f"{'-'*40}")
 
     # Display HTML content
-    html_content = message_data.get('html', message_data.get('html_body', ''))
     if html_content:
-        print(f"\n🌐 HTML Content:")
-        print(f"📏 Length: {len(html_content)} characters")
-        # Show first 200 characters of HTML
-        html_preview = html_content[:200] + "..." if len(html_content) > 200 else html_content
-        print(f"👁️ Preview: {html_preview}")
-
-    # Display headers if available
-    headers = message_data.get('headers', {})
-    if headers:
-        print(f"\n📋 Headers:")
-        for key, value in headers.items():
-            print(f"  {key}: {value}")
+        lines.append(f"\n🌐 HTML Content:")
+        lines.append(f"📏 Length: {len(html_content)} characters")
+        lines.append(f"👁️ Preview: {clip(html_content)}")
 
     # Display attachments
-    attachments = message_data.get('attachments', [])
     if attachments:
-        print(f"\n📎 Attachments ({len(attachments)}):")
+        lines.append(f"\n📎 Attachments ({len(attachments)}):")
         for i, attachment in enumerate(attachments, 1):
-            print(f"  {i}. {attachment.get('filename', 'Unknown')} - {attachment.get('size', 'Unknown size')}")
+            lines.append(f"  {i}. {clip(attachment.get('filename', 'Unknown'))} - {attachment.get('size', 'Unknown size')}")
 
     # Display additional metadata
-    print(f"\n📊 Additional Info:")
-    print(f"  🔒 Read: {message_data.get('read', 'Unknown')}")
-    print(f"  ⭐ Flagged: {message_data.get('flagged', 'Unknown')}")
+    lines.append(f"\n📊 Additional Info:")
+    lines.append(f"  🔒 Read: {'Unknown' if message_data.read is None else message_data.read}")
+    lines.append(f"  ⭐ Flagged: {'Unknown' if message_data.flagged is None else message_data.flagged}")
+
+    log.info('\n'.join(lines), extra={'summary': header_text, 'fields': {
+        'event': 'message_details',
+        'message_id': message_id,
+        'from': sender,
+        'to': recipient,
+        'subject': subject,
+        'date': date,
+        'text': text_content,
+        'text_length': len(text_content or ''),
+        'html_length': len(html_content or ''),
+        'headers': len(headers),
+        'attachments': len(attachments)
+    }})
+
+    # Display headers if available (verbose - debug level only)
+    if headers and log.isEnabledFor(logging.DEBUG):
+        header_lines = [f"\n📋 Headers:"]
+        for key, value in headers.items():
+            header_lines.append(f"  {key}: {clip(value)}")
+        log.debug('\n'.join(header_lines), extra={'summary': '📋 Headers', 'fields': {
+            'event': 'message_headers',
+            'message_id': message_id,
+            'headers': json.dumps(headers)
+        }})
 
 def save_message_details(message_id, message_data):
     """
@@ -227,18 +312,15 @@ def save_message_details(message_id, message_data):
 
     Args:
         message_id (str): The message ID
-        message_data (dict): The detailed message data
+        message_data (Message): The message (saved with all of its original fields)
     """
 
     try:
-        filename = f"message_details_{message_id}.json"
-        with open(filename, 'w') as f:
-            json.dump(message_data, f, indent=2)
-
-        print(f"💾 Detailed message saved to: {filename}")
+        filename = save_message(message_id, message_data)
+        log.info(f"💾 Detailed message saved to: {filename}")
 
     except Exception as e:
-        print(f"❌ Error saving message details: {e}")
+        log.error(f"❌ Error saving message details: {e}")
 
 def process_stored_messages():
     """
@@ -255,10 +337,10 @@ def process_stored_messages():
     if not target_message_ids:
         return
 
-    print(f"\n🚀 Looking for {len(target_message_ids)} specific messages...")
+    log.info(f"\n🚀 Looking for {len(target_message_ids)} specific messages...")
 
-    # Get all messages from the API
-    all_messages = get_all_messages(email_id)
+    # Get the messages we care about from the API
+    all_messages = get_all_messages(email_id, only_ids=target_message_ids)
     if all_messages is None:
         return
 
@@ -266,21 +348,21 @@ def process_stored_messages():
     filtered_messages = filter_messages_by_ids(all_messages, target_message_ids)
 
     if not filtered_messages:
-        print("\n📭 No matching messages found")
-        print("💡 This could mean:")
-        print("  - Messages have expired and been deleted")
-        print("  - Message IDs in file are from a different email")
-        print("  - There's a sync issue between stored IDs and current messages")
+        log.info("\n📭 No matching messages found")
+        log.info("💡 This could mean:")
+        log.info("  - Messages have expired and been deleted")
+        log.info("  - Message IDs in file are from a different email")
+        log.info("  - There's a sync issue between stored IDs and current messages")
         return
 
-    print(f"\n📧 Processing {len(filtered_messages)} matching messages...")
+    log.info(f"\n📧 Processing {len(filtered_messages)} matching messages...")
 
     for i, message in enumerate(filtered_messages, 1):
-        message_id = message.get('id', 'N/A')
+        message_id = message.id or 'N/A'
 
-        print(f"\n{'#'*60}")
-        print(f"Processing message {i}/{len(filtered_messages)}")
-        print(f"{'#'*60}")
+        log.info(f"\n{'#'*60}")
+        log.info(f"Processing message {i}/{len(filtered_messages)}")
+        log.info(f"{'#'*60}")
 
         # Display the details
         display_message_details(message, i)
@@ -294,9 +376,157 @@ def process_stored_messages():
         if i < len(filtered_messages):
             continue_choice = input(f"\n➡️ Continue to next message? (Y/n): ").strip().lower()
             if continue_choice == 'n':
-                print("⏹️ Stopping message processing")
+                log.info("⏹️ Stopping message processing")
                 break
 
+def export_stored_messages(workers=None, page_size=25, report_path=None, show=True, attachments=False):
+    """
+    Save every stored message ID to the message store without prompting
+
+    Args:
+        workers (int): Pages fetched at once (default: EXPORT_WORKERS or 4)
+        page_size (int): Messages per page request
+        report_path (str): Where to write the JSON report (default: EXPORT_REPORT)
+        show (bool): Log the details of each exported message
+        attachments (bool): Also download the exported messages' attachments
+            (see attachment_fetcher.py); their report goes under 'attachments'
+
+    Returns:
+        dict: The report - counts, missing IDs, errors and timings
+    """
+    started = time.monotonic()
+    workers = max(int(workers or _env_int(EXPORT_WORKERS_ENV, DEFAULT_EXPORT_WORKERS)), 1)
+    report_path = report_path or os.environ.get(EXPORT_REPORT_ENV) or DEFAULT_EXPORT_REPORT
+    report = {
+        'status': 'ok',
+        'email_id': None,
+        'requested': 0,
+        'found': 0,
+        'saved': 0,
+        'missing': [],
+        'errors': [],
+        'pages': 0,
+        'messages_scanned': 0,
+        'workers': workers,
+        'page_size': page_size,
+        'bytes_written': 0,
+        'timings': {}
+    }
+
+    email_id = read_email_info()
+    target_message_ids = read_message_ids()
+    report['email_id'] = email_id
+    report['requested'] = len(target_message_ids)
+    if not email_id:
+        report['status'] = 'failed'
+        report['errors'].append({'error': f"No email ID in {state_path()}"})
+    elif target_message_ids:
+        log.info(f"\n🚀 Exporting {len(target_message_ids)} stored messages "
+                 f"({workers} workers, {page_size} per page)...")
+        _export(email_id, target_message_ids, workers, page_size, show, report)
+        if attachments and report['found']:
+            exported = [message_id for message_id in target_message_ids if message_id not in report['missing']]
+            report['attachments'] = attachment_fetcher.fetch_stored_attachments(email_id, exported)
+            if report['attachments']['failed'] and report['status'] == 'ok':
+                report['status'] = 'partial'
+
+    report['timings']['total_seconds'] = round(time.monotonic() - started, 3)
+    try:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        log.info(f"📊 Export report saved to: {report_path}")
+    except OSError as e:
+        log.error(f"❌ Could not write export report: {e}")
+    return report
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+def _fetch_timed(email_id, page_size, offset, wanted):
+    start = time.monotonic()
+    messages, total = fetch_message_page(email_id, page_size, offset, wanted)
+    return messages, total, time.monotonic() - start
+
+def _export(email_id, target_message_ids, workers, page_size, show, report):
+    """Fetch pages in parallel and hand matching messages to the writer (fills `report`)"""
+    wanted = set(target_message_ids)
+    found = set()
+    page_seconds = []
+    end = MAX_EXPORT_MESSAGES
+    next_offset = 0
+    # One page first: most mailboxes fit on it, so don't spend quota on more
+    in_flight_limit = 1
+
+    writer = StoreWriter(max_pending=workers * page_size)
+    fetch_started = time.monotonic()
+    with writer, concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                       thread_name_prefix='export-fetch') as pool:
+        pending = {}
+        while True:
+            while (len(pending) < in_flight_limit and next_offset < end
+                   and len(found) < len(wanted) and not report['errors']):
+                future = pool.submit(_fetch_timed, email_id, page_size, next_offset, wanted)
+                pending[future] = next_offset
+                next_offset += page_size
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                offset = pending.pop(future)
+                try:
+                    messages, total, seconds = future.result()
+                except PageError as e:
+                    log.error(f"❌ Page at offset {offset}: HTTP {e.status_code}")
+                    report['errors'].append({'offset': offset, 'error': f"HTTP {e.status_code}: {clip(e.body)}"})
+                    continue
+                except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                    log.error(f"❌ Page at offset {offset} failed: {e}")
+                    report['errors'].append({'offset': offset, 'error': str(e)})
+                    continue
+
+                report['pages'] += 1
+                report['messages_scanned'] += total
+                page_seconds.append(seconds)
+                log.info(f"📄 Page at offset {offset}: {total} messages, {len(messages)} wanted ({seconds:.2f}s)")
+                if total < page_size:
+                    # Short page: the inbox ends here
+                    end = min(end, offset + page_size)
+                else:
+                    in_flight_limit = workers
+
+                for message in messages:
+                    if message.id in found:
+                        continue
+                    found.add(message.id)
+                    if show:
+                        display_message_details(message, len(found))
+                    writer.put(message.id, message)
+
+    fetch_seconds = time.monotonic() - fetch_started
+    report['found'] = len(found)
+    report['saved'] = len(writer.saved)
+    report['missing'] = [message_id for message_id in target_message_ids if message_id not in found]
+    for message_id, error in writer.failed.items():
+        report['errors'].append({'message_id': message_id, 'error': error})
+    report['bytes_written'] = writer.bytes_written
+    report['timings'].update({
+        'fetch_seconds': round(fetch_seconds, 3),
+        'page_seconds_total': round(sum(page_seconds), 3),
+        'slowest_page_seconds': round(max(page_seconds), 3) if page_seconds else 0.0,
+        'write_seconds': round(writer.write_seconds, 3)
+    })
+    if report['errors']:
+        report['status'] = 'partial' if report['saved'] else 'failed'
+
+    log.info(f"✅ Exported {report['saved']}/{report['requested']} messages "
+             f"({report['pages']} pages in {fetch_seconds:.2f}s)")
+    if report['missing']:
+        log.warning(f"⚠️ Missing {len(report['missing'])} messages (may have expired or been deleted)")
+
 def show_all_vs_stored():
     """
     Show comparison between all messages and stored message IDs
@@ -315,45 +545,62 @@ def show_all_vs_stored():
     if all_messages is None:
         return
 
-    current_ids = [msg.get('id') for msg in all_messages if msg.get('id')]
+    current_ids = [msg.id for msg in all_messages if msg.id]
 
-    print(f"\n📊 Message Comparison:")
-    print(f"📄 Stored message IDs: {len(stored_ids)}")
-    print(f"📬 Current messages in inbox: {len(current_ids)}")
+    log.info(f"\n📊 Message Comparison:")
+    log.info(f"📄 Stored message IDs: {len(stored_ids)}")
+    log.info(f"📬 Current messages in inbox: {len(current_ids)}")
 
     # Find matches and differences
     matches = set(stored_ids) & set(current_ids)
     stored_only = set(stored_ids) - set(current_ids)
     current_only = set(current_ids) - set(stored_ids)
 
-    print(f"✅ Matching messages: {len(matches)}")
-    print(f"⚠️ Stored but missing from inbox: {len(stored_only)}")
-    print(f"🆕 In inbox but not stored: {len(current_only)}")
+    log.info(f"✅ Matching messages: {len(matches)}")
+    log.warning(f"⚠️ Stored but missing from inbox: {len(stored_only)}")
+    log.info(f"🆕 In inbox but not stored: {len(current_only)}")
 
     if stored_only:
-        print(f"\n📭 Missing from inbox (possibly expired):")
+        log.info(f"\n📭 Missing from inbox (possibly expired):")
         for msg_id in list(stored_only)[:5]:  # Show first 5
-            print(f"  - {msg_id}")
+            log.info(f"  - {msg_id}")
         if len(stored_only) > 5:
-            print(f"  ... and {len(stored_only) - 5} more")
+            log.info(f"  ... and {len(stored_only) - 5} more")
 
     if current_only:
-        print(f"\n🆕 New messages not in stored list:")
+        log.info(f"\n🆕 New messages not in stored list:")
         for msg_id in list(current_only)[:5]:  # Show first 5
-            print(f"  - {msg_id}")
+            log.info(f"  - {msg_id}")
         if len(current_only) > 5:
-            print(f"  ... and {len(current_only) - 5} more")
-
-def main():
-    """Main function"""
-    print("🚀 Starting corrected message details fetcher...")
-    print("💡 Note: Using the working API endpoint to fetch all messages,")
-    print("   then filtering to show only the ones from your stored list.")
-
-    print("\n🎯 Options:")
-    print("  1. Process stored message IDs (show detailed info)")
-    print("  2. Compare stored vs current messages")
-    print("  3. List stored message IDs only")
+            log.info(f"  ... and {len(current_only) - 5} more")
+
+def main(argv=None):
+    """Main function (interactive menu, `export` for unattended runs, `search` over stored messages)"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'search':
+        sys.exit(message_index.main(argv))
+    if argv:
+        parser = argparse.ArgumentParser(description='Export stored messages to the message store')
+        parser.add_argument('command', choices=['export'])
+        parser.add_argument('--workers', type=int, help=f"Pages fetched at once (default: ${EXPORT_WORKERS_ENV} or {DEFAULT_EXPORT_WORKERS})")
+        parser.add_argument('--page-size', type=int, default=25, help='Messages per page request (default: 25)')
+        parser.add_argument('--report', help=f"JSON report path (default: ${EXPORT_REPORT_ENV} or {DEFAULT_EXPORT_REPORT})")
+        parser.add_argument('--quiet', action='store_true', help="Don't log each message's details")
+        parser.add_argument('--attachments', action='store_true', help='Also download attachments (see attachment_fetcher.py)')
+        args = parser.parse_args(argv)
+        report = export_stored_messages(args.workers, args.page_size, args.report, show=not args.quiet,
+                                        attachments=args.attachments)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['status'] == 'ok' else 1)
+
+    log.info("🚀 Starting corrected message details fetcher...")
+    log.info("💡 Note: Using the working API endpoint to fetch all messages,")
+    log.info("   then filtering to show only the ones from your stored list.")
+
+    log.info("\n🎯 Options:")
+    log.info("  1. Process stored message IDs (show detailed info)")
+    log.info("  2. Compare stored vs current messages")
+    log.info("  3. List stored message IDs only")
 
     choice = input("\nChoose option (1, 2, or 3): ").strip()
 
@@ -364,7 +611,8 @@ def main():
     elif choice == "3":
         read_message_ids()
     else:
-        print("❌ Invalid choice")
+        log.error("❌ Invalid choice")
 
 if __name__ == "__main__":
-    main()
+    with profiled('get_message_details'), deadline.step_deadline('get_message_details'):
+        main()
@@ -0,0 +1,317 @@
+import base64
+import datetime
+import io
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+from pipeline_log import get_logger
+
+log = get_logger('http_cassette')
+
+# Record and replay Boomlify API traffic.
+#
+#     BOOMLIFY_RECORD=cassette.jsonl     append every request/response to the cassette
+#     BOOMLIFY_REPLAY=cassette.jsonl     answer every request from the cassette (no network)
+#     BOOMLIFY_REPLAY_TIMING=1.0         scale of the recorded timings on replay
+#                                        (1 = as recorded, 0.5 = twice as fast, 0 = instant)
+#
+# Both are requests transport adapters mounted on boomlify_api's session,
+# so every call made through boomlify_api.request() is covered. A cassette
+# is JSON Lines, one exchange per line:
+#
+#     {"recorded_at", "method", "url", "request": {"headers", "body"},
+#      "response": {"status", "reason", "headers", "body" | "body_b64"},
+#      "elapsed": <seconds to headers>, "duration": <seconds incl. body>}
+#
+# Secrets are redacted before anything is written: credential headers
+# (RapidAPI key, Authorization, cookies, webhook secret), credential query
+# parameters and JSON fields (passwords, tokens, keys), and any literal
+# value passed in `secrets` (e.g. the API key) wherever it appears.
+# Activation links in message bodies are kept - they are the payload the
+# offline benchmarks need.
+#
+# On replay, requests are matched on method, path and query (not host, so
+# a cassette recorded against RapidAPI replays under any base URL).
+# Identical requests are answered in recorded order; once they run out the
+# last answer is repeated, so polling loops can run longer than the
+# recording. A request that was never recorded raises ConnectionError.
+RECORD_ENV = 'BOOMLIFY_RECORD'
+REPLAY_ENV = 'BOOMLIFY_REPLAY'
+REPLAY_TIMING_ENV = 'BOOMLIFY_REPLAY_TIMING'
+REDACTED = 'REDACTED'
+
+SECRET_HEADERS = {'x-rapidapi-key', 'authorization', 'proxy-authorization', 'cookie', 'set-cookie',
+                  'x-api-key', 'x-webhook-secret'}
+SECRET_FIELDS = {'password', 'passwd', 'secret', 'token', 'api_key', 'apikey', 'key', 'access_token',
+                 'refresh_token', 'authorization', 'website_password'}
+# Hop-by-hop headers that no longer describe the stored (already decoded) body
+DROP_RESPONSE_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+def _is_secret_field(name):
+    name = str(name).lower()
+    return name in SECRET_FIELDS or name.endswith('_password') or name.endswith('_secret')
+
+def redact_value(value, secrets=()):
+    """Replace every literal secret inside a string"""
+    if isinstance(value, str):
+        for secret in secrets:
+            if secret:
+                value = value.replace(secret, REDACTED)
+    return value
+
+def redact_json(data, secrets=()):
+    """
+    Redact credential fields (recursively) and literal secrets in decoded JSON
+
+    Returns:
+        The redacted copy
+    """
+    if isinstance(data, dict):
+        return {key: REDACTED if _is_secret_field(key) and value not in (None, '') else redact_json(value, secrets)
+                for key, value in data.items()}
+    if isinstance(data, list):
+        return [redact_json(item, secrets) for item in data]
+    return redact_value(data, secrets)
+
+def redact_headers(headers, secrets=()):
+    """Copy of a header mapping with credential headers redacted"""
+    return {name: REDACTED if name.lower() in SECRET_HEADERS else redact_value(value, secrets)
+            for name, value in headers.items()}
+
+def redact_url(url, secrets=()):
+    """URL with credential query parameters redacted"""
+    parts = urlsplit(url)
+    if parts.query:
+        query = urlencode([(key, REDACTED if _is_secret_field(key) else value)
+                           for key, value in parse_qsl(parts.query, keep_blank_values=True)], safe='/:')
+        parts = parts._replace(query=query)
+    return redact_value(parts.geturl(), secrets)
+
+def redact_body(body, content_type='', secrets=()):
+    """
+    Redact a request or response body
+
+    Args:
+        body (bytes or str): The body
+        content_type (str): Its Content-Type (JSON bodies are redacted field by field)
+        secrets (iterable): Literal secrets to replace anywhere
+
+    Returns:
+        dict: {"body": text} or {"body_b64": base64} when the body isn't UTF-8
+    """
+    if body is None:
+        return {'body': None}
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return {'body_b64': base64.b64encode(body).decode('ascii')}
+    if 'json' in (content_type or '') or body[:1] in ('{', '['):
+        try:
+            return {'body': json.dumps(redact_json(json.loads(body), secrets))}
+        except ValueError:
+            pass
+    return {'body': redact_value(body, secrets)}
+
+def match_key(method, url):
+    """Replay key of a request: method, path and sorted query"""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.path}?{query}"
+
+def _stored_body(entry):
+    response = entry['response']
+    if response.get('body_b64') is not None:
+        return base64.b64decode(response['body_b64'])
+    return (response.get('body') or '').encode('utf-8')
+
+class _TimedBody(io.BytesIO):
+    """Response body that takes `delay` seconds to start arriving"""
+
+    def __init__(self, data, delay):
+        super().__init__(data)
+        self.delay = delay
+
+    def _wait(self):
+        if self.delay > 0:
+            time.sleep(self.delay)
+            self.delay = 0
+
+    def read(self, *args):
+        self._wait()
+        return super().read(*args)
+
+    def read1(self, *args):
+        self._wait()
+        return super().read1(*args)
+
+    def readinto(self, buffer):
+        self._wait()
+        return super().readinto(buffer)
+
+def build_response(adapter, request, status, reason, headers, body, body_delay=0.0):
+    """
+    requests.Response around an in-memory body (streamable like a live one)
+
+    Args:
+        adapter (HTTPAdapter): Adapter building the response
+        request (requests.PreparedRequest): The request it answers
+        status (int): HTTP status
+        reason (str): Reason phrase
+        headers (dict): Response headers
+        body (bytes): Decoded body
+        body_delay (float): Seconds before the body starts arriving
+    """
+    headers = {name: value for name, value in headers.items() if name.lower() not in DROP_RESPONSE_HEADERS}
+    headers['Content-Length'] = str(len(body))
+    raw = HTTPResponse(body=_TimedBody(body, body_delay), headers=headers, status=status, reason=reason,
+                       preload_content=False, decode_content=False, request_url=request.url)
+    return adapter.build_response(request, raw)
+
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, path, secrets=(), **kwargs):
+        """
+        Transport that sends requests normally and appends each exchange to a cassette
+
+        The body is read in full when the response arrives (so it can be
+        recorded) and handed on as an in-memory stream.
+
+        Args:
+            path (str): Cassette file (JSON Lines, appended to)
+            secrets (iterable): Literal secrets to redact wherever they appear
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        self.secrets = [secret for secret in secrets if secret]
+        self.lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        start = time.monotonic()
+        response = super().send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        elapsed = time.monotonic() - start
+        body = response.content
+        duration = time.monotonic() - start
+        self.record(request, response, body, elapsed, duration)
+        replayed = build_response(self, request, response.status_code, response.reason,
+                                  dict(response.headers), body)
+        replayed.elapsed = response.elapsed
+        return replayed
+
+    def record(self, request, response, body, elapsed, duration):
+        """Append one redacted exchange to the cassette"""
+        entry = {
+            'recorded_at': datetime.datetime.now().isoformat(),
+            'method': request.method,
+            'url': redact_url(request.url, self.secrets),
+            'request': dict(headers=redact_headers(request.headers, self.secrets),
+                            **redact_body(request.body, request.headers.get('Content-Type'), self.secrets)),
+            'response': dict(status=response.status_code, reason=response.reason,
+                             headers=redact_headers(response.headers, self.secrets),
+                             **redact_body(body, response.headers.get('Content-Type'), self.secrets)),
+            'elapsed': round(elapsed, 6),
+            'duration': round(duration, 6)
+        }
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+def load_cassette(path):
+    """
+    Read a cassette
+
+    Returns:
+        list: Exchanges in recorded order (blank and invalid lines skipped)
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+class ReplayAdapter(HTTPAdapter):
+    def __init__(self, path_or_entries, timing=1.0, **kwargs):
+        """
+        Transport that answers requests from a cassette instead of the network
+
+        Args:
+            path_or_entries: Cassette file, or a list of exchanges
+            timing (float): Scale of the recorded timings (0 = instant)
+        """
+        super().__init__(**kwargs)
+        entries = load_cassette(path_or_entries) if isinstance(path_or_entries, str) else path_or_entries
+        self.timing = max(float(timing), 0.0)
+        self.lock = threading.Lock()
+        self.queues = {}
+        for entry in entries:
+            self.queues.setdefault(match_key(entry['method'], entry['url']), []).append(entry)
+        self.positions = {}
+        self.served = 0
+
+    def next_entry(self, method, url):
+        """The recorded exchange answering this request, or None"""
+        key = match_key(method, url)
+        with self.lock:
+            queue = self.queues.get(key)
+            if not queue:
+                return None
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            self.served += 1
+            return queue[min(position, len(queue) - 1)]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.next_entry(request.method, request.url)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(
+                f"No recorded response for {request.method} {request.url}", request=request)
+
+        elapsed = entry.get('elapsed', 0) * self.timing
+        body_delay = max(entry.get('duration', 0) * self.timing - elapsed, 0)
+        if elapsed:
+            time.sleep(elapsed)
+        response = entry['response']
+        replayed = build_response(self, request, response['status'], response.get('reason') or '',
+                                  response.get('headers') or {}, _stored_body(entry), body_delay)
+        replayed.elapsed = datetime.timedelta(seconds=elapsed)
+        if not stream:
+            replayed.content
+        return replayed
+
+def transport_from_env(secrets=()):
+    """
+    Adapter selected by BOOMLIFY_REPLAY / BOOMLIFY_RECORD (replay wins)
+
+    Args:
+        secrets (iterable): Literal secrets the recorder must redact
+
+    Returns:
+        HTTPAdapter: The adapter, or None for plain network access
+    """
+    replay = os.environ.get(REPLAY_ENV)
+    if replay:
+        try:
+            timing = float(os.environ.get(REPLAY_TIMING_ENV, '1'))
+        except ValueError:
+            timing = 1.0
+        adapter = ReplayAdapter(replay, timing)
+        log.info(f"📼 Replaying Boomlify API traffic from {replay} (timing x{timing:g})")
+        return adapter
+    record = os.environ.get(RECORD_ENV)
+    if record:
+        log.info(f"📼 Recording Boomlify API traffic to {record}")
+        return RecordingAdapter(record, secrets)
+    return None
@@ -0,0 +1,348 @@
+import codecs
+import json
+import re
+from json.decoder import scanstring
+
+# Incremental JSON helpers for large API responses.
+#
+# JsonArrayStream pulls the items of one array out of a JSON document that
+# arrives in chunks - either a top-level array or the array under one of
+# the given keys of a top-level object, e.g. {"success": true, "messages": [...]}.
+# Items are yielded as raw JSON text, one at a time, so the caller decides
+# which ones are worth decoding and peak memory stays at one item plus one
+# chunk no matter how large the document is.
+#
+# Scanning jumps between structural characters with regular expressions,
+# so long string values (message bodies) are skipped at C speed.
+
+_STRUCTURAL = re.compile(r'[\[\]{}",:]')
+_BRACKET_OR_QUOTE = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[,}\]\s]')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Strings longer than this at the top level of the document can't be keys
+# we are looking for, so their text is not kept while scanning
+_MAX_KEY_LENGTH = 256
+
+class JsonArrayStream:
+    def __init__(self, keys=('messages', 'data')):
+        """
+        Incremental scanner for the items of one JSON array
+
+        Args:
+            keys (tuple): Keys of a top-level object whose array value is
+                streamed; the first of them found in the document is used.
+                A top-level array is always streamed.
+        """
+        self.keys = set(keys or ())
+        self.buf = ''
+        self.pos = 0
+        self.depth = 0
+        self.doc_type = None
+        self.state = 'seek'
+        self.array_depth = None
+        self.item_start = None
+        self.in_string = False
+        self.string_start = None
+        self.last_string = None
+        self.pending_key = None
+        self.array_key = None
+        self.item_count = 0
+
+    @property
+    def done(self):
+        """True once the streamed array has been closed"""
+        return self.state == 'done'
+
+    def feed(self, text):
+        """
+        Add a chunk of the document
+
+        Args:
+            text (str): Next chunk of decoded text
+
+        Returns:
+            list: Raw JSON text of every item completed by this chunk
+        """
+        if self.state == 'done' or not text:
+            return []
+        self.buf += text
+        items = self._scan()
+        self._compact()
+        return items
+
+    def close(self):
+        """
+        Check that the document ended cleanly
+
+        Raises:
+            json.JSONDecodeError: The document was truncated or empty
+        """
+        if self.state == 'done':
+            return
+        if self.doc_type is None:
+            raise json.JSONDecodeError('Empty JSON document', self.buf[:100], 0)
+        if self.depth != 0 or self.in_string:
+            raise json.JSONDecodeError('Truncated JSON document', self.buf[-100:], self.pos)
+
+    def _compact(self):
+        """Drop text that has been fully scanned"""
+        if self.item_start is not None:
+            keep = self.item_start
+        elif self.in_string and self.string_start is not None:
+            if self.pos - self.string_start > _MAX_KEY_LENGTH:
+                self.string_start = None
+                keep = self.pos
+            else:
+                keep = self.string_start
+        else:
+            keep = self.pos
+        if keep:
+            self.buf = self.buf[keep:]
+            self.pos -= keep
+            if self.item_start is not None:
+                self.item_start -= keep
+            if self.string_start is not None:
+                self.string_start -= keep
+
+    def _scan(self):
+        items = []
+        buf = self.buf
+        length = len(buf)
+
+        while self.state != 'done':
+            if self.in_string:
+                m = _STRING_SPECIAL.search(buf, self.pos)
+                if not m:
+                    self.pos = length
+                    break
+                if m.group() == '\\':
+                    if m.end() >= length:
+                        # Escape split across chunks - wait for the next one
+                        self.pos = m.start()
+                        break
+                    self.pos = m.end() + 1
+                    continue
+                self.in_string = False
+                if self.state == 'seek' and self.depth == 1 and self.string_start is not None:
+                    self.last_string = buf[self.string_start + 1:m.start()]
+                self.string_start = None
+                self.pos = m.end()
+                continue
+
+            if self.state == 'items' and self.item_start is None and self.depth == self.array_depth:
+                # Skip whitespace and separators up to the next item
+                while self.pos < length and buf[self.pos] in ' \t\n\r,':
+                    self.pos += 1
+                if self.pos >= length:
+                    break
+                if buf[self.pos] != ']':
+                    self.item_start = self.pos
+
+            m = _STRUCTURAL.search(buf, self.pos)
+            if not m:
+                self.pos = length
+                break
+            c = m.group()
+            i = m.start()
+            self.pos = m.end()
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c in '{[':
+                if self.doc_type is None:
+                    self.doc_type = c
+                    if c == '[':
+                        self.state = 'items'
+                        self.array_depth = 1
+                elif (self.state == 'seek' and c == '[' and self.depth == 1
+                      and self.pending_key in self.keys):
+                    self.state = 'items'
+                    self.array_key = self.pending_key
+                    self.array_depth = 2
+                self.pending_key = None
+                self.depth += 1
+            elif c in '}]':
+                if self.state == 'items' and self.depth == self.array_depth:
+                    if self.item_start is not None:
+                        items.append(buf[self.item_start:i].strip())
+                        self.item_start = None
+                    self.state = 'done'
+                self.depth -= 1
+            elif c == ':':
+                if self.state == 'seek' and self.depth == 1:
+                    self.pending_key = self.last_string
+                    self.last_string = None
+            elif c == ',':
+                if self.state == 'items' and self.depth == self.array_depth and self.item_start is not None:
+                    items.append(buf[self.item_start:i].strip())
+                    self.item_start = None
+                if self.depth == 1:
+                    self.pending_key = None
+
+        self.item_count += len(items)
+        return items
+
+def iter_array_items(chunks, keys=('messages', 'data')):
+    """
+    Stream the items of a JSON array from an iterable of text chunks
+
+    Args:
+        chunks (iterable): Decoded text chunks of the document
+        keys (tuple): See JsonArrayStream
+
+    Yields:
+        str: Raw JSON text of each item
+
+    Raises:
+        json.JSONDecodeError: The document was truncated
+    """
+    stream = JsonArrayStream(keys)
+    for chunk in chunks:
+        for item in stream.feed(chunk):
+            yield item
+        if stream.done:
+            return
+    stream.close()
+
+def iter_response_items(response, keys=('messages', 'data'), chunk_size=65536, check=None):
+    """
+    Stream array items out of a requests response opened with stream=True
+
+    Args:
+        response (requests.Response): Streaming response
+        keys (tuple): See JsonArrayStream
+        chunk_size (int): Bytes read per chunk
+        check (callable): Called after every chunk; may raise to abandon the response
+
+    Yields:
+        str: Raw JSON text of each item
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def blocks():
+        # With a check, hand over whatever has arrived (urllib3 2's read1)
+        # so a slow trickle cannot hold off the next check for a full chunk
+        raw = response.raw
+        if check and hasattr(raw, 'read1'):
+            while True:
+                block = raw.read1(chunk_size, decode_content=True)
+                if not block:
+                    return
+                yield block
+        else:
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def chunks():
+        for block in blocks():
+            if check:
+                check()
+            yield decoder.decode(block)
+        yield decoder.decode(b'', final=True)
+
+    try:
+        yield from iter_array_items(chunks(), keys)
+    finally:
+        response.close()
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+def _skip_string(text, pos):
+    """Return the index just after the string starting at text[pos] == '"'"""
+    # str.find is much faster than a regex over long bodies; a quote ends
+    # the string unless it is preceded by an odd number of backslashes
+    start = pos + 1
+    pos = start
+    while True:
+        quote = text.find('"', pos)
+        if quote < 0:
+            raise json.JSONDecodeError('Unterminated string', text, pos)
+        backslash = quote
+        while backslash > start and text[backslash - 1] == '\\':
+            backslash -= 1
+        if (quote - backslash) % 2 == 0:
+            return quote + 1
+        pos = quote + 1
+
+def skip_value(text, pos):
+    """
+    Find the end of the JSON value starting at text[pos] without decoding it
+
+    Args:
+        text (str): JSON text
+        pos (int): Index of the value's first character
+
+    Returns:
+        int: Index just after the value
+    """
+    ch = text[pos]
+    if ch == '"':
+        return _skip_string(text, pos)
+    if ch in '{[':
+        depth = 0
+        while True:
+            m = _BRACKET_OR_QUOTE.search(text, pos)
+            if not m:
+                raise json.JSONDecodeError('Unterminated value', text, pos)
+            if m.group() == '"':
+                pos = _skip_string(text, m.start())
+                continue
+            depth += 1 if m.group() in '{[' else -1
+            pos = m.end()
+            if depth == 0:
+                return pos
+    m = _SCALAR_END.search(text, pos)
+    return m.start() if m else len(text)
+
+def iter_members(text):
+    """
+    Walk the top-level members of a JSON object without decoding the values
+
+    Args:
+        text (str): Raw JSON text of one object
+
+    Yields:
+        tuple: (key, value_start, value_end) - the value is text[value_start:value_end]
+    """
+    pos = _skip_whitespace(text, 0)
+    if text[pos:pos + 1] != '{':
+        raise json.JSONDecodeError('Expecting object', text, pos)
+    pos += 1
+    while True:
+        pos = _skip_whitespace(text, pos)
+        ch = text[pos:pos + 1]
+        if ch == '}' or not ch:
+            return
+        if ch == ',':
+            pos += 1
+            continue
+        key, pos = scanstring(text, pos + 1)
+        pos = _skip_whitespace(text, pos)
+        if text[pos:pos + 1] != ':':
+            raise json.JSONDecodeError("Expecting ':'", text, pos)
+        pos = _skip_whitespace(text, pos + 1)
+        end = skip_value(text, pos)
+        yield key, pos, end
+        pos = end
+
+def peek_member(text, key, default=None):
+    """
+    Decode a single top-level member of a raw JSON object
+
+    Only the requested value is decoded; every other value is skipped.
+
+    Args:
+        text (str): Raw JSON text of one object
+        key (str): Member to decode
+        default: Returned when the member is missing
+
+    Returns:
+        The decoded value, or default
+    """
+    for member, start, end in iter_members(text):
+        if member == key:
+            return json.loads(text[start:end])
+    return default
@@ -0,0 +1,167 @@
+import json
+
+from json_stream import iter_members
+
+# One message from the Boomlify API.
+#
+# The API is not consistent about field names, so every field has a list of
+# aliases; the first one present in the message wins:
+#     sender     <- from, sender
+#     recipient  <- to, recipient
+#     text       <- text, body, content
+#     html       <- html, html_body
+#     date       <- date, created_at
+#
+# Aliases are resolved once, when the Message is built at ingest. Built
+# from raw JSON text (see json_stream), only the small fields are decoded
+# up front; the text and HTML bodies stay as spans of the raw text and are
+# decoded the first time they are read.
+FIELD_ALIASES = {
+    'id': ('id',),
+    'sender': ('from', 'sender'),
+    'recipient': ('to', 'recipient'),
+    'subject': ('subject',),
+    'date': ('date', 'created_at'),
+    'text': ('text', 'body', 'content'),
+    'html': ('html', 'html_body'),
+    'headers': ('headers',),
+    'attachments': ('attachments',),
+    'read': ('read',),
+    'flagged': ('flagged',)
+}
+LAZY_FIELDS = ('text', 'html')
+
+# API key -> (field, alias rank), lower rank wins
+_KEY_TO_FIELD = {alias: (field, rank)
+                 for field, aliases in FIELD_ALIASES.items()
+                 for rank, alias in enumerate(aliases)}
+
+_UNSET = object()
+
+class Message:
+    __slots__ = ('id', 'sender', 'recipient', 'subject', 'date', 'headers',
+                 'attachments', 'read', 'flagged', '_raw', '_data',
+                 '_text', '_html', '_text_span', '_html_span')
+
+    def __init__(self):
+        """Empty message - use Message.from_json() or Message.from_dict()"""
+        self.id = None
+        self.sender = None
+        self.recipient = None
+        self.subject = None
+        self.date = None
+        self.headers = None
+        self.attachments = None
+        self.read = None
+        self.flagged = None
+        self._raw = None
+        self._data = None
+        self._text = _UNSET
+        self._html = _UNSET
+        self._text_span = None
+        self._html_span = None
+
+    @classmethod
+    def from_json(cls, raw):
+        """
+        Build a message from the raw JSON text of one API message
+
+        Args:
+            raw (str): JSON object text, e.g. an item from iter_response_items
+
+        Returns:
+            Message: Message with the bodies left undecoded
+        """
+        message = cls()
+        message._raw = raw
+        ranks = {}
+        for key, start, end in iter_members(raw):
+            target = _KEY_TO_FIELD.get(key)
+            if target is None:
+                continue
+            field, rank = target
+            if ranks.get(field, rank + 1) <= rank:
+                continue
+            ranks[field] = rank
+            if field in LAZY_FIELDS:
+                setattr(message, f"_{field}_span", (start, end))
+            else:
+                setattr(message, field, json.loads(raw[start:end]))
+        return message
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a message from an already decoded API message
+
+        Args:
+            data (dict): Message dictionary
+
+        Returns:
+            Message: Message wrapping the dictionary
+        """
+        message = cls()
+        message._data = data
+        for field, aliases in FIELD_ALIASES.items():
+            for alias in aliases:
+                if alias in data:
+                    if field in LAZY_FIELDS:
+                        setattr(message, f"_{field}", data[alias])
+                    else:
+                        setattr(message, field, data[alias])
+                    break
+        return message
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a message saved by save_message_details
+
+        Args:
+            path (str): Path of a message_details_*.json file
+
+        Returns:
+            Message: The saved message
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_json(f.read())
+
+    def _decode_body(self, field):
+        value = getattr(self, f"_{field}")
+        if value is _UNSET:
+            span = getattr(self, f"_{field}_span")
+            value = json.loads(self._raw[span[0]:span[1]]) if span else None
+            setattr(self, f"_{field}", value)
+            setattr(self, f"_{field}_span", None)
+        return value
+
+    @property
+    def text(self):
+        """Plain text body (text/body/content), decoded on first access"""
+        return self._decode_body('text')
+
+    @property
+    def html(self):
+        """HTML body (html/html_body), decoded on first access"""
+        return self._decode_body('html')
+
+    @property
+    def raw(self):
+        """The message as JSON text, exactly as received when built from JSON"""
+        if self._raw is not None:
+            return self._raw
+        return json.dumps(self._data)
+
+    def to_dict(self):
+        """
+        The full message in the API's own format (all original keys)
+
+        Returns:
+            dict: Message dictionary, suitable for json.dump
+        """
+        if self._data is not None:
+            return self._data
+        return json.loads(self._raw)
+
+    def __repr__(self):
+        return f"Message(id={self.id!r}, subject={self.subject!r})"
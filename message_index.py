@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+import argparse
+import html
+import json
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from message_store import load_message, store_dir, stored_ids, stored_path
+from pipeline_log import get_logger
+
+log = get_logger('message_index')
+
+# Persistent full-text index over received mail.
+#
+# An inverted index in SQLite (stdlib, one file next to the message store):
+#
+#     docs(doc, message_id, sender, subject, date, length)     one row per message
+#     terms(term, df)                                           document frequency
+#     postings(term, doc, field, tf)                            clustered by term
+#
+# Tokens are lower-cased words from the subject, sender and body (the text
+# body, or the HTML with tags stripped when there is no text). Messages are
+# indexed incrementally as check_messages ingests them; `build` indexes
+# the stored messages (message_store) that are not in the index yet,
+# tokenizing in a multiprocessing pool when there are many of them.
+#
+# Queries look up only the posting lists of their terms (rarest first) and
+# rank with BM25, weighting subject and sender hits above body hits, so
+# they take milliseconds however large the archive is.
+#
+#     MESSAGE_INDEX=message_index.sqlite     index file (default: in the store directory)
+#
+# Command line:
+#     python3 message_index.py search "confirm account" [--from embyil] [--since 2024-01-01] [--limit 10] [--any] [--json]
+#     python3 message_index.py search "subject:welcome from:noreply"
+#     python3 message_index.py build [--workers N] [--rebuild]
+#     python3 message_index.py stats
+INDEX_ENV = 'MESSAGE_INDEX'
+INDEX_FILE = 'message_index.sqlite'
+
+FIELD_SUBJECT = 0
+FIELD_SENDER = 1
+FIELD_BODY = 2
+FIELD_WEIGHTS = {FIELD_SUBJECT: 3.0, FIELD_SENDER: 2.0, FIELD_BODY: 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Below this many files the pool costs more than it saves
+PARALLEL_MIN_FILES = 200
+BUILD_BATCH = 2000
+MAX_TOKEN_LENGTH = 64
+
+_TOKEN = re.compile(r'\w+')
+_TAG = re.compile(r'<(script|style)\b.*?</\1>|<[^>]+>', re.IGNORECASE | re.DOTALL)
+_FILTER = re.compile(r'(\w+):("[^"]*"|\S+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc INTEGER PRIMARY KEY,
+    message_id TEXT UNIQUE NOT NULL,
+    sender TEXT,
+    subject TEXT,
+    date TEXT,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    field INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE INDEX IF NOT EXISTS docs_date ON docs (date);
+"""
+
+def index_path():
+    """Path of the index file"""
+    return os.path.abspath(os.environ.get(INDEX_ENV) or os.path.join(store_dir(), INDEX_FILE))
+
+def tokenize(text):
+    """
+    Lower-cased word tokens of a text
+
+    Returns:
+        list: Tokens, in order (over-long tokens dropped)
+    """
+    if not text:
+        return []
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+def html_to_text(markup):
+    """Visible text of an HTML body (tags, scripts and styles removed)"""
+    if not markup:
+        return ''
+    return html.unescape(_TAG.sub(' ', markup))
+
+def analyze(message):
+    """
+    Index record of one message
+
+    Args:
+        message (Message): The message
+
+    Returns:
+        tuple: (message_id, sender, subject, date, length, {(term, field): tf})
+    """
+    sender = message.sender if isinstance(message.sender, str) else json.dumps(message.sender) if message.sender else ''
+    subject = message.subject if isinstance(message.subject, str) else ''
+    body = message.text if isinstance(message.text, str) and message.text else html_to_text(message.html)
+
+    postings = {}
+    length = 0
+    for field, text in ((FIELD_SUBJECT, subject), (FIELD_SENDER, sender), (FIELD_BODY, body)):
+        tokens = tokenize(text)
+        length += len(tokens)
+        for token in tokens:
+            key = (token, field)
+            postings[key] = postings.get(key, 0) + 1
+    date = message.date if isinstance(message.date, str) else None
+    return str(message.id), sender, subject, date, length, postings
+
+def _analyze_stored(item):
+    """Pool worker: index record of one stored message (None if unreadable)"""
+    message_id, directory = item
+    try:
+        message = load_message(message_id, directory)
+    except (OSError, ValueError):
+        return None
+    if message is None:
+        return None
+    if not message.id:
+        message.id = message_id
+    return analyze(message)
+
+class MessageIndex:
+    def __init__(self, path=None):
+        """
+        Inverted index of received messages
+
+        Args:
+            path (str): Index file (default: index_path())
+        """
+        self.path = path or index_path()
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _meta(self, key, default=0):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def add_records(self, records):
+        """
+        Insert analyzed messages in one transaction
+
+        Postings and document frequencies of the whole batch are written
+        together, sorted by term, so a large build appends to the term
+        B-tree in order instead of seeking for every message.
+
+        Returns:
+            int: Messages newly indexed
+        """
+        postings = []
+        dfs = {}
+        added = 0
+        total_length = 0
+        with self.lock, self.db:
+            for record in records:
+                if not record:
+                    continue
+                message_id, sender, subject, date, length, counts = record
+                cursor = self.db.execute(
+                    'INSERT OR IGNORE INTO docs (message_id, sender, subject, date, length) VALUES (?, ?, ?, ?, ?)',
+                    (message_id, sender, subject, date, length))
+                if not cursor.rowcount:
+                    continue
+                doc = cursor.lastrowid
+                postings.extend((term, doc, field, tf) for (term, field), tf in counts.items())
+                for term in {term for term, _ in counts}:
+                    dfs[term] = dfs.get(term, 0) + 1
+                added += 1
+                total_length += length
+            if not added:
+                return 0
+            postings.sort()
+            self.db.executemany('INSERT INTO postings (term, doc, field, tf) VALUES (?, ?, ?, ?)', postings)
+            self.db.executemany('INSERT INTO terms (term, df) VALUES (?, ?) '
+                                'ON CONFLICT(term) DO UPDATE SET df = df + excluded.df', sorted(dfs.items()))
+            self.db.execute("INSERT INTO meta (key, value) VALUES ('total_length', ?) "
+                            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value", (total_length,))
+        return added
+
+    def add_message(self, message):
+        """
+        Index one message (no-op when it is already indexed)
+
+        Returns:
+            bool: True when it was added
+        """
+        if not message.id:
+            return False
+        return self.add_records([analyze(message)]) == 1
+
+    def indexed_ids(self):
+        """Message IDs in the index"""
+        with self.lock:
+            return {row[0] for row in self.db.execute('SELECT message_id FROM docs')}
+
+    def clear(self):
+        """Drop everything from the index"""
+        with self.lock, self.db:
+            for table in ('postings', 'terms', 'docs', 'meta'):
+                self.db.execute(f'DELETE FROM {table}')
+
+    def stats(self):
+        """
+        Size of the index
+
+        Returns:
+            dict: messages, terms, postings, path and size in bytes
+        """
+        with self.lock:
+            count = lambda table: self.db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            stats = {'messages': count('docs'), 'terms': count('terms'), 'postings': count('postings')}
+        stats['path'] = self.path
+        stats['bytes'] = sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                             if os.path.exists(self.path + suffix))
+        return stats
+
+    def search(self, query='', limit=10, match_all=True, sender=None, subject=None, since=None, until=None):
+        """
+        Ranked search
+
+        Args:
+            query (str): Words to look for; may contain filters -
+                from:<text>, subject:<word>, since:<date>, until:<date>
+            limit (int): Maximum results
+            match_all (bool): Every word must match (False = any word)
+            sender (str): Only messages whose sender contains this text
+            subject (str): Only messages with this word in the subject
+            since (str): Only messages dated on or after this (ISO date/time prefix)
+            until (str): Only messages dated before the end of this day/time
+
+        Returns:
+            list: Result dicts (message_id, score, subject, sender, date), best first
+        """
+        terms, filters = parse_query(query)
+        sender = sender or filters.get('from')
+        subject_terms = tokenize(subject or filters.get('subject') or '')
+        since = since or filters.get('since')
+        until = until or filters.get('until')
+
+        with self.lock:
+            if not terms and not subject_terms:
+                return self._filter_only(limit, sender, since, until)
+
+            candidates = None
+            for term in subject_terms:
+                docs = {row[0] for row in self.db.execute(
+                    'SELECT doc FROM postings WHERE term = ? AND field = ?', (term, FIELD_SUBJECT))}
+                candidates = docs if candidates is None else candidates & docs
+                if not candidates:
+                    return []
+
+            scores = {}
+            if terms:
+                scores = self._score(terms, match_all, candidates)
+            else:
+                scores = {doc: 0.0 for doc in candidates}
+            if not scores:
+                return []
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for start in range(0, len(ranked), 500):
+                chunk = ranked[start:start + 500]
+                rows = self._docs([doc for doc, _ in chunk])
+                for doc, score in chunk:
+                    row = rows.get(doc)
+                    if row and _passes(row, sender, since, until):
+                        results.append(_result(row, score))
+                        if len(results) >= limit:
+                            return results
+            return results
+
+    def _score(self, terms, match_all, candidates):
+        """BM25 scores of the documents matching the terms"""
+        doc_count = self.db.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+        if not doc_count:
+            return {}
+        avg_length = max(float(self._meta('total_length')) / doc_count, 1.0)
+
+        unique = list(dict.fromkeys(terms))
+        dfs = {}
+        for term in unique:
+            row = self.db.execute('SELECT df FROM terms WHERE term = ?', (term,)).fetchone()
+            dfs[term] = row[0] if row else 0
+        if match_all and not all(dfs.values()):
+            return {}
+
+        # Rarest term first: its posting list bounds the candidates of an AND query
+        weighted = {}
+        for term in sorted((t for t in unique if dfs[t]), key=lambda t: dfs[t]):
+            if match_all and candidates is not None:
+                if not candidates:
+                    return {}
+                rows = []
+                docs = list(candidates)
+                for start in range(0, len(docs), 500):
+                    chunk = docs[start:start + 500]
+                    rows.extend(self.db.execute(
+                        f"SELECT doc, field, tf FROM postings WHERE term = ? AND doc IN ({','.join('?' * len(chunk))})",
+                        [term] + chunk))
+            else:
+                rows = self.db.execute('SELECT doc, field, tf FROM postings WHERE term = ?', (term,)).fetchall()
+
+            term_tf = {}
+            for doc, field, tf in rows:
+                term_tf[doc] = term_tf.get(doc, 0.0) + FIELD_WEIGHTS.get(field, 1.0) * tf
+            if match_all:
+                candidates = set(term_tf) if candidates is None else candidates & set(term_tf)
+            elif candidates is not None:
+                term_tf = {doc: tf for doc, tf in term_tf.items() if doc in candidates}
+            weighted[term] = term_tf
+
+        docs = candidates if match_all else set().union(*weighted.values()) if weighted else set()
+        if not docs:
+            return {}
+        lengths = self._lengths(docs)
+        scores = {}
+        for term, term_tf in weighted.items():
+            df = dfs[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for doc in docs:
+                tf = term_tf.get(doc)
+                if not tf:
+                    continue
+                norm = 1 - BM25_B + BM25_B * lengths.get(doc, avg_length) / avg_length
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return scores
+
+    def _lengths(self, docs):
+        lengths = {}
+        docs = list(docs)
+        for start in range(0, len(docs), 500):
+            chunk = docs[start:start + 500]
+            lengths.update(self.db.execute(
+                f"SELECT doc, length FROM docs WHERE doc IN ({','.join('?' * len(chunk))})", chunk))
+        return lengths
+
+    def _docs(self, docs):
+        rows = self.db.execute(
+            f"SELECT doc, message_id, sender, subject, date FROM docs WHERE doc IN ({','.join('?' * len(docs))})", docs)
+        return {row[0]: row for row in rows}
+
+    def _filter_only(self, limit, sender, since, until):
+        """Newest messages matching the filters (a query without words)"""
+        sql = 'SELECT doc, message_id, sender, subject, date FROM docs WHERE 1 = 1'
+        params = []
+        if sender:
+            sql += ' AND sender LIKE ?'
+            params.append(f"%{sender}%")
+        if since:
+            sql += ' AND date >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND date < ?'
+            params.append(_until_bound(until))
+        sql += ' ORDER BY date DESC LIMIT ?'
+        params.append(limit)
+        return [_result(row, 0.0) for row in self.db.execute(sql, params)]
+
+def _until_bound(until):
+    # A date means "through the end of that day"
+    return until + '\uffff'
+
+def _passes(row, sender, since, until):
+    _, _, row_sender, _, date = row
+    if sender and sender.lower() not in (row_sender or '').lower():
+        return False
+    if since and (not date or date < since):
+        return False
+    if until and (not date or date >= _until_bound(until)):
+        return False
+    return True
+
+def _result(row, score):
+    return {'message_id': row[1], 'score': round(score, 4), 'subject': row[3], 'sender': row[2], 'date': row[4]}
+
+def parse_query(query):
+    """
+    Split a query into words and filters
+
+    Returns:
+        tuple: (terms, {filter: value}) - filters are from, subject, since, until
+    """
+    filters = {}
+
+    def take(match):
+        key = match.group(1).lower()
+        if key not in ('from', 'subject', 'since', 'until'):
+            return match.group(0)
+        filters[key] = match.group(2).strip('"')
+        return ' '
+    rest = _FILTER.sub(take, query or '')
+    return tokenize(rest), filters
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """The process-wide index (opened on first use)"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.path != index_path():
+            _index = MessageIndex()
+        return _index
+
+def index_message(message):
+    """
+    Add a freshly ingested message to the index
+
+    Indexing problems are reported and never stop ingest.
+
+    Returns:
+        bool: True when the message was added
+    """
+    try:
+        return get_index().add_message(message)
+    except (sqlite3.Error, OSError) as e:
+        log.warning(f"⚠️ Could not index message {message.id}: {e}")
+        return False
+
+def build_index(directory=None, workers=None, rebuild=False, index=None):
+    """
+    Index every stored message that is not in the index yet
+
+    Files are parsed and tokenized in a process pool when there are at
+    least PARALLEL_MIN_FILES of them; the index is written by this process
+    in batches.
+
+    Args:
+        directory (str): Store directory (default: store_dir())
+        workers (int): Pool size (default: CPU count)
+        rebuild (bool): Empty the index first
+        index (MessageIndex): Index to fill (default: get_index())
+
+    Returns:
+        dict: files, indexed, skipped, workers and seconds
+    """
+    started = time.monotonic()
+    index = index or get_index()
+    if rebuild:
+        index.clear()
+    known = index.indexed_ids()
+    pending = [(message_id, directory) for message_id in stored_ids(directory) if message_id not in known]
+
+    workers = workers or os.cpu_count() or 1
+    parallel = workers > 1 and len(pending) >= PARALLEL_MIN_FILES
+    indexed = 0
+    if parallel:
+        with multiprocessing.Pool(workers) as pool:
+            batch = []
+            for record in pool.imap_unordered(_analyze_stored, pending, chunksize=32):
+                batch.append(record)
+                if len(batch) >= BUILD_BATCH:
+                    indexed += index.add_records(batch)
+                    batch = []
+            indexed += index.add_records(batch)
+    else:
+        for start in range(0, len(pending), BUILD_BATCH):
+            indexed += index.add_records([_analyze_stored(item) for item in pending[start:start + BUILD_BATCH]])
+
+    return {
+        'files': len(pending),
+        'indexed': indexed,
+        'skipped': len(pending) - indexed,
+        'workers': workers if parallel else 1,
+        'seconds': round(time.monotonic() - started, 3)
+    }
+
+def main(argv=None):
+    """Command line: search, build, stats"""
+    parser = argparse.ArgumentParser(description='Full-text index of received messages')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    search = sub.add_parser('search', help='Ranked search')
+    search.add_argument('query', nargs='*', help='Words, plus from:/subject:/since:/until: filters')
+    search.add_argument('--from', dest='sender', help='Sender contains this text')
+    search.add_argument('--subject', help='Word that must be in the subject')
+    search.add_argument('--since', help='Dated on or after (e.g. 2024-05-01)')
+    search.add_argument('--until', help='Dated on or before (e.g. 2024-05-31)')
+    search.add_argument('--limit', type=int, default=10)
+    search.add_argument('--any', action='store_true', help='Match any word instead of all of them')
+    search.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    build = sub.add_parser('build', help='Index stored messages not indexed yet')
+    build.add_argument('--workers', type=int, help='Tokenizer processes (default: CPU count)')
+    build.add_argument('--rebuild', action='store_true', help='Start from an empty index')
+
+    sub.add_parser('stats', help='Index size')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        print(f"🔨 Indexing stored messages into {index_path()}...")
+        result = build_index(workers=args.workers, rebuild=args.rebuild)
+        print(f"✅ Indexed {result['indexed']} of {result['files']} new files "
+              f"in {result['seconds']:.2f}s ({result['workers']} worker{'s' if result['workers'] != 1 else ''})")
+        return 0
+
+    if args.command == 'stats':
+        print(json.dumps(get_index().stats(), indent=2))
+        return 0
+
+    start = time.perf_counter()
+    results = get_index().search(' '.join(args.query), limit=args.limit, match_all=not args.any,
+                                 sender=args.sender, subject=args.subject, since=args.since, until=args.until)
+    elapsed = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0 if results else 1
+
+    if not results:
+        print(f"📭 No matching messages ({elapsed:.1f} ms)")
+        return 1
+    print(f"🔎 {len(results)} result{'s' if len(results) != 1 else ''} ({elapsed:.1f} ms)")
+    for i, result in enumerate(results, 1):
+        print(f"\n{i}. 📋 {result['subject'] or 'No Subject'}")
+        print(f"   📤 {result['sender'] or 'N/A'}   📅 {result['date'] or 'N/A'}   ⭐ {result['score']}")
+        print(f"   🆔 {result['message_id']}")
+        path = stored_path(result['message_id'])
+        if path:
+            print(f"   📄 {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
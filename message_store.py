@@ -0,0 +1,686 @@
+#!/usr/bin/env python3
+import argparse
+import functools
+import hashlib
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+from mail_message import Message
+
+# Full message content, one record per message.
+#
+# Two formats, chosen by MESSAGE_STORE_FORMAT (reading always tries both):
+#
+#     archive (default)    <MESSAGE_STORE_DIR>/message_archive/<id>.mz
+#     json                 <MESSAGE_STORE_DIR>/message_details_<id>.json   (indented, uncompressed)
+#
+# (default directory: the current one, i.e. the Jenkins workspace). Files
+# are written atomically, so an interrupted export never leaves a
+# half-written file behind.
+#
+# Transactional mail is the same few templates with a token changed, so
+# the archive stores it as:
+#
+#     message_archive/<id>.mz            the message, compact JSON, compressed
+#     message_archive/parts/<sha256>.mz  text/HTML bodies of 256+ bytes, stored once
+#                                        per distinct content and referenced by hash
+#     message_archive/dict-<id>.zdict    zlib preset dictionaries trained on the archive
+#     message_archive/DICTIONARY         id of the dictionary new writes use
+#
+# Every .mz file is "MZ1" + the 8-character id of its dictionary
+# ("00000000" = none) + a zlib stream, so records stay readable after the
+# dictionary is retrained. The first TRAIN_MIN_SAMPLES messages are
+# compressed without a dictionary; the next write trains one from them.
+# A dictionary is only installed when it saves more than its own size on
+# the documents it was trained on (a 32 KB dictionary does not pay off on
+# a small archive). `compact` retrains on the whole archive, moves legacy
+# JSON files into it, rewrites every record and drops parts and
+# dictionaries nothing uses - unless the rewrite would not make the store
+# smaller, in which case it leaves it alone.
+#
+# Random access by message ID reads one record plus the parts it names
+# (cached - parts never change); scans read each shared part only once.
+#
+#     python3 message_store.py stats | ids | show <id> | compact | export-json [--out DIR]
+#
+# StoreWriter is the single writer thread of a bulk export: fetch workers
+# put() messages on its bounded queue and only the writer touches the
+# disk, so writes never interleave and a slow disk slows the fetchers down
+# instead of filling memory.
+STORE_DIR_ENV = 'MESSAGE_STORE_DIR'
+STORE_FORMAT_ENV = 'MESSAGE_STORE_FORMAT'
+FORMAT_ARCHIVE = 'archive'
+FORMAT_JSON = 'json'
+FILE_PREFIX = 'message_details_'
+FILE_SUFFIX = '.json'
+
+ARCHIVE_DIR = 'message_archive'
+PARTS_DIR = 'parts'
+RECORD_SUFFIX = '.mz'
+DICTIONARY_POINTER = 'DICTIONARY'
+MAGIC = b'MZ1'
+NO_DICTIONARY = '00000000'
+
+# Body fields worth storing once and sharing between messages
+PART_FIELDS = ('text', 'body', 'content', 'html', 'html_body')
+PART_MIN_BYTES = 256
+DICTIONARY_SIZE = 32 * 1024
+TRAIN_MIN_SAMPLES = 16
+TRAIN_MAX_SAMPLES = 512
+# Trainer: a sample is already covered when the dictionary shrinks it to a fifth,
+# and a dictionary piece is used when it at least halves a sample
+TRAIN_COVERED = 0.2
+TRAIN_USED = 0.5
+TRAIN_CHECK_SAMPLES = 128
+COMPRESSION_LEVEL = 9
+
+_lock = threading.RLock()
+
+def store_dir():
+    """Directory holding the message files"""
+    return os.environ.get(STORE_DIR_ENV) or '.'
+
+def store_format():
+    """Format new messages are written in (archive or json)"""
+    value = (os.environ.get(STORE_FORMAT_ENV) or FORMAT_ARCHIVE).strip().lower()
+    return FORMAT_JSON if value == FORMAT_JSON else FORMAT_ARCHIVE
+
+def archive_dir(directory=None):
+    """Directory of the compressed archive"""
+    return os.path.join(directory or store_dir(), ARCHIVE_DIR)
+
+def _contained(path, parent):
+    """path, checked to name a file directly in parent (message IDs come from outside)"""
+    if os.path.realpath(os.path.dirname(path)) != os.path.realpath(parent):
+        raise ValueError(f"Message file {path!r} would be outside {parent!r}")
+    return path
+
+def message_path(message_id, directory=None):
+    """
+    Path of one message in the plain JSON format
+
+    Args:
+        message_id (str): The message ID
+        directory (str): Store directory (default: store_dir())
+
+    Returns:
+        str: Path of message_details_<id>.json
+
+    Raises:
+        ValueError: The ID would put the file outside the store directory
+    """
+    directory = directory or store_dir()
+    return _contained(os.path.join(directory, f"{FILE_PREFIX}{message_id}{FILE_SUFFIX}"), directory)
+
+def record_path(message_id, directory=None):
+    """Path of one message in the archive (ValueError if it would be outside it)"""
+    root = archive_dir(directory)
+    return _contained(os.path.join(root, f"{message_id}{RECORD_SUFFIX}"), root)
+
+def stored_path(message_id, directory=None):
+    """
+    File holding a stored message
+
+    Returns:
+        str: Archive record or JSON file, or None when the message isn't stored
+    """
+    for path in (record_path(message_id, directory), message_path(message_id, directory)):
+        if os.path.exists(path):
+            return path
+    return None
+
+def _atomic_write(path, data):
+    """Write bytes to path via a temporary file in the same directory"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.part', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# ---- compression -------------------------------------------------------
+
+def _compressed_size(data, dictionary=None):
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary) if dictionary else zlib.compressobj(COMPRESSION_LEVEL)
+    return len(compressor.compress(data) + compressor.flush())
+
+def train_dictionary(samples, size=DICTIONARY_SIZE):
+    """
+    Build a zlib preset dictionary from sample messages
+
+    zlib matches long runs, so the dictionary is made of whole samples
+    rather than fragments: a sample is taken when the dictionary so far
+    does not already cover it (one per template, in practice), and kept
+    when at least two samples compress markedly better against it. The
+    most used go last, where zlib reaches them with the shortest distances.
+
+    Args:
+        samples (list): Sample documents (bytes)
+        size (int): Dictionary size limit in bytes
+
+    Returns:
+        bytes: The dictionary (empty when the samples share nothing)
+    """
+    pieces = []
+    used = 0
+    for sample in samples:
+        sample = sample[:size]
+        if len(sample) < 64:
+            continue
+        if used and _compressed_size(sample, b''.join(pieces)[-size:]) < TRAIN_COVERED * _compressed_size(sample):
+            continue
+        pieces.append(sample)
+        used += len(sample)
+        if used >= size:
+            break
+
+    checked = samples[:TRAIN_CHECK_SAMPLES]
+    plain = [_compressed_size(sample) for sample in checked]
+    ranked = []
+    for piece in pieces:
+        uses = sum(1 for sample, baseline in zip(checked, plain)
+                   if _compressed_size(sample, piece) < TRAIN_USED * baseline)
+        if uses >= 2:
+            ranked.append((uses, piece))
+    ranked.sort(key=lambda item: item[0])
+    return b''.join(piece for _, piece in ranked)[-size:]
+
+def _dictionary_cost(documents, dictionary):
+    """Bytes the documents take compressed with a dictionary, the dictionary itself included"""
+    return sum(_compressed_size(document, dictionary) for document in documents) + len(dictionary or b'')
+
+def best_dictionary(documents, trained):
+    """
+    The cheapest of no dictionary, the trained one and its most used quarter
+
+    Args:
+        documents (list): The documents it will compress (bytes)
+        trained (bytes): Result of train_dictionary
+
+    Returns:
+        bytes: The dictionary to use (empty = none)
+    """
+    candidates = [b'']
+    if trained:
+        candidates.append(trained)
+        if len(trained) >= 4096:
+            # The most used pieces are at the end
+            candidates.append(trained[-(len(trained) // 4):])
+    return min(candidates, key=lambda dictionary: _dictionary_cost(documents, dictionary))
+
+def _dictionary_id(dictionary):
+    return hashlib.sha256(dictionary).hexdigest()[:8]
+
+def _dictionary_path(dictionary_id, directory=None):
+    return os.path.join(archive_dir(directory), f"dict-{dictionary_id}.zdict")
+
+@functools.lru_cache(maxsize=16)
+def _read_dictionary(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _dictionary(dictionary_id, directory=None):
+    if dictionary_id == NO_DICTIONARY:
+        return None
+    return _read_dictionary(os.path.abspath(_dictionary_path(dictionary_id, directory)))
+
+def current_dictionary(directory=None):
+    """
+    Dictionary new writes are compressed with
+
+    Returns:
+        tuple: (dictionary id, bytes), or (NO_DICTIONARY, None) before one is trained
+    """
+    try:
+        with open(os.path.join(archive_dir(directory), DICTIONARY_POINTER), 'r') as f:
+            dictionary_id = f.read().strip()
+        return dictionary_id, _dictionary(dictionary_id, directory)
+    except OSError:
+        return NO_DICTIONARY, None
+
+def install_dictionary(dictionary, directory=None):
+    """
+    Save a trained dictionary and make it the one new writes use
+
+    An empty dictionary records that training found nothing worth sharing
+    (new writes then use none, and no retraining is attempted until compact).
+
+    Returns:
+        str: Its id
+    """
+    dictionary_id = _dictionary_id(dictionary) if dictionary else NO_DICTIONARY
+    path = _dictionary_path(dictionary_id, directory)
+    if dictionary and not os.path.exists(path):
+        _atomic_write(path, dictionary)
+    _atomic_write(os.path.join(archive_dir(directory), DICTIONARY_POINTER), dictionary_id.encode('ascii'))
+    return dictionary_id
+
+def compress(data, dictionary_id=NO_DICTIONARY, dictionary=None):
+    """Frame bytes as an .mz blob (zlib, with the preset dictionary if given)"""
+    if dictionary:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        dictionary_id = NO_DICTIONARY
+    return MAGIC + dictionary_id.encode('ascii') + compressor.compress(data) + compressor.flush()
+
+def decompress(blob, directory=None):
+    """
+    Bytes of an .mz blob
+
+    Raises:
+        ValueError: When the blob is not an .mz blob
+    """
+    if blob[:3] != MAGIC:
+        raise ValueError('Not a message archive record')
+    dictionary = _dictionary(blob[3:11].decode('ascii'), directory)
+    decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    try:
+        return decompressor.decompress(blob[11:]) + decompressor.flush()
+    except zlib.error as e:
+        raise ValueError(f"Corrupt message archive record: {e}")
+
+# ---- archive records ---------------------------------------------------
+
+def _part_path(digest, directory=None):
+    return os.path.join(archive_dir(directory), PARTS_DIR, f"{digest}{RECORD_SUFFIX}")
+
+@functools.lru_cache(maxsize=256)
+def _read_part(path, directory):
+    with open(path, 'rb') as f:
+        return decompress(f.read(), directory).decode('utf-8')
+
+def _split_parts(data):
+    """Message dict with large bodies replaced by hashes: (record dict, {digest: text})"""
+    record = dict(data)
+    refs = {}
+    parts = {}
+    for field in PART_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str) and len(value) >= PART_MIN_BYTES:
+            digest = hashlib.sha256(value.encode('utf-8')).hexdigest()
+            refs[field] = digest
+            parts[digest] = value
+            record[field] = None
+    if refs:
+        record['$parts'] = refs
+    return record, parts
+
+def _encode_record(message_id, message, directory, dictionary_id, dictionary, rewrite_parts=False):
+    """Write the parts of one message; returns (record blob, bytes of new parts)"""
+    record, parts = _split_parts(message.to_dict())
+    written = 0
+    for digest, text in parts.items():
+        path = _part_path(digest, directory)
+        if rewrite_parts or not os.path.exists(path):
+            blob = compress(text.encode('utf-8'), dictionary_id, dictionary)
+            _atomic_write(path, blob)
+            written += len(blob)
+    data = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return compress(data, dictionary_id, dictionary), written
+
+def _decode_record(blob, directory=None):
+    """Message dict of an archive record, bodies restored"""
+    record = json.loads(decompress(blob, directory))
+    refs = record.pop('$parts', None) or {}
+    root = os.path.abspath(directory or store_dir())
+    for field, digest in refs.items():
+        record[field] = _read_part(os.path.abspath(_part_path(digest, directory)), root)
+    return record
+
+def _archive_ids(directory=None):
+    try:
+        names = os.listdir(archive_dir(directory))
+    except OSError:
+        return []
+    return [name[:-len(RECORD_SUFFIX)] for name in names if name.endswith(RECORD_SUFFIX)]
+
+def _training_samples(directory=None, limit=TRAIN_MAX_SAMPLES):
+    """Decompressed records and parts of the archive, as training samples"""
+    samples = []
+    parts = set()
+    for message_id in sorted(_archive_ids(directory))[-limit:]:
+        try:
+            with open(record_path(message_id, directory), 'rb') as f:
+                blob = decompress(f.read(), directory)
+        except (OSError, ValueError):
+            continue
+        samples.append(blob)
+        parts.update((json.loads(blob).get('$parts') or {}).values())
+    for digest in sorted(parts)[:limit]:
+        try:
+            with open(_part_path(digest, directory), 'rb') as f:
+                samples.append(decompress(f.read(), directory))
+        except (OSError, ValueError):
+            continue
+    return samples
+
+def _write_archived(message_id, message, directory=None):
+    """Write one message to the archive; returns (path, bytes written)"""
+    with _lock:
+        os.makedirs(os.path.join(archive_dir(directory), PARTS_DIR), exist_ok=True)
+        dictionary_id, dictionary = current_dictionary(directory)
+        untrained = not os.path.exists(os.path.join(archive_dir(directory), DICTIONARY_POINTER))
+        if untrained and len(_archive_ids(directory)) >= TRAIN_MIN_SAMPLES:
+            samples = _training_samples(directory)
+            dictionary = best_dictionary(samples, train_dictionary(samples)) or None
+            dictionary_id = install_dictionary(dictionary, directory)
+    blob, written = _encode_record(message_id, message, directory, dictionary_id, dictionary)
+    path = record_path(message_id, directory)
+    _atomic_write(path, blob)
+    return path, written + len(blob)
+
+def _write_message(message_id, message, directory=None):
+    """Write one message in the configured format; returns (path, bytes written)"""
+    if store_format() == FORMAT_ARCHIVE:
+        return _write_archived(message_id, message, directory)
+    path = message_path(message_id, directory)
+    data = json.dumps(message.to_dict(), indent=2).encode('utf-8')
+    _atomic_write(path, data)
+    return path, len(data)
+
+def save_message(message_id, message, directory=None):
+    """
+    Atomically write one message to the store
+
+    Args:
+        message_id (str): The message ID (used in the file name)
+        message (Message): The message (saved with all of its original fields)
+        directory (str): Store directory (default: store_dir())
+
+    Returns:
+        str: Path of the written file
+
+    Raises:
+        ValueError: The ID would put the file outside the store directory
+    """
+    return _write_message(message_id, message, directory)[0]
+
+def load_message(message_id, directory=None):
+    """
+    Read one stored message
+
+    Args:
+        message_id (str): The message ID
+        directory (str): Store directory (default: store_dir())
+
+    Returns:
+        Message: The message, or None when it is not in the store
+
+    Raises:
+        ValueError: The ID would put the file outside the store directory
+    """
+    try:
+        with open(record_path(message_id, directory), 'rb') as f:
+            blob = f.read()
+    except FileNotFoundError:
+        try:
+            return Message.load(message_path(message_id, directory))
+        except FileNotFoundError:
+            return None
+    return Message.from_dict(_decode_record(blob, directory))
+
+def stored_ids(directory=None):
+    """
+    IDs of every message in the store (either format)
+
+    Returns:
+        list: Message IDs, sorted
+    """
+    ids = set(_archive_ids(directory))
+    try:
+        names = os.listdir(directory or store_dir())
+    except OSError:
+        names = []
+    ids.update(name[len(FILE_PREFIX):-len(FILE_SUFFIX)] for name in names
+               if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX))
+    return sorted(ids)
+
+def compact(directory=None):
+    """
+    Retrain the dictionary on the whole archive and rewrite it
+
+    Legacy message_details_*.json files are moved into the archive; parts
+    no record references and dictionaries nothing is compressed with any
+    more are deleted. The dictionary is the cheapest option on the whole
+    archive (see best_dictionary), and nothing is rewritten when the result
+    would not be smaller than the store already is.
+
+    Returns:
+        dict: messages, converted, rewritten (bool), dictionary id and size,
+            bytes before and after
+    """
+    with _lock:
+        before = store_bytes(directory)
+        messages = {}
+        for message_id in stored_ids(directory):
+            message = load_message(message_id, directory)
+            if message is not None:
+                messages[message_id] = message
+
+        samples = []
+        for message in list(messages.values())[-TRAIN_MAX_SAMPLES:]:
+            record, parts = _split_parts(message.to_dict())
+            samples.append(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+            samples.extend(text.encode('utf-8') for text in parts.values())
+
+        # Everything the rewrite would store: every record and each part once
+        documents = []
+        all_parts = {}
+        for message in messages.values():
+            record, parts = _split_parts(message.to_dict())
+            documents.append(json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+            all_parts.update(parts)
+        documents.extend(text.encode('utf-8') for text in all_parts.values())
+        dictionary = best_dictionary(documents, train_dictionary(samples))
+        # Each file's MAGIC + dictionary id, and the DICTIONARY pointer
+        overhead = (len(MAGIC) + len(NO_DICTIONARY)) * len(documents) + len(NO_DICTIONARY)
+        if _dictionary_cost(documents, dictionary) + overhead >= before:
+            dictionary_id, current = current_dictionary(directory)
+            return {
+                'messages': len(messages),
+                'converted': 0,
+                'rewritten': False,
+                'dictionary': dictionary_id,
+                'dictionary_bytes': len(current or b''),
+                'bytes_before': before,
+                'bytes_after': before
+            }
+
+        root = archive_dir(directory)
+        os.makedirs(os.path.join(root, PARTS_DIR), exist_ok=True)
+        dictionary_id = install_dictionary(dictionary, directory)
+
+        # Each part is rewritten once (same name - it is addressed by content),
+        # before the records that use it, so an interrupted compact loses nothing
+        converted = 0
+        rewritten = set()
+        for message_id, message in messages.items():
+            _, parts = _split_parts(message.to_dict())
+            blob, _ = _encode_record(message_id, message, directory, dictionary_id, dictionary,
+                                     rewrite_parts=not rewritten.issuperset(parts))
+            rewritten.update(parts)
+            _atomic_write(record_path(message_id, directory), blob)
+            legacy = message_path(message_id, directory)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+                converted += 1
+
+        for name in os.listdir(os.path.join(root, PARTS_DIR)):
+            if name[:-len(RECORD_SUFFIX)] not in rewritten:
+                os.remove(os.path.join(root, PARTS_DIR, name))
+        _read_part.cache_clear()
+        for name in os.listdir(root):
+            if name.startswith('dict-') and name != os.path.basename(_dictionary_path(dictionary_id, directory)):
+                os.remove(os.path.join(root, name))
+        _read_dictionary.cache_clear()
+
+    return {
+        'messages': len(messages),
+        'converted': converted,
+        'rewritten': True,
+        'dictionary': dictionary_id,
+        'dictionary_bytes': len(dictionary),
+        'bytes_before': before,
+        'bytes_after': store_bytes(directory)
+    }
+
+def store_bytes(directory=None):
+    """Bytes on disk of every stored message (records, parts, dictionaries, JSON files)"""
+    total = 0
+    for root, _, names in os.walk(archive_dir(directory)):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    for message_id in stored_ids(directory):
+        path = message_path(message_id, directory)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def store_stats(directory=None):
+    """
+    Size of the store
+
+    Returns:
+        dict: messages, archived, json_files, parts, dictionary, bytes on
+            disk and bytes the same messages take as indented JSON
+    """
+    ids = stored_ids(directory)
+    archived = set(_archive_ids(directory))
+    json_bytes = 0
+    for message_id in ids:
+        message = load_message(message_id, directory)
+        if message is not None:
+            json_bytes += len(json.dumps(message.to_dict(), indent=2).encode('utf-8'))
+    try:
+        parts = len(os.listdir(os.path.join(archive_dir(directory), PARTS_DIR)))
+    except OSError:
+        parts = 0
+    disk = store_bytes(directory)
+    return {
+        'format': store_format(),
+        'messages': len(ids),
+        'archived': len(archived),
+        'json_files': len([message_id for message_id in ids if message_id not in archived]),
+        'parts': parts,
+        'dictionary': current_dictionary(directory)[0],
+        'bytes_on_disk': disk,
+        'bytes_as_json': json_bytes,
+        'ratio': round(json_bytes / disk, 1) if disk else None
+    }
+
+class StoreWriter:
+    def __init__(self, directory=None, max_pending=100):
+        """
+        Single writer thread for the message store
+
+        Args:
+            directory (str): Store directory (default: store_dir())
+            max_pending (int): Messages queued before put() blocks
+        """
+        self.directory = directory
+        self.queue = queue.Queue(maxsize=max(max_pending, 1))
+        self.thread = threading.Thread(target=self._run, name='message-store-writer', daemon=True)
+        self.saved = []
+        self.failed = {}
+        self.write_seconds = 0.0
+        self.bytes_written = 0
+
+    def start(self):
+        """Start the writer thread"""
+        self.thread.start()
+        return self
+
+    def put(self, message_id, message):
+        """Queue a message for writing (blocks while the queue is full)"""
+        self.queue.put((message_id, message))
+
+    def close(self):
+        """Write everything still queued and stop the thread"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        seen = set()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            message_id, message = item
+            if message_id in seen:
+                continue
+            seen.add(message_id)
+            start = time.monotonic()
+            try:
+                _, written = _write_message(message_id, message, self.directory)
+                self.bytes_written += written
+                self.saved.append(message_id)
+            except (OSError, ValueError, TypeError) as e:
+                self.failed[message_id] = str(e)
+            self.write_seconds += time.monotonic() - start
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def main(argv=None):
+    """Command line: stats, ids, show, compact, export-json"""
+    parser = argparse.ArgumentParser(description='Stored messages')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='Messages and disk use')
+    sub.add_parser('ids', help='Stored message IDs, one per line')
+    show = sub.add_parser('show', help='Print one message as JSON')
+    show.add_argument('message_id')
+    sub.add_parser('compact', help='Retrain the dictionary and rewrite the archive')
+    export = sub.add_parser('export-json', help='Write every message as message_details_<id>.json')
+    export.add_argument('--out', default='.', help='Output directory (default: current)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        print(json.dumps(store_stats(), indent=2))
+    elif args.command == 'ids':
+        for message_id in stored_ids():
+            print(message_id)
+    elif args.command == 'show':
+        try:
+            message = load_message(args.message_id)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        if message is None:
+            print(f"❌ Message {args.message_id} is not in the store")
+            return 1
+        print(json.dumps(message.to_dict(), indent=2))
+    elif args.command == 'compact':
+        result = compact()
+        if not result['rewritten']:
+            print(f"🗜️ Archive left as is: rewriting its {result['messages']} messages would not make it "
+                  f"smaller than {result['bytes_before']:,} bytes")
+        else:
+            print(f"🗜️ Archive compacted: {result['messages']} messages "
+                  f"({result['converted']} moved in from JSON files), "
+                  f"{result['bytes_before']:,} -> {result['bytes_after']:,} bytes")
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        count = 0
+        for message_id in stored_ids():
+            message = load_message(message_id)
+            if message is not None:
+                data = json.dumps(message.to_dict(), indent=2).encode('utf-8')
+                _atomic_write(message_path(message_id, args.out), data)
+                count += 1
+        print(f"💾 Wrote {count} message_details_*.json files to {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
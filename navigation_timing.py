@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import pipeline_metrics
+from pipeline_log import get_logger
+from run_state import save_section
+
+log = get_logger('navigation_timing')
+
+# Browser-side timing of the pages the pipeline opens.
+#
+# load() replaces a bare driver.get(): after the page has loaded it reads
+# the browser's Navigation Timing and Resource Timing entries
+# (performance.getEntriesByType('navigation' / 'resource')) and splits the
+# wall time of driver.get() into
+#
+#     site    - DNS, connect, TLS, time to first byte, download, DOM and load events
+#     driver  - what is left: WebDriver round trips and our own overhead
+#
+# A summary per page (TTFB, DOMContentLoaded, load, resource totals per
+# host and type, the slowest and the largest resources) goes into the run
+# state's 'navigation' section. The full entries go to
+# navigation_<page>.json. Cross-origin resources that don't send
+# Timing-Allow-Origin report sizes of 0, so their byte counts are
+# lower bounds.
+#
+#     NAV_TIMING=0          don't capture (driver.get() only)
+#     NAV_TIMING_DIR=.      directory for navigation_<page>.json
+#     NAV_TIMING_TOP=10     slowest/largest resources kept in the summary
+NAV_TIMING_ENV = 'NAV_TIMING'
+NAV_TIMING_DIR_ENV = 'NAV_TIMING_DIR'
+NAV_TIMING_TOP_ENV = 'NAV_TIMING_TOP'
+DEFAULT_TOP = 10
+
+TTFB = pipeline_metrics.histogram('browser_ttfb_seconds', 'Time to first byte of the page (browser side)',
+                                  ('page',), pipeline_metrics.BROWSER_BUCKETS)
+DOM_CONTENT_LOADED = pipeline_metrics.histogram('browser_dom_content_loaded_seconds',
+                                                'Navigation start to DOMContentLoaded end',
+                                                ('page',), pipeline_metrics.BROWSER_BUCKETS)
+LOAD_EVENT = pipeline_metrics.histogram('browser_load_event_seconds', 'Navigation start to load event end',
+                                        ('page',), pipeline_metrics.BROWSER_BUCKETS)
+DRIVER_OVERHEAD = pipeline_metrics.histogram('browser_driver_overhead_seconds',
+                                             'driver.get() wall time not accounted for by the page load',
+                                             ('page',), pipeline_metrics.BROWSER_BUCKETS)
+
+# Only the fields used below cross the WebDriver wire
+CAPTURE_SCRIPT = """
+const pick = (entry, fields) => {
+    const out = {};
+    for (const field of fields) { out[field] = entry[field]; }
+    return out;
+};
+const nav = performance.getEntriesByType('navigation')[0];
+const resources = performance.getEntriesByType('resource');
+return {
+    navigation: nav ? pick(nav, ['name', 'type', 'startTime', 'redirectStart', 'redirectEnd',
+        'fetchStart', 'domainLookupStart', 'domainLookupEnd', 'connectStart', 'connectEnd',
+        'secureConnectionStart', 'requestStart', 'responseStart', 'responseEnd',
+        'domInteractive', 'domContentLoadedEventEnd', 'loadEventEnd', 'duration',
+        'transferSize', 'encodedBodySize', 'decodedBodySize', 'nextHopProtocol']) : null,
+    resources: resources.map(entry => pick(entry, ['name', 'initiatorType', 'startTime',
+        'duration', 'responseStart', 'transferSize', 'encodedBodySize', 'decodedBodySize',
+        'nextHopProtocol'])),
+    url: location.href
+};
+"""
+
+def enabled():
+    """Whether timings are captured (NAV_TIMING, default on)"""
+    return os.environ.get(NAV_TIMING_ENV, '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+def _top_n():
+    try:
+        return max(int(os.environ.get(NAV_TIMING_TOP_ENV, DEFAULT_TOP)), 0)
+    except ValueError:
+        return DEFAULT_TOP
+
+def _ms(value):
+    return round(value, 1) if isinstance(value, (int, float)) else None
+
+def _fmt_ms(value):
+    return f"{value:.0f}ms" if value is not None else 'n/a'
+
+def _span(entry, start, end):
+    """entry[end] - entry[start] in ms, or None when either mark wasn't reached"""
+    a, b = entry.get(start), entry.get(end)
+    if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or not b or b < a:
+        return None
+    return _ms(b - a)
+
+def _resource_row(entry):
+    return {
+        'name': entry.get('name'),
+        'type': entry.get('initiatorType'),
+        'start_ms': _ms(entry.get('startTime')),
+        'duration_ms': _ms(entry.get('duration')),
+        'bytes': entry.get('transferSize') or entry.get('encodedBodySize') or 0
+    }
+
+def summarize(entries, wall_seconds=None, top=DEFAULT_TOP):
+    """
+    Reduce raw timing entries to the numbers worth keeping
+
+    Args:
+        entries (dict): What CAPTURE_SCRIPT returned
+        wall_seconds (float): Wall time of driver.get(), to split off our own overhead
+        top (int): Slowest and largest resources to keep
+
+    Returns:
+        dict: Milliseconds throughout; None where the browser gave no value
+    """
+    nav = entries.get('navigation') or {}
+    resources = entries.get('resources') or []
+    load_ms = _span(nav, 'startTime', 'loadEventEnd')
+    summary = {
+        'url': entries.get('url') or nav.get('name'),
+        'protocol': nav.get('nextHopProtocol'),
+        'redirect_ms': _span(nav, 'redirectStart', 'redirectEnd'),
+        'dns_ms': _span(nav, 'domainLookupStart', 'domainLookupEnd'),
+        'connect_ms': _span(nav, 'connectStart', 'connectEnd'),
+        'tls_ms': _span(nav, 'secureConnectionStart', 'connectEnd'),
+        'ttfb_ms': _span(nav, 'startTime', 'responseStart'),
+        'server_ms': _span(nav, 'requestStart', 'responseStart'),
+        'download_ms': _span(nav, 'responseStart', 'responseEnd'),
+        'dom_interactive_ms': _span(nav, 'startTime', 'domInteractive'),
+        'dom_content_loaded_ms': _span(nav, 'startTime', 'domContentLoadedEventEnd'),
+        'load_ms': load_ms,
+        'document_bytes': nav.get('transferSize') or nav.get('encodedBodySize') or 0,
+        'wall_ms': _ms(wall_seconds * 1000) if wall_seconds is not None else None,
+        'driver_overhead_ms': None
+    }
+    if wall_seconds is not None and load_ms is not None:
+        summary['driver_overhead_ms'] = _ms(max(wall_seconds * 1000 - load_ms, 0.0))
+
+    rows = [_resource_row(entry) for entry in resources]
+    hosts = {}
+    types = {}
+    for row in rows:
+        for key, table in ((urlsplit(row['name'] or '').hostname or '(inline)', hosts), (row['type'] or 'other', types)):
+            totals = table.setdefault(key, {'count': 0, 'bytes': 0, 'duration_ms': 0.0})
+            totals['count'] += 1
+            totals['bytes'] += row['bytes']
+            totals['duration_ms'] = _ms(totals['duration_ms'] + (row['duration_ms'] or 0))
+    summary['resources'] = {
+        'count': len(rows),
+        'bytes': sum(row['bytes'] for row in rows),
+        'by_host': dict(sorted(hosts.items(), key=lambda item: item[1]['duration_ms'], reverse=True)),
+        'by_type': dict(sorted(types.items(), key=lambda item: item[1]['duration_ms'], reverse=True)),
+        'slowest': sorted(rows, key=lambda row: row['duration_ms'] or 0, reverse=True)[:top],
+        'largest': [row for row in sorted(rows, key=lambda row: row['bytes'], reverse=True)[:top] if row['bytes']]
+    }
+    return summary
+
+def capture(driver, page, wall_seconds=None):
+    """
+    Read the current page's timings from the browser and record them
+
+    Never raises: a browser without the Performance API (or a dead
+    session) just means no timings.
+
+    Args:
+        driver: Selenium WebDriver, right after driver.get()
+        page (str): Page name, e.g. 'sign-up'
+        wall_seconds (float): Wall time of the driver.get() call
+
+    Returns:
+        dict: The summary (see summarize), or None
+    """
+    try:
+        entries = driver.execute_script(CAPTURE_SCRIPT)
+    except Exception as e:
+        log.warning(f"⚠️ Could not read navigation timing for {page}: {e}")
+        return None
+    if not entries or not entries.get('navigation'):
+        log.warning(f"⚠️ No navigation timing available for {page}")
+        return None
+
+    summary = summarize(entries, wall_seconds, _top_n())
+    summary['captured_at'] = time.time()
+    for metric, key in ((TTFB, 'ttfb_ms'), (DOM_CONTENT_LOADED, 'dom_content_loaded_ms'),
+                        (LOAD_EVENT, 'load_ms'), (DRIVER_OVERHEAD, 'driver_overhead_ms')):
+        if summary[key] is not None:
+            metric.observe(summary[key] / 1000, page=page)
+
+    path = os.path.join(os.environ.get(NAV_TIMING_DIR_ENV) or '.', f"navigation_{page}.json")
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'page': page, 'summary': summary, 'entries': entries}, f, indent=2)
+        summary['details_file'] = path
+    except OSError as e:
+        log.warning(f"⚠️ Could not save navigation timing to {path}: {e}")
+    try:
+        save_section('navigation', {page: summary}, merge=True)
+    except OSError as e:
+        log.warning(f"⚠️ Could not record navigation timing in the run state: {e}")
+
+    resources = summary['resources']
+    log.info(f"⏱️ {page}: TTFB {_fmt_ms(summary['ttfb_ms'])}, DOMContentLoaded {_fmt_ms(summary['dom_content_loaded_ms'])}, "
+             f"load {_fmt_ms(summary['load_ms'])}, driver overhead {_fmt_ms(summary['driver_overhead_ms'])} - "
+             f"{resources['count']} resources, {resources['bytes'] / 1024:.0f} KiB")
+    for row in resources['slowest'][:3]:
+        log.info(f"   🐢 {_fmt_ms(row['duration_ms']):>8}  {row['type'] or 'other':<10} {row['name']}")
+    return summary
+
+def load(driver, url, page):
+    """
+    driver.get(url), timed, then capture the page's navigation timing
+
+    Args:
+        driver: Selenium WebDriver
+        url (str): Page to open
+        page (str): Page name for metrics and the run state, e.g. 'sign-up'
+
+    Returns:
+        dict: The timing summary, or None when not captured
+    """
+    start = time.monotonic()
+    try:
+        driver.get(url)
+    finally:
+        wall = time.monotonic() - start
+        pipeline_metrics.PAGE_LOAD.observe(wall, page=page)
+    if not enabled():
+        return None
+    return capture(driver, page, wall)
@@ -0,0 +1,570 @@
+import re
+import time
+from html.parser import HTMLParser
+
+import deadline
+import pipeline_metrics
+from pipeline_log import get_logger
+
+log = get_logger('page_objects')
+
+# Page objects for the sign-up and activation pages.
+#
+# Each page's logical fields (first_name, email, submit, ...) are declared
+# once below as ordered lists of CSS selectors, most specific first, and
+# shared by website_signup, activate_account and emby_reg. Groups (error
+# messages, all buttons, ...) are selector lists read as a whole instead
+# of resolved to one element.
+#
+# take() reads the page in ONE WebDriver round trip: a script marks the
+# elements any of the page's selectors could match with a data-po index
+# and returns the document's HTML plus whether each marked element is
+# displayed and enabled. The HTML is parsed locally (html.parser) and
+# every field is resolved against the parsed tree - the first selector
+# with a displayed, enabled match wins, as with the old per-selector
+# WebDriver waits. Element handles are only fetched (one more round trip
+# each) for the fields the script actually uses, via their data-po mark.
+#
+# Supported selector syntax: compound selectors without combinators -
+# tag, #id, .class, [attr], [attr=v], [attr^=v], [attr$=v], [attr*=v],
+# [attr~=v], [attr|=v] (with an optional i flag), :first-of-type,
+# :last-of-type, :nth-of-type(n), :first-child and :contains("text")
+# (jQuery-style, matched against the element's text).
+MARK_ATTR = 'data-po'
+SNAPSHOT_POLL = 0.5
+
+SNAPSHOT_SECONDS = pipeline_metrics.histogram('browser_page_snapshot_seconds',
+                                              'Time to take and parse a page snapshot', ('page',),
+                                              pipeline_metrics.SELECTOR_BUCKETS)
+
+# arguments[0]: querySelectorAll()-able bases of the page's selectors.
+# Per marked element: bit 1 = displayed, bit 2 = enabled.
+SNAPSHOT_SCRIPT = """
+const bases = arguments[0], attr = arguments[1];
+for (const old of document.querySelectorAll('[' + attr + ']')) { old.removeAttribute(attr); }
+const seen = new Set(), states = [];
+for (const base of bases) {
+    let found;
+    try { found = document.querySelectorAll(base); } catch (e) { continue; }
+    for (const el of found) {
+        if (seen.has(el)) { continue; }
+        seen.add(el);
+        const style = window.getComputedStyle(el);
+        const displayed = style.display !== 'none' && style.visibility !== 'hidden'
+            && el.type !== 'hidden' && el.getClientRects().length > 0;
+        el.setAttribute(attr, String(states.length));
+        states.push((displayed ? 1 : 0) | (el.disabled ? 0 : 2));
+    }
+}
+return {html: document.documentElement.outerHTML, states: states, url: location.href};
+"""
+
+_TAG = re.compile(r'\s*(?P<tag>\*|[A-Za-z][\w-]*)?')
+_PART = re.compile(r'''
+    \#(?P<id>[\w-]+)
+  | \.(?P<cls>[\w-]+)
+  | \[\s*(?P<attr>[\w:-]+)\s*
+        (?:(?P<op>[~|^$*]?=)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[\w-]+))\s*(?P<flag>[iIsS])?\s*)?\]
+  | :(?P<pseudo>[\w-]+)(?:\(\s*(?:"(?P<pdq>[^"]*)"|'(?P<psq>[^']*)'|(?P<parg>[^)"']*?))\s*\))?
+''', re.X)
+_PSEUDOS = ('first-of-type', 'last-of-type', 'nth-of-type', 'first-child', 'contains')
+_VOID_TAGS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                        'param', 'source', 'track', 'wbr'))
+
+def _attr_test(op, expected, value):
+    if op == '=':
+        return value == expected
+    if op == '^=':
+        return bool(expected) and value.startswith(expected)
+    if op == '$=':
+        return bool(expected) and value.endswith(expected)
+    if op == '*=':
+        return bool(expected) and expected in value
+    if op == '~=':
+        return expected in value.split()
+    return value == expected or value.startswith(expected + '-')
+
+class Selector:
+    def __init__(self, text):
+        """
+        A compound CSS selector, compiled for local matching
+
+        Args:
+            text (str): e.g. 'input[type="password"]:nth-of-type(2)'
+
+        Raises:
+            ValueError: Syntax outside the supported subset (see above)
+        """
+        self.text = text
+        head = _TAG.match(text)
+        self.tag = (head.group('tag') or '*').lower()
+        self.tests = []
+        base = [head.group('tag') or '']
+        pos = head.end()
+        while pos < len(text):
+            part = _PART.match(text, pos)
+            if not part:
+                raise ValueError(f"Unsupported selector syntax at {text[pos:]!r} in {text!r}")
+            pos = part.end()
+            pseudo = part.group('pseudo')
+            if pseudo:
+                pseudo = pseudo.lower()
+                arg = next((value for value in part.group('pdq', 'psq', 'parg') if value is not None), None)
+                if pseudo not in _PSEUDOS:
+                    raise ValueError(f"Unsupported pseudo-class :{pseudo} in {text!r}")
+                if pseudo == 'nth-of-type' and not (arg or '').strip().isdigit():
+                    raise ValueError(f":nth-of-type() takes a number in {text!r}")
+                self.tests.append((pseudo, arg))
+                continue
+            base.append(part.group(0))
+            if part.group('id'):
+                self.tests.append(('attr', ('id', '=', part.group('id'), False)))
+            elif part.group('cls'):
+                self.tests.append(('attr', ('class', '~=', part.group('cls'), False)))
+            else:
+                value = next((v for v in part.group('dq', 'sq', 'bare') if v is not None), None)
+                ignore_case = (part.group('flag') or '').lower() == 'i'
+                if ignore_case and value is not None:
+                    value = value.lower()
+                self.tests.append(('attr', (part.group('attr').lower(), part.group('op'), value, ignore_case)))
+        # What the browser can evaluate itself: the selector minus our pseudo-classes
+        self.base = ''.join(base) or '*'
+
+    def matches(self, node):
+        """Whether a parsed element matches"""
+        if self.tag != '*' and node.tag != self.tag:
+            return False
+        for kind, arg in self.tests:
+            if kind == 'attr':
+                name, op, expected, ignore_case = arg
+                value = node.attrs.get(name)
+                if value is None:
+                    return False
+                if op is None:
+                    continue
+                if not _attr_test(op, expected, value.lower() if ignore_case else value):
+                    return False
+            elif kind == 'first-of-type':
+                if node.of_type != 1:
+                    return False
+            elif kind == 'last-of-type':
+                if node.of_type != node.parent.type_counts[node.tag]:
+                    return False
+            elif kind == 'nth-of-type':
+                if node.of_type != int(arg):
+                    return False
+            elif kind == 'first-child':
+                if node.child_index != 1:
+                    return False
+            elif kind == 'contains':
+                if (arg or '') not in node.text():
+                    return False
+        return True
+
+    def __repr__(self):
+        return f"Selector({self.text!r})"
+
+class Node:
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = {name.lower(): value if value is not None else '' for name, value in attrs}
+        self.parent = parent
+        self.children = []
+        self.type_counts = {}
+        self.element_count = 0
+        self.of_type = 0
+        self.child_index = 0
+        # Displayed/enabled bits from the snapshot (see SNAPSHOT_SCRIPT)
+        self.state = 0
+        self._text = None
+        if parent is not None:
+            parent.children.append(self)
+            parent.type_counts[tag] = parent.type_counts.get(tag, 0) + 1
+            parent.element_count += 1
+            self.of_type = parent.type_counts[tag]
+            self.child_index = parent.element_count
+
+    def text(self):
+        """Text content, whitespace collapsed"""
+        if self._text is None:
+            parts = []
+            stack = [self]
+            while stack:
+                item = stack.pop()
+                if isinstance(item, Node):
+                    if item.tag not in ('script', 'style'):
+                        stack.extend(reversed(item.children))
+                else:
+                    parts.append(item)
+            self._text = ' '.join(''.join(parts).split())
+        return self._text
+
+    def label(self):
+        """Short description for logs: text, value or placeholder"""
+        return self.text() or self.attrs.get('value') or self.attrs.get('placeholder') or ''
+
+    def __repr__(self):
+        return f"<{self.tag} {self.attrs}>"
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#document', (), None)
+        self.stack = [self.root]
+        self.elements = []
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, attrs, self.stack[-1])
+        self.elements.append(node)
+        if tag not in _VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.elements.append(Node(tag, attrs, self.stack[-1]))
+
+    def handle_endtag(self, tag):
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth].tag == tag:
+                del self.stack[depth:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+def parse(html):
+    """
+    Parse HTML into Nodes
+
+    Returns:
+        list: Every element, in document order
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.elements
+
+class Page:
+    def __init__(self, name, fields, wait_for=(), groups=None):
+        """
+        Declaration of a page's logical fields
+
+        Args:
+            name (str): Page name for logs and metrics, e.g. 'sign-up'
+            fields (dict): field -> CSS selectors, most specific first
+            wait_for (tuple): Fields take() waits for before resolving the rest
+            groups (dict): group -> CSS selectors, for Snapshot.all()/texts()
+        """
+        self.name = name
+        self.fields = {field: [Selector(text) for text in selectors] for field, selectors in fields.items()}
+        self.groups = {group: [Selector(text) for text in selectors] for group, selectors in (groups or {}).items()}
+        self.wait_for = tuple(wait_for)
+        bases = []
+        for selectors in list(self.fields.values()) + list(self.groups.values()):
+            for selector in selectors:
+                if selector.base not in bases:
+                    bases.append(selector.base)
+        self.bases = bases
+
+class Snapshot:
+    def __init__(self, page, driver, elements, states=None, url=None, seconds=0.0):
+        """
+        One reading of a page, with every field resolved
+
+        Args:
+            page (Page): The page declaration
+            driver: Selenium WebDriver the snapshot came from (None offline)
+            elements (list): Parsed Nodes in document order
+            states (list): Displayed/enabled bits per data-po mark; None
+                treats every element as displayed and enabled (offline HTML)
+            url (str): Page URL at snapshot time
+            seconds (float): Time taken by the snapshot
+        """
+        self.page = page
+        self.driver = driver
+        self.url = url
+        self.seconds = seconds
+        self.handles = {}
+        self.candidates = []
+        for node in elements:
+            if states is None:
+                node.state = 3
+            else:
+                mark = node.attrs.get(MARK_ATTR, '')
+                if not mark.isdigit() or int(mark) >= len(states):
+                    continue
+                node.state = states[int(mark)]
+            self.candidates.append(node)
+        self.matches = {field: self._resolve(selectors) for field, selectors in page.fields.items()}
+
+    def _resolve(self, selectors):
+        for selector in selectors:
+            for node in self.candidates:
+                if node.state == 3 and selector.matches(node):
+                    return selector, node
+        return None
+
+    def found(self, field):
+        """Whether the field has a displayed, enabled element"""
+        return self.matches.get(field) is not None
+
+    def selector(self, field):
+        """The selector that resolved the field, or None"""
+        match = self.matches.get(field)
+        return match[0].text if match else None
+
+    def node(self, field):
+        """The parsed element of the field, or None"""
+        match = self.matches.get(field)
+        return match[1] if match else None
+
+    def all(self, name):
+        """
+        Every displayed element any of a group's (or field's) selectors matches
+
+        Returns:
+            list: Nodes in document order, each once
+        """
+        selectors = self.page.groups.get(name) or self.page.fields[name]
+        return [node for node in self.candidates
+                if node.state & 1 and any(selector.matches(node) for selector in selectors)]
+
+    def texts(self, name):
+        """Text of every displayed element of a group that has any (e.g. error messages)"""
+        return [node.text() for node in self.all(name) if node.text()]
+
+    def element(self, field):
+        """
+        WebElement of a field, fetched on first use
+
+        A page that re-rendered since the snapshot (the mark is gone) is
+        read once more before giving up.
+
+        Returns:
+            WebElement or None: None when the field didn't resolve
+        """
+        if field in self.handles:
+            return self.handles[field]
+        started = time.monotonic()
+        element = None
+        shot = self
+        for attempt in range(2):
+            match = shot.matches.get(field)
+            if match is None or self.driver is None:
+                break
+            try:
+                element = self.driver.find_element('css selector', f'[{MARK_ATTR}="{match[1].attrs[MARK_ATTR]}"]')
+                break
+            except Exception as e:
+                log.warning(f"⚠️ {field} ({match[0].text}) is no longer on the page: {e}")
+                if attempt == 0:
+                    shot = snapshot(self.driver, self.page)
+        pipeline_metrics.SELECTOR_RESOLUTION.observe(time.monotonic() - started,
+                                                     outcome='found' if element is not None else 'missing')
+        self.handles[field] = element
+        return element
+
+    def refresh(self, timeout=0, wait_for=None):
+        """A new snapshot of the same page (after the DOM has changed)"""
+        return take(self.driver, self.page, timeout, wait_for)
+
+    def summary(self):
+        """One line per field: which selector resolved it"""
+        return '\n'.join(f"   {'✅' if match else '❌'} {field}: {match[0].text if match else 'not found'}"
+                         for field, match in self.matches.items())
+
+def snapshot(driver, page):
+    """
+    Read and resolve a page in one WebDriver round trip
+
+    Args:
+        driver: Selenium WebDriver
+        page (Page): The page declaration
+
+    Returns:
+        Snapshot: The resolved page
+    """
+    started = time.monotonic()
+    result = driver.execute_script(SNAPSHOT_SCRIPT, page.bases, MARK_ATTR) or {}
+    elements = parse(result.get('html') or '')
+    shot = Snapshot(page, driver, elements, result.get('states') or [], result.get('url'))
+    shot.seconds = time.monotonic() - started
+    SNAPSHOT_SECONDS.observe(shot.seconds, page=page.name)
+    return shot
+
+def take(driver, page, timeout=5, wait_for=None):
+    """
+    Snapshot a page, re-reading it until its key fields have appeared
+
+    Args:
+        driver: Selenium WebDriver
+        page (Page): The page declaration
+        timeout (float): Seconds to wait for the fields (capped by the step deadline)
+        wait_for (tuple): Fields to wait for (default: page.wait_for)
+
+    Returns:
+        Snapshot: The last snapshot taken, whether or not they appeared
+    """
+    wait_for = page.wait_for if wait_for is None else tuple(wait_for)
+    end = time.monotonic() + deadline.wait_timeout(timeout, f"{page.name} snapshot")
+    shots = 0
+    while True:
+        shot = snapshot(driver, page)
+        shots += 1
+        if all(shot.found(field) for field in wait_for) or time.monotonic() >= end:
+            break
+        deadline.sleep(min(SNAPSHOT_POLL, max(end - time.monotonic(), 0)), f"{page.name} snapshot")
+    missing = [field for field in page.fields if not shot.found(field)]
+    log.info(f"🧭 {page.name}: {len(page.fields) - len(missing)}/{len(page.fields)} fields resolved "
+             f"from {shots} snapshot(s) in {shot.seconds * 1000:.0f} ms"
+             + (f" (missing: {', '.join(missing)})" if missing else ''))
+    return shot
+
+def from_html(html, page):
+    """Resolve a page from saved HTML (no browser; everything counts as displayed)"""
+    started = time.monotonic()
+    shot = Snapshot(page, None, parse(html))
+    shot.seconds = time.monotonic() - started
+    return shot
+
+SIGN_UP = Page('sign-up', {
+    'first_name': [
+        'input[name="firstName"]',
+        'input[name="first_name"]',
+        'input[id*="first"]',
+        'input[placeholder*="שם פרטי"]',
+        'input[placeholder*="First"]',
+        'input[type="text"]:first-of-type'
+    ],
+    'last_name': [
+        'input[name="lastName"]',
+        'input[name="last_name"]',
+        'input[id*="last"]',
+        'input[placeholder*="שם משפחה"]',
+        'input[placeholder*="Last"]',
+        'input[type="text"]:nth-of-type(2)'
+    ],
+    'email': [
+        'input[name="email"]',
+        'input[type="email"]',
+        'input[id*="email"]',
+        'input[placeholder*="אימייל"]',
+        'input[placeholder*="Email"]',
+        'input[placeholder*="mail"]'
+    ],
+    'password': [
+        'input[name="password"]',
+        'input[type="password"]',
+        'input[id*="password"]',
+        'input[placeholder*="סיסמה"]',
+        'input[placeholder*="Password"]'
+    ],
+    'password_confirm': [
+        'input[name="password1"]',
+        'input[name="confirmPassword"]',
+        'input[name="password_confirmation"]',
+        'input[name="confirm_password"]',
+        'input[id*="password1"]',
+        'input[id*="confirm"]',
+        'input[placeholder*="אישור סיסמה"]',
+        'input[placeholder*="Confirm Password"]',
+        'input[placeholder*="Repeat Password"]',
+        'input[type="password"]:nth-of-type(2)'
+    ],
+    'submit': [
+        'button[type="submit"]',
+        'input[type="submit"]',
+        'button:contains("הרשמה")',
+        'input[value="הרשמה"]',
+        'button:contains("רישום")',
+        'input[value="רישום"]',
+        'button:contains("Sign Up")',
+        'button:contains("Register")',
+        'button:contains("Submit")',
+        '[data-slot="button"]',
+        '.submit-button',
+        '.register-button',
+        '.signup-button',
+        '.btn-submit',
+        '.btn-primary'
+    ]
+}, wait_for=('email', 'password'), groups={
+    'buttons': [
+        'button',
+        'input[type="submit"]',
+        'input[type="button"]'
+    ],
+    'errors': [
+        '.error',
+        '.error-message',
+        '[class*="error"]',
+        '.alert-danger',
+        '.validation-error',
+        '.field-error',
+        '.invalid-feedback',
+        '.form-error'
+    ],
+    'success': [
+        '.success',
+        '.success-message',
+        '[class*="success"]',
+        '.alert-success',
+        '.confirmation',
+        '.thank-you',
+        '.registration-success'
+    ]
+})
+
+_ACTIVATION_SUBMIT = [
+    'button[type="submit"]',
+    'input[type="submit"]',
+    'button:contains("Submit")',
+    'button:contains("Continue")',
+    'button:contains("Next")',
+    '.btn-submit',
+    '.btn-primary',
+    '.submit-button'
+]
+
+# Step 1 of the activation link: log in with the sign-up credentials
+ACTIVATION_LOGIN = Page('activation-login', {
+    'email': [
+        'input[name="email"]',
+        'input[type="email"]',
+        'input[placeholder*="email" i]',
+        'input[id*="email"]'
+    ],
+    'password': [
+        'input[name="password"]',
+        'input[type="password"]',
+        'input[placeholder*="password" i]',
+        'input[id*="password"]'
+    ],
+    'submit': _ACTIVATION_SUBMIT
+}, wait_for=('email', 'password'))
+
+# Step 2: choose a username and the account password
+ACTIVATION_ACCOUNT = Page('activation-account', {
+    'username': [
+        'input[name="username"]',
+        'input[name="userName"]',
+        'input[placeholder*="username" i]',
+        'input[id*="username"]',
+        'input[type="text"]:first-of-type'
+    ],
+    'new_password': [
+        'input[name="password"]',
+        'input[name="newPassword"]',
+        'input[type="password"]:first-of-type',
+        'input[placeholder*="password" i]',
+        'input[id*="password"]'
+    ],
+    'confirm_password': [
+        'input[name="confirmPassword"]',
+        'input[name="password_confirmation"]',
+        'input[name="confirm_password"]',
+        'input[type="password"]:nth-of-type(2)',
+        'input[placeholder*="confirm" i]',
+        'input[id*="confirm"]'
+    ],
+    'submit': _ACTIVATION_SUBMIT
+}, wait_for=('username', 'new_password'))
@@ -0,0 +1,118 @@
+import datetime
+import json
+import logging
+import os
+import sys
+
+# Console logging for the pipeline scripts.
+#
+#     LOG_LEVEL=DEBUG|INFO|WARNING|ERROR   (default: INFO)
+#     LOG_FORMAT=text|json                 (default: text)
+#     LOG_FIELD_MAX=200                    (max characters per logged field)
+#
+# Message bodies are never logged in full - every field is clipped to
+# LOG_FIELD_MAX characters. Full content belongs in the message store
+# (save_message_details), not in the Jenkins console.
+LOG_LEVEL_ENV = 'LOG_LEVEL'
+LOG_FORMAT_ENV = 'LOG_FORMAT'
+LOG_FIELD_MAX_ENV = 'LOG_FIELD_MAX'
+DEFAULT_FIELD_MAX = 200
+
+_configured = False
+
+def field_max():
+    """Maximum characters per logged field"""
+    try:
+        return max(int(os.environ.get(LOG_FIELD_MAX_ENV, DEFAULT_FIELD_MAX)), 0)
+    except ValueError:
+        return DEFAULT_FIELD_MAX
+
+def clip(value, limit=None):
+    """
+    Truncate a value for logging
+
+    Args:
+        value: Value to log (non-strings are converted with str())
+        limit (int): Maximum characters (default: LOG_FIELD_MAX)
+
+    Returns:
+        str: The value, cut to `limit` characters with a note of what was dropped
+    """
+    if value is None:
+        return ''
+    text = value if isinstance(value, str) else str(value)
+    limit = field_max() if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... (+{len(text) - limit} chars)"
+
+class StdoutHandler(logging.StreamHandler):
+    """Write to whatever sys.stdout is at emit time (so redirection still works)"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+class TextFormatter(logging.Formatter):
+    """Plain console lines, same look as the scripts' own print() output"""
+
+    def format(self, record):
+        return record.getMessage()
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with clipped structured fields
+
+    Records logged with extra={'summary': ..., 'fields': {...}} use the
+    short summary as 'msg' instead of the multi-line console rendering.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': getattr(record, 'summary', None) or record.getMessage()
+        }
+        for key, value in getattr(record, 'fields', {}).items():
+            if isinstance(value, (int, float, bool)) or value is None:
+                entry[key] = value
+            else:
+                entry[key] = clip(value)
+        return json.dumps(entry, ensure_ascii=False)
+
+def configure():
+    """Install the console handler once per process, according to the environment"""
+    global _configured
+    if _configured:
+        return
+
+    level_name = os.environ.get(LOG_LEVEL_ENV, 'INFO').upper()
+    level = getattr(logging, level_name, logging.INFO)
+    json_mode = os.environ.get(LOG_FORMAT_ENV, 'text').lower() == 'json'
+
+    handler = StdoutHandler()
+    handler.setFormatter(JsonFormatter() if json_mode else TextFormatter())
+
+    root = logging.getLogger('pipeline')
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
+    _configured = True
+
+def get_logger(name):
+    """
+    Get a pipeline logger
+
+    Args:
+        name (str): Module name, e.g. 'check_messages'
+
+    Returns:
+        logging.Logger: Logger under the 'pipeline' hierarchy
+    """
+    configure()
+    return logging.getLogger(f"pipeline.{name}")
@@ -0,0 +1,363 @@
+import contextlib
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipeline_log import get_logger
+
+log = get_logger('pipeline_metrics')
+
+# Prometheus metrics for the pipeline steps.
+#
+# Counters, gauges and histograms are kept in memory by each step and
+# written in the Prometheus text format when the step ends (see
+# deadline.step_deadline), to a node_exporter textfile-collector file:
+#
+#     pipeline_<step>.prom      every series carries a step="<step>" label,
+#                               so the files of all steps can share one directory
+#
+# The file is replaced atomically, as the textfile collector requires.
+# Long-running watches (check_messages.watch_messages) can also serve the
+# live values on a local port for Prometheus to scrape:
+#
+#     PIPELINE_METRICS=0                    don't write .prom files
+#     PIPELINE_METRICS_DIR=.                directory for the .prom files
+#                                           (e.g. /var/lib/node_exporter/textfile)
+#     PIPELINE_METRICS_PORT=9105            serve /metrics during watches (unset or 0 = off)
+#     PIPELINE_METRICS_HOST=127.0.0.1       interface to serve on
+#
+# No client library is needed: the exposition format is written here.
+METRICS_ENV = 'PIPELINE_METRICS'
+DIR_ENV = 'PIPELINE_METRICS_DIR'
+PORT_ENV = 'PIPELINE_METRICS_PORT'
+HOST_ENV = 'PIPELINE_METRICS_HOST'
+DEFAULT_HOST = '127.0.0.1'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BROWSER_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+SELECTOR_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+POLL_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+ACTIVATION_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 3600)
+
+_lock = threading.Lock()
+_metrics = {}
+_step = None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        """
+        A named metric with a fixed set of label names
+
+        Args:
+            name (str): Metric name, e.g. 'boomlify_api_requests_total'
+            help (str): One-line description (the # HELP line)
+            labels (tuple): Label names every sample must give
+        """
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def reset(self):
+        with _lock:
+            self.values.clear()
+
+    def samples(self):
+        """(suffix, label pairs, value) for every series"""
+        with _lock:
+            items = list(self.values.items())
+        for key, value in sorted(items):
+            yield '', list(zip(self.labels, key)), value
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add to the series for `labels`"""
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the series for `labels`"""
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Distribution of observed values in cumulative buckets
+
+        Args:
+            buckets (tuple): Upper bounds, ascending (+Inf is added)
+        """
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        """Record one observation for `labels`"""
+        key = self._key(labels)
+        with _lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the time spent in the block (also when it raises)"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def samples(self):
+        with _lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self.values.items()]
+        for key, (counts, total) in sorted(items):
+            pairs = list(zip(self.labels, key))
+            for bound, count in zip(self.buckets, counts):
+                yield '_bucket', pairs + [('le', _format_value(bound))], count
+            yield '_sum', pairs, total
+            yield '_count', pairs, counts[-1]
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        _metrics[metric.name] = metric
+    return metric
+
+def counter(name, help, labels=()):
+    """The process-wide Counter `name` (created on first use)"""
+    return _register(Counter(name, help, labels))
+
+def gauge(name, help, labels=()):
+    """The process-wide Gauge `name` (created on first use)"""
+    return _register(Gauge(name, help, labels))
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    """The process-wide Histogram `name` (created on first use)"""
+    return _register(Histogram(name, help, labels, buckets))
+
+API_REQUESTS = counter('boomlify_api_requests_total', 'Boomlify API calls by response status',
+                       ('method', 'endpoint', 'status'))
+API_LATENCY = histogram('boomlify_api_request_duration_seconds', 'Boomlify API call latency (to the response headers)',
+                        ('method', 'endpoint'))
+API_BYTES = counter('boomlify_api_response_bytes_total', 'Boomlify API response body bytes',
+                    ('method', 'endpoint'))
+DRIVER_START = histogram('browser_driver_start_seconds', 'Time to start a WebDriver session',
+                         ('browser', 'outcome'), BROWSER_BUCKETS)
+PAGE_LOAD = histogram('browser_page_load_seconds', 'driver.get() time per page', ('page',), BROWSER_BUCKETS)
+SELECTOR_RESOLUTION = histogram('browser_selector_resolution_seconds',
+                                'Time to resolve an element from its candidate selectors',
+                                ('outcome',), SELECTOR_BUCKETS)
+MAIL_POLLS = counter('mail_polls_total', 'Mailbox polls by outcome', ('outcome',))
+POLLS_TO_FIRST_MAIL = histogram('mail_polls_to_first_message', 'Polls a watch made before the first new message',
+                                buckets=POLL_BUCKETS)
+MAIL_TO_ACTIVATION = histogram('mail_to_activation_seconds',
+                               'Time from the activation mail being received to the account being activated',
+                               buckets=ACTIVATION_BUCKETS)
+STEP_DURATION = gauge('pipeline_step_duration_seconds', 'Wall time of the last run of the step')
+STEP_BUDGET = gauge('pipeline_step_budget_seconds', 'Time budget of the step (see deadline.py)')
+STEP_SUCCESS = gauge('pipeline_step_success', '1 if the last run of the step succeeded, else 0', ('outcome',))
+STEP_LAST_RUN = gauge('pipeline_step_last_run_timestamp_seconds', 'Unix time the step last finished')
+SPAN_SECONDS = gauge('pipeline_span_seconds', 'Time the step spent per activity (see deadline.py)', ('label',))
+SPAN_CALLS = gauge('pipeline_span_calls', 'Times the step entered each activity', ('label',))
+
+_ID_SEGMENT = re.compile(r'\d')
+
+def endpoint(path):
+    """
+    Low-cardinality endpoint label for an API path
+
+    Args:
+        path (str): e.g. 'emails/4f2a.../messages?limit=50'
+
+    Returns:
+        str: e.g. 'emails/{id}/messages' (IDs and query string dropped)
+    """
+    segments = path.split('?')[0].strip('/').split('/')
+    return '/'.join('{id}' if _ID_SEGMENT.search(segment) else segment for segment in segments)
+
+def span_label(label):
+    """A deadline span label with the IDs in its API paths collapsed, e.g. 'GET emails/{id}/messages'"""
+    return ' '.join(endpoint(word) if '/' in word else word for word in label.split(' '))
+
+def render(step=None):
+    """
+    Every metric in the Prometheus text exposition format
+
+    Args:
+        step (str): Added as a step="..." label to every series (default: the current step)
+
+    Returns:
+        str: The exposition text
+    """
+    step = step or _step
+    extra = [('step', step)] if step else []
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+    lines = []
+    for metric in metrics:
+        samples = list(metric.samples())
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, pairs, value in samples:
+            lines.append(f"{metric.name}{suffix}{_format_labels(extra + pairs)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n' if lines else ''
+
+def enabled():
+    """Whether .prom files are written (PIPELINE_METRICS, default on)"""
+    return os.environ.get(METRICS_ENV, '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+def textfile_path(step):
+    """Path of a step's .prom file"""
+    return os.path.join(os.environ.get(DIR_ENV) or '.', f"pipeline_{step}.prom")
+
+def write_textfile(step):
+    """
+    Write the metrics to the step's .prom file (atomically)
+
+    Returns:
+        str: The path written, or None when switched off or the write failed
+    """
+    if not enabled():
+        return None
+    path = textfile_path(step)
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # The textfile collector reads *.prom only: the temporary name is never picked up half-written
+        fd, tmp_path = tempfile.mkstemp(prefix='.pipeline_', suffix='.tmp', dir=os.path.dirname(path) or '.')
+        with os.fdopen(fd, 'w') as f:
+            f.write(render(step))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning(f"⚠️ Could not write metrics to {path}: {e}")
+        return None
+    return path
+
+def begin_step(step):
+    """Start collecting for a pipeline step (called by deadline.step_deadline)"""
+    global _step
+    _step = step
+
+def end_step(step, elapsed, budget, outcome, spans=None):
+    """
+    Record the step's own gauges and write its .prom file (called by deadline.step_deadline)
+
+    Args:
+        step (str): Step name
+        elapsed (float): Wall time in seconds
+        budget (float): Time budget in seconds
+        outcome (str): 'ok', 'failed' or 'timeout'
+        spans (dict): label -> (seconds, calls), the deadline's breakdown
+
+    Returns:
+        str: The .prom path, or None
+    """
+    STEP_DURATION.set(round(elapsed, 3))
+    STEP_BUDGET.set(budget)
+    STEP_SUCCESS.reset()
+    STEP_SUCCESS.set(1 if outcome == 'ok' else 0, outcome=outcome)
+    STEP_LAST_RUN.set(round(time.time(), 3))
+    totals = {}
+    for label, (seconds, calls) in (spans or {}).items():
+        total = totals.setdefault(span_label(label), [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+    for label, (seconds, calls) in totals.items():
+        SPAN_SECONDS.set(round(seconds, 3), label=label)
+        SPAN_CALLS.set(calls, label=label)
+    return write_textfile(step)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves render() on GET /metrics"""
+
+    def log_message(self, format, *args):
+        log.debug(f"metrics {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@contextlib.contextmanager
+def serving():
+    """
+    Serve /metrics on PIPELINE_METRICS_PORT for the block
+
+    Yields:
+        ThreadingHTTPServer: The running server, or None when switched off
+            or the port can't be bound (the .prom file is still written)
+    """
+    try:
+        port = int(os.environ.get(PORT_ENV) or 0)
+    except ValueError:
+        log.warning(f"⚠️ Ignoring invalid {PORT_ENV}={os.environ.get(PORT_ENV)!r}")
+        port = 0
+    if port <= 0:
+        yield None
+        return
+    host = os.environ.get(HOST_ENV) or DEFAULT_HOST
+    try:
+        httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        log.warning(f"⚠️ Metrics endpoint not started ({host}:{port}): {e}")
+        yield None
+        return
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                              name='metrics-endpoint', daemon=True)
+    thread.start()
+    log.info(f"📈 Serving metrics on http://{host}:{httpd.server_address[1]}/metrics")
+    try:
+        yield httpd
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        thread.join()
@@ -0,0 +1,352 @@
+import atexit
+import datetime
+import email.utils
+import os
+import threading
+import time
+
+import requests
+
+import deadline
+from pipeline_log import get_logger
+from run_state import get_section, save_section
+
+log = get_logger('rate_limit')
+
+# Client-side pacing for the Boomlify API on RapidAPI.
+#
+# Every call goes through one RateLimiter (see boomlify_api.request):
+#   - A token bucket paces requests. Its rate starts at BOOMLIFY_RATE
+#     requests/second (default 0 = unpaced until the API says otherwise)
+#     and is lowered to remaining/reset whenever the X-RateLimit-* headers
+#     describe a short window. Half of what is left in the window may be
+#     used as a burst, so pacing only bites as the window runs low instead
+#     of the window being burned and then answered with 429s.
+#   - A 429 pauses the bucket for Retry-After seconds (or an exponential
+#     backoff when the header is missing) and the call is retried.
+#   - A daily request budget (BOOMLIFY_DAILY_BUDGET, default 0 = no budget)
+#     is counted across runs in the 'quota' section of the run state,
+#     together with the last quota the API reported.
+#
+# boomlify_api.quota_status() and stretch_interval() let pollers slow down
+# before the quota runs out instead of hitting the wall.
+RATE_ENV = 'BOOMLIFY_RATE'
+BURST_ENV = 'BOOMLIFY_BURST'
+DAILY_BUDGET_ENV = 'BOOMLIFY_DAILY_BUDGET'
+
+# Header windows up to this long are paced by the token bucket; longer ones
+# (RapidAPI's monthly quotas) are left to stretch_interval
+PACE_WINDOW = 300
+# Requests kept in reserve for the steps after a watch loop
+RESERVE = 5
+MAX_RETRIES = 3
+# Longest a single call waits for a rate limit before giving up
+MAX_WAIT = 120
+# Persist the quota at most this often (and once at exit)
+SAVE_INTERVAL = 5.0
+
+LIMIT_HEADERS = ('X-RateLimit-Requests-Limit', 'X-RateLimit-Limit')
+REMAINING_HEADERS = ('X-RateLimit-Requests-Remaining', 'X-RateLimit-Remaining')
+RESET_HEADERS = ('X-RateLimit-Requests-Reset', 'X-RateLimit-Reset')
+
+class QuotaExhausted(requests.exceptions.RequestException):
+    """The request budget is used up and will not refill in time"""
+
+def _env_number(name, default):
+    try:
+        return max(float(os.environ.get(name, default)), 0.0)
+    except ValueError:
+        return float(default)
+
+def _header(headers, names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+def parse_retry_after(value, now=None):
+    """
+    Parse a Retry-After header
+
+    Args:
+        value (str): Delay in seconds or an HTTP date
+        now (float): Current epoch time (default: now)
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(when.timestamp() - (now or time.time()), 0.0)
+
+class TokenBucket:
+    def __init__(self, rate=0.0, capacity=1.0):
+        """
+        Token bucket pacing calls to `rate` per second with bursts of `capacity`
+
+        Args:
+            rate (float): Tokens per second (0 = unlimited)
+            capacity (float): Bucket size
+        """
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = self.capacity
+        self.updated = now
+
+    def set_rate(self, rate, capacity=None):
+        """
+        Change the refill rate (0 = unlimited) and optionally the bucket size
+
+        A larger bucket is credited with the extra tokens straight away.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if capacity is not None:
+                capacity = max(capacity, 1.0)
+                self.tokens = min(self.tokens + max(capacity - self.capacity, 0), capacity)
+                self.capacity = capacity
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds`"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def reserve(self):
+        """
+        Take a token
+
+        Returns:
+            float: Seconds the caller must wait before using it
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self.paused_until - now, 0.0)
+            self.tokens -= 1
+            if self.tokens < 0 and self.rate > 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+class RateLimiter:
+    def __init__(self, rate=0.0, burst=1.0, daily_budget=0):
+        """
+        Pacing, retry and quota bookkeeping for one API
+
+        Args:
+            rate (float): Initial requests per second (0 = unpaced)
+            burst (float): Token bucket size
+            daily_budget (int): Requests allowed per day across runs (0 = no budget)
+        """
+        self.lock = threading.Lock()
+        self.bucket = TokenBucket(rate, burst)
+        self.base_rate = rate
+        self.burst = burst
+        self.daily_budget = int(daily_budget)
+        self.quota = None
+        self.last_save = 0.0
+        self.dirty = False
+
+    @classmethod
+    def from_env(cls):
+        """Limiter configured from BOOMLIFY_RATE, BOOMLIFY_BURST and BOOMLIFY_DAILY_BUDGET"""
+        return cls(rate=_env_number(RATE_ENV, 0), burst=_env_number(BURST_ENV, 1),
+                   daily_budget=_env_number(DAILY_BUDGET_ENV, 0))
+
+    def _load(self):
+        """The persisted quota, reset at the start of a new day"""
+        if self.quota is None:
+            self.quota = get_section('quota') or {}
+            atexit.register(self.save)
+        today = datetime.date.today().isoformat()
+        if self.quota.get('day') != today:
+            self.quota['day'] = today
+            self.quota['used'] = 0
+        return self.quota
+
+    def save(self, force=True):
+        """Persist the quota to the run state"""
+        with self.lock:
+            if self.quota is None or not self.dirty:
+                return
+            if not force and time.monotonic() - self.last_save < SAVE_INTERVAL:
+                return
+            quota = dict(self.quota)
+            self.dirty = False
+            self.last_save = time.monotonic()
+        try:
+            save_section('quota', quota)
+        except OSError as e:
+            log.warning(f"⚠️ Could not save API quota: {e}")
+
+    def _budget_left(self, quota):
+        if not self.daily_budget:
+            return None
+        return self.daily_budget - quota.get('used', 0)
+
+    def _api_remaining(self, quota, now=None):
+        """Requests left in the API's current window, None once the window has reset"""
+        remaining = quota.get('remaining')
+        reset_at = quota.get('reset_at')
+        if remaining is None or reset_at is None or (now or time.time()) >= reset_at:
+            return None
+        return remaining
+
+    def acquire(self):
+        """
+        Wait for permission to send one request
+
+        Raises:
+            QuotaExhausted: The daily budget is spent, or the API's window is
+                empty and does not reset within MAX_WAIT seconds
+            deadline.DeadlineExceeded: The wait would outlast the step's budget
+        """
+        with self.lock:
+            quota = self._load()
+            budget_left = self._budget_left(quota)
+            if budget_left is not None and budget_left <= 0:
+                raise QuotaExhausted(f"Daily budget of {self.daily_budget} Boomlify requests used up")
+            wait = 0.0
+            if self._api_remaining(quota) == 0:
+                wait = quota['reset_at'] - time.time()
+                if wait > MAX_WAIT:
+                    raise QuotaExhausted(f"Boomlify quota used up, resets in {wait:.0f}s")
+            quota['used'] = quota.get('used', 0) + 1
+            self.dirty = True
+
+        wait = max(wait, self.bucket.reserve())
+        if wait > 0:
+            step = deadline.current()
+            if step is not None and wait > step.remaining():
+                raise deadline.DeadlineExceeded(
+                    f"{step.step}: rate limit wait of {wait:.0f}s exceeds the {step.remaining():.0f}s left")
+            deadline.sleep(wait, 'rate limit wait')
+        return wait
+
+    def update(self, response):
+        """
+        Learn the quota from a response's X-RateLimit-* headers
+
+        Args:
+            response (requests.Response): Any Boomlify response
+        """
+        headers = response.headers
+        limit = _header(headers, LIMIT_HEADERS)
+        remaining = _header(headers, REMAINING_HEADERS)
+        reset = _header(headers, RESET_HEADERS)
+        seconds_left = None
+
+        with self.lock:
+            quota = self._load()
+            if limit is not None:
+                quota['limit'] = int(limit)
+            if remaining is not None:
+                quota['remaining'] = int(remaining)
+            if reset is not None:
+                # Seconds until reset, or an epoch timestamp on some gateways
+                now = time.time()
+                reset_at = reset if reset > 10 ** 9 else now + reset
+                quota['reset_at'] = reset_at
+                seconds_left = reset_at - now
+            if limit is not None or remaining is not None:
+                self.dirty = True
+
+        # Spread what is left of a short window over the rest of it
+        if remaining is not None and seconds_left is not None and 0 < seconds_left <= PACE_WINDOW:
+            rate = max(remaining, 1) / max(seconds_left, 1.0)
+            if self.base_rate:
+                rate = min(rate, self.base_rate)
+            self.bucket.set_rate(rate, max(self.burst, remaining / 2))
+        elif remaining is not None and seconds_left is not None:
+            self.bucket.set_rate(self.base_rate, self.burst)
+
+        self.save(force=False)
+
+    def backoff(self, response, attempt):
+        """
+        Pause the bucket after a 429
+
+        Args:
+            response (requests.Response): The 429 response
+            attempt (int): Retry number, starting at 0
+
+        Returns:
+            float: Seconds paused
+        """
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = min(2 ** attempt, 30)
+        self.bucket.pause(delay)
+        return delay
+
+    def status(self):
+        """
+        Current view of the quota
+
+        Returns:
+            dict: remaining (API window), limit, reset_in (s), budget_left (daily),
+                used_today and rate (requests/s, 0 = unpaced); unknown values are None
+        """
+        with self.lock:
+            quota = self._load()
+            remaining = self._api_remaining(quota)
+            reset_at = quota.get('reset_at')
+            return {
+                'remaining': remaining,
+                'limit': quota.get('limit'),
+                'reset_in': max(reset_at - time.time(), 0) if remaining is not None else None,
+                'budget_left': self._budget_left(quota),
+                'used_today': quota.get('used', 0),
+                'rate': self.bucket.rate
+            }
+
+    def stretch_interval(self, interval, horizon, calls_per_poll=1):
+        """
+        Polling interval that keeps a watch inside the quota
+
+        Args:
+            interval (float): Preferred seconds between polls
+            horizon (float): Seconds the watch may still run
+            calls_per_poll (int): Requests made by one poll
+
+        Returns:
+            float: `interval`, or longer when polling at that rate would use up
+                the API window, the daily budget or the paced rate
+        """
+        status = self.status()
+        calls_per_poll = max(calls_per_poll, 1)
+        candidates = [interval]
+        if status['rate']:
+            candidates.append(calls_per_poll / status['rate'])
+        if horizon > 0 and status['budget_left'] is not None:
+            polls_left = max((status['budget_left'] - RESERVE) // calls_per_poll, 1)
+            candidates.append(horizon / polls_left)
+        if horizon > 0 and status['remaining'] is not None:
+            # The API window refills when it resets, so it only limits its own span
+            span = min(horizon, status['reset_in'] or horizon)
+            polls_left = max((status['remaining'] - RESERVE) // calls_per_poll, 1)
+            candidates.append(span / polls_left)
+        return max(candidates)
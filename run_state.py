@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import copy
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+
+# Shared state of one pipeline run, in a single JSON file:
+#
+#     {
+#       "email":      {"id", "address", "expires_at", "updated_at"},   create_email.py
+#       "signup":     {"email", "password", "first_name", ...},       website_signup.py
+#       "activation": {"activation_link", "email_id", ...}            activation_events.py,
+#                     {"used_activation_link", "username", ...}       activate_account.py
+#     }
+#
+# The file is RUN_STATE_FILE (default: run_state.json in the current
+# directory, i.e. the Jenkins workspace). It is parsed once per process and
+# cached; the cache is only refreshed when the file changes on disk.
+# Every update rewrites the whole file atomically (temp file + os.replace),
+# so a reader never sees a half-written state.
+#
+# Runs that still have the old per-step files (email_info.txt,
+# signup_info.json, activation_info.json) are migrated on first read.
+#
+# Notices go to stderr so shell steps can capture values from stdout.
+#
+# Command line (used by the Jenkinsfile):
+#     python3 run_state.py show [section]           print the state as JSON
+#     python3 run_state.py get email.address        print one value (exit 1 if missing)
+STATE_FILE_ENV = 'RUN_STATE_FILE'
+DEFAULT_STATE_FILE = 'run_state.json'
+
+LEGACY_EMAIL_FILE = 'email_info.txt'
+LEGACY_JSON_FILES = {
+    'signup': 'signup_info.json',
+    'activation': 'activation_info.json'
+}
+
+_lock = threading.RLock()
+_cache = {'path': None, 'stamp': None, 'state': None}
+
+def state_path():
+    """Path of the run state file"""
+    return os.environ.get(STATE_FILE_ENV, DEFAULT_STATE_FILE)
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+def _read_legacy_email(path):
+    """Parse the KEY=value lines of an old email_info.txt"""
+    keys = {'EMAIL_ID': 'id', 'EMAIL_ADDRESS': 'address', 'EXPIRES_AT': 'expires_at'}
+    email = {}
+    with open(path, 'r') as f:
+        for line in f:
+            key, sep, value = line.strip().partition('=')
+            if sep and key in keys:
+                email[keys[key]] = value
+    return email
+
+def _migrate_legacy(directory):
+    """
+    Build a state from the per-step files written by older versions
+
+    Returns:
+        dict: Migrated state (empty when there is nothing to migrate)
+    """
+    state = {}
+    migrated = []
+
+    path = os.path.join(directory, LEGACY_EMAIL_FILE)
+    if os.path.exists(path):
+        try:
+            email = _read_legacy_email(path)
+            if email.get('id'):
+                email['updated_at'] = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+                state['email'] = email
+                migrated.append(LEGACY_EMAIL_FILE)
+        except OSError as e:
+            print(f"⚠️ Could not migrate {LEGACY_EMAIL_FILE}: {e}", file=sys.stderr)
+
+    for section, filename in LEGACY_JSON_FILES.items():
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r') as f:
+                state[section] = json.load(f)
+            migrated.append(filename)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not migrate {filename}: {e}", file=sys.stderr)
+
+    if migrated:
+        state['migrated_from'] = migrated
+    return state
+
+def _write(path, state):
+    """Atomically replace the state file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.run_state_', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _cache.update(path=path, stamp=_stamp(path), state=state)
+
+def _load():
+    """The cached state, (re)read from disk only when the file changed"""
+    path = state_path()
+    stamp = _stamp(path)
+    if _cache['state'] is not None and _cache['path'] == path and _cache['stamp'] == stamp:
+        return _cache['state']
+
+    if stamp is None:
+        state = _migrate_legacy(os.path.dirname(os.path.abspath(path)))
+        if state:
+            _write(path, state)
+            print(f"📦 Migrated {', '.join(state['migrated_from'])} into {path}", file=sys.stderr)
+            return state
+    else:
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Could not read {path}: {e}", file=sys.stderr)
+            state = {}
+
+    _cache.update(path=path, stamp=stamp, state=state)
+    return state
+
+def load_state():
+    """
+    Read the whole run state
+
+    Returns:
+        dict: Copy of the state (empty when nothing has been saved yet)
+    """
+    with _lock:
+        return copy.deepcopy(_load())
+
+def get_section(section):
+    """
+    Read one section of the run state
+
+    Args:
+        section (str): Section name, e.g. 'email', 'signup', 'activation'
+
+    Returns:
+        dict: Copy of the section, or None when it has not been saved
+    """
+    with _lock:
+        value = _load().get(section)
+        return copy.deepcopy(value) if value is not None else None
+
+def save_section(section, values, merge=False):
+    """
+    Store one section of the run state
+
+    Args:
+        section (str): Section name
+        values (dict): Section contents
+        merge (bool): Update the existing section instead of replacing it
+
+    Returns:
+        dict: The stored section
+    """
+    with _lock:
+        state = copy.deepcopy(_load())
+        current = state.get(section) if merge else None
+        stored = dict(current or {})
+        stored.update(values)
+        stored['updated_at'] = _now()
+        state[section] = stored
+        _write(state_path(), state)
+        return copy.deepcopy(stored)
+
+def clear_section(section):
+    """Remove one section of the run state (no-op when it is missing)"""
+    with _lock:
+        state = copy.deepcopy(_load())
+        if state.pop(section, None) is not None:
+            _write(state_path(), state)
+
+def get_email():
+    """
+    The temporary mailbox of this run
+
+    Returns:
+        tuple: (email_id, email_address, expires_at), (None, None, None) when not created yet
+    """
+    email = get_section('email') or {}
+    return email.get('id'), email.get('address'), email.get('expires_at')
+
+def _lookup(dotted):
+    value = load_state()
+    for part in dotted.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def main(argv=None):
+    """Command line access for the Jenkinsfile's shell steps"""
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'show'
+
+    if command == 'show':
+        value = _lookup(argv[1]) if len(argv) > 1 else load_state()
+        if value is None:
+            print(f"❌ Nothing stored for {argv[1]}")
+            return 1
+        print(json.dumps(value, indent=2))
+        return 0
+
+    if command == 'get' and len(argv) == 2:
+        value = _lookup(argv[1])
+        if value is None:
+            return 1
+        print(value if isinstance(value, str) else json.dumps(value))
+        return 0
+
+    print("Usage: run_state.py show [section] | get <section.key>")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
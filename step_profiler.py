@@ -0,0 +1,159 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+# Opt-in profiling for the pipeline entry points.
+#
+# Switch it on with the PIPELINE_PROFILE environment variable or a
+# --profile flag on the command line:
+#     PIPELINE_PROFILE=1 python3 create_email.py        (cProfile + tracemalloc)
+#     PIPELINE_PROFILE=cpu python3 website_signup.py    (cProfile only)
+#     python3 check_messages.py --profile=mem           (tracemalloc only)
+#
+# Reports are written to PIPELINE_PROFILE_DIR (default: the current
+# directory, i.e. the Jenkins workspace next to the other artifacts):
+#     profile_<step>.prof         - cProfile data (open with snakeviz/pstats)
+#     profile_<step>_cpu.txt      - top functions by cumulative time
+#     profile_<step>_alloc.txt    - top allocation sites
+PROFILE_ENV = 'PIPELINE_PROFILE'
+PROFILE_DIR_ENV = 'PIPELINE_PROFILE_DIR'
+ALL_MODES = ('cpu', 'mem')
+TOP_N = 25
+
+def _parse_modes(value):
+    """Turn '1', 'all', 'cpu', 'mem' or 'cpu,mem' into a set of modes"""
+    value = (value or '').strip().lower()
+    if not value or value in ('0', 'false', 'no', 'off'):
+        return set()
+    if value in ('1', 'true', 'yes', 'on', 'all'):
+        return set(ALL_MODES)
+    modes = {mode.strip() for mode in value.split(',') if mode.strip()}
+    unknown = modes - set(ALL_MODES)
+    if unknown:
+        print(f"⚠️ Unknown profiling mode(s) ignored: {', '.join(sorted(unknown))}")
+    return modes & set(ALL_MODES)
+
+def profiling_modes(argv=None):
+    """
+    Read the profiling switch from the command line or the environment
+
+    A --profile or --profile=<modes> flag is removed from argv so the
+    script's own argument handling never sees it.
+
+    Args:
+        argv (list): Argument list to inspect (default: sys.argv)
+
+    Returns:
+        set: Enabled modes ('cpu', 'mem'), empty when profiling is off
+    """
+    argv = sys.argv if argv is None else argv
+    for i, arg in enumerate(argv[1:], 1):
+        if arg == '--profile' or arg.startswith('--profile='):
+            del argv[i]
+            return _parse_modes(arg.partition('=')[2] or 'all')
+    return _parse_modes(os.environ.get(PROFILE_ENV))
+
+def _write_cpu_report(profiler, step, out_dir):
+    prof_path = os.path.join(out_dir, f"profile_{step}.prof")
+    profiler.dump_stats(prof_path)
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(TOP_N)
+    txt_path = os.path.join(out_dir, f"profile_{step}_cpu.txt")
+    with open(txt_path, 'w') as f:
+        f.write(stream.getvalue())
+
+    top = []
+    for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+        top.append((ct, nc, f"{os.path.basename(filename)}:{line}({func})"))
+    top.sort(reverse=True)
+    return [prof_path, txt_path], top[:10]
+
+def _write_alloc_report(snapshot, step, out_dir):
+    # Leave out the profilers' own bookkeeping
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, pstats.__file__),
+        tracemalloc.Filter(False, tracemalloc.__file__)
+    ])
+    stats = snapshot.statistics('lineno')
+    path = os.path.join(out_dir, f"profile_{step}_alloc.txt")
+    with open(path, 'w') as f:
+        f.write(f"Top {TOP_N} allocation sites for {step}\n\n")
+        for stat in stats[:TOP_N]:
+            f.write(f"{stat}\n")
+    return [path], stats[:5]
+
+@contextlib.contextmanager
+def profiled(step, argv=None):
+    """
+    Run a pipeline step under cProfile and/or tracemalloc when switched on
+
+    Does nothing unless PIPELINE_PROFILE or --profile is set. Reports are
+    written and a summary table printed when the step finishes, including
+    when it ends with sys.exit().
+
+    Args:
+        step (str): Step name used in report file names
+        argv (list): Argument list to inspect (default: sys.argv)
+    """
+    modes = profiling_modes(argv)
+    if not modes:
+        yield
+        return
+
+    out_dir = os.environ.get(PROFILE_DIR_ENV, '.')
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"🔬 Profiling {step} ({', '.join(sorted(modes))}) - reports go to {os.path.abspath(out_dir)}")
+
+    profiler = cProfile.Profile() if 'cpu' in modes else None
+    if 'mem' in modes:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        wall = time.perf_counter() - start
+
+        files = []
+        top_functions = []
+        top_allocations = []
+        peak = None
+        if 'mem' in modes:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            written, top_allocations = _write_alloc_report(snapshot, step, out_dir)
+            files.extend(written)
+        if profiler:
+            written, top_functions = _write_cpu_report(profiler, step, out_dir)
+            files.extend(written)
+
+        print(f"\n{'='*72}")
+        print(f"🔬 PROFILE SUMMARY: {step}")
+        print(f"{'='*72}")
+        print(f"⏱️ Wall time: {wall:.3f}s")
+        if peak is not None:
+            print(f"🧠 Peak traced memory: {peak / 1024 / 1024:.2f} MiB")
+        if top_functions:
+            print(f"\n{'cum s':>9} {'calls':>9}  function")
+            for cum, calls, name in top_functions:
+                print(f"{cum:>9.3f} {calls:>9}  {name}")
+        if top_allocations:
+            print(f"\n{'KiB':>9} {'blocks':>9}  allocation site")
+            for stat in top_allocations:
+                frame = stat.traceback[0]
+                print(f"{stat.size / 1024:>9.1f} {stat.count:>9}  {os.path.basename(frame.filename)}:{frame.lineno}")
+        print(f"\n📄 Reports: {', '.join(files)}")
+        print(f"{'='*72}")
@@ -0,0 +1,118 @@
+import datetime
+import os
+
+from run_state import get_email
+
+# Lifecycle of the temporary mailbox.
+#
+# Boomlify mailboxes live for 10 minutes (create_email.py asks for
+# time=10min) and the API reports the end of that lifetime as expires_at,
+# which create_email saves in the run state. A build reuses the saved
+# mailbox while it still has MAILBOX_MIN_REMAINING seconds left (default:
+# 300) instead of creating a new one, and pollers stop POLL_MARGIN seconds
+# before expiry rather than polling a mailbox that is already gone.
+MIN_REMAINING_ENV = 'MAILBOX_MIN_REMAINING'
+DEFAULT_MIN_REMAINING = 300
+POLL_MARGIN = 5
+
+def parse_expiry(expires_at):
+    """
+    Parse an expires_at value from the API
+
+    Args:
+        expires_at (str): ISO 8601 timestamp ('Z' suffix allowed, naive means UTC)
+
+    Returns:
+        datetime.datetime: Timezone-aware expiry, or None if missing or unparseable
+    """
+    if not expires_at or not isinstance(expires_at, str):
+        return None
+    value = expires_at.strip()
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        expiry = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=datetime.timezone.utc)
+    return expiry
+
+def seconds_remaining(expires_at, now=None):
+    """
+    Lifetime left on a mailbox
+
+    Args:
+        expires_at (str): expires_at value from the API
+        now (datetime.datetime): Current time (default: now)
+
+    Returns:
+        float: Seconds until expiry (negative once expired), or None when unknown
+    """
+    expiry = parse_expiry(expires_at)
+    if expiry is None:
+        return None
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return (expiry - now).total_seconds()
+
+def format_remaining(seconds):
+    """Human readable time remaining, e.g. '7m 05s' or 'expired'"""
+    if seconds is None:
+        return 'unknown'
+    if seconds <= 0:
+        return 'expired'
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}m {secs:02d}s"
+
+def min_remaining():
+    """Seconds of lifetime a saved mailbox needs to be reused"""
+    try:
+        return max(int(os.environ.get(MIN_REMAINING_ENV, DEFAULT_MIN_REMAINING)), 0)
+    except ValueError:
+        return DEFAULT_MIN_REMAINING
+
+def next_poll_delay(interval, expires_at, deadline=None, now=None):
+    """
+    Seconds to wait before the next poll of a mailbox
+
+    Never schedules a poll later than POLL_MARGIN seconds before expiry or
+    after the watch deadline.
+
+    Args:
+        interval (float): Normal polling interval in seconds
+        expires_at (str): Mailbox expiry (None if unknown)
+        deadline (datetime.datetime): End of the watch (aware, optional)
+        now (datetime.datetime): Current time (default: now)
+
+    Returns:
+        float: Delay in seconds, or None when there is no time left for another poll
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    limits = []
+    remaining = seconds_remaining(expires_at, now)
+    if remaining is not None:
+        limits.append(remaining - POLL_MARGIN)
+    if deadline is not None:
+        limits.append((deadline - now).total_seconds())
+    if limits and min(limits) <= 0:
+        return None
+    return max(min([interval] + limits), 0)
+
+def reusable_mailbox(required=None):
+    """
+    The saved mailbox, if it has enough lifetime left to be reused
+
+    Args:
+        required (float): Seconds of lifetime needed (default: MAILBOX_MIN_REMAINING)
+
+    Returns:
+        tuple: (email_id, email_address, expires_at), or (None, None, None)
+    """
+    email_id, email_address, expires_at = get_email()
+    if not email_id or not email_address:
+        return None, None, None
+    remaining = seconds_remaining(expires_at)
+    required = min_remaining() if required is None else required
+    if remaining is None or remaining < required:
+        return None, None, None
+    return email_id, email_address, expires_at
@@ -0,0 +1,178 @@
+import os
+import sys
+import threading
+import time
+
+import pipeline_metrics
+
+# Opt-in tracing of WebDriver wire commands.
+#
+# Every Selenium call that talks to the driver - driver.find_element,
+# element.is_displayed, element.send_keys, execute_script, ... - ends in
+# one WebDriver.execute(command, params) round trip, element commands
+# included. trace() wraps that method on one driver instance and counts
+# and times each command by its name and by the pipeline function that
+# issued it (the first caller outside Selenium), e.g.
+#
+#     findElement  page_objects.element   6 calls   48.2 ms
+#
+# report() prints the per-step summary (the scripts call it from close()).
+# Round trips and their time are also exported as
+# webdriver_commands_total / webdriver_command_seconds_total (see
+# pipeline_metrics), and the form benchmark asserts on them
+# (--max-round-trips).
+#
+#     WEBDRIVER_TRACE=1      trace the browser steps' drivers (default: off)
+TRACE_ENV = 'WEBDRIVER_TRACE'
+TOP_N = 15
+
+COMMANDS = pipeline_metrics.counter('webdriver_commands_total', 'WebDriver wire commands (round trips)',
+                                    ('command',))
+COMMAND_SECONDS = pipeline_metrics.counter('webdriver_command_seconds_total',
+                                           'Time spent in WebDriver wire commands', ('command',))
+
+def enabled():
+    """Whether WEBDRIVER_TRACE is switched on"""
+    return os.environ.get(TRACE_ENV, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _caller(frame):
+    """'module.function' of the first frame outside Selenium and this module"""
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != __name__ and module.split('.')[0] != 'selenium':
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return '(unknown)'
+
+class CommandTracer:
+    def __init__(self, driver, label=None):
+        """
+        Counts and times the wire commands of one driver
+
+        Args:
+            driver: Selenium WebDriver
+            label (str): Name used in the summary (e.g. 'signup Firefox')
+        """
+        self.driver = driver
+        self.label = label or type(driver).__name__
+        self.lock = threading.Lock()
+        # (command, caller) -> [calls, seconds, slowest, errors]
+        self.stats = {}
+        self._execute = driver.execute
+
+    def install(self):
+        """Route the driver's commands through the tracer"""
+        self.driver.execute = self.execute
+        self.driver._command_tracer = self
+        return self
+
+    def uninstall(self):
+        """Restore the driver's own execute()"""
+        if self.driver.__dict__.get('execute') == self.execute:
+            del self.driver.execute
+        self.driver.__dict__.pop('_command_tracer', None)
+
+    def execute(self, driver_command, params=None):
+        caller = _caller(sys._getframe(1))
+        start = time.perf_counter()
+        failed = False
+        try:
+            return self._execute(driver_command, params)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                entry = self.stats.setdefault((driver_command, caller), [0, 0.0, 0.0, 0])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3] += failed
+            COMMANDS.inc(command=driver_command)
+            COMMAND_SECONDS.inc(seconds, command=driver_command)
+
+    def round_trips(self):
+        """Commands sent so far"""
+        with self.lock:
+            return sum(entry[0] for entry in self.stats.values())
+
+    def by_command(self):
+        """
+        Totals per command
+
+        Returns:
+            dict: command -> {"calls", "seconds", "errors"}, most time first
+        """
+        totals = {}
+        with self.lock:
+            for (command, caller), (calls, seconds, slowest, errors) in self.stats.items():
+                total = totals.setdefault(command, {'calls': 0, 'seconds': 0.0, 'errors': 0})
+                total['calls'] += calls
+                total['seconds'] += seconds
+                total['errors'] += errors
+        return dict(sorted(totals.items(), key=lambda item: item[1]['seconds'], reverse=True))
+
+    def reset(self):
+        """Forget everything counted so far"""
+        with self.lock:
+            self.stats.clear()
+
+    def report(self, top=TOP_N):
+        """
+        Summary of the commands sent
+
+        Returns:
+            str: Multi-line table: per command, then the busiest command/caller pairs
+        """
+        with self.lock:
+            rows = sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True)
+        calls = sum(entry[0] for _, entry in rows)
+        seconds = sum(entry[1] for _, entry in rows)
+        lines = [f"🔌 WebDriver commands for {self.label}: {calls} round trips, {seconds:.2f}s"]
+        if not rows:
+            return '\n'.join(lines)
+        lines.append(f"   {'calls':>6} {'total ms':>10} {'mean ms':>8}  command")
+        for command, total in self.by_command().items():
+            errors = f"  ({total['errors']} failed)" if total['errors'] else ''
+            lines.append(f"   {total['calls']:>6} {total['seconds'] * 1000:>10.1f} "
+                         f"{total['seconds'] * 1000 / total['calls']:>8.1f}  {command}{errors}")
+        lines.append(f"   {'calls':>6} {'total ms':>10} {'max ms':>8}  command / caller (top {top})")
+        for (command, caller), (count, total, slowest, errors) in rows[:top]:
+            lines.append(f"   {count:>6} {total * 1000:>10.1f} {slowest * 1000:>8.1f}  {command} / {caller}")
+        return '\n'.join(lines)
+
+def trace(driver, label=None, force=False):
+    """
+    Start tracing a driver's commands when WEBDRIVER_TRACE is on
+
+    Args:
+        driver: Selenium WebDriver
+        label (str): Name used in the summary
+        force (bool): Trace regardless of WEBDRIVER_TRACE (benchmarks)
+
+    Returns:
+        CommandTracer: The tracer, or None when tracing is off
+    """
+    if driver is None or not (force or enabled()):
+        return None
+    existing = tracer_of(driver)
+    if existing is not None:
+        return existing
+    return CommandTracer(driver, label).install()
+
+def tracer_of(driver):
+    """The tracer installed on a driver, or None"""
+    return getattr(driver, '__dict__', {}).get('_command_tracer')
+
+def report(driver):
+    """
+    Print the command summary of a traced driver (no-op when untraced)
+
+    Returns:
+        CommandTracer: The tracer, or None
+    """
+    tracer = tracer_of(driver)
+    if tracer is not None:
+        print(tracer.report())
+    return tracer
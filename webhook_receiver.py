@@ -0,0 +1,352 @@
+import contextlib
+import hmac
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import deadline
+from mail_message import Message
+from message_store import save_message
+from pipeline_log import get_logger, clip
+
+log = get_logger('webhook_receiver')
+
+# Push intake for inbound-message notifications.
+#
+# Where the mail provider can call a webhook, a small local HTTP server
+# accepts its notifications instead of waiting for the next poll of
+# emails/{id}/messages. Switched on by WEBHOOK_PORT (unset or 0 = off):
+#
+#     WEBHOOK_PORT=8765                   port to listen on
+#     WEBHOOK_HOST=0.0.0.0                interface (default: 127.0.0.1; any other
+#                                         interface needs WEBHOOK_SECRET)
+#     WEBHOOK_PATH=/webhook/boomlify      path the provider POSTs to
+#     WEBHOOK_SECRET=...                  required as the X-Webhook-Secret header
+#                                         or a ?token= query parameter
+#     WEBHOOK_FALLBACK_INTERVAL=60        seconds between fallback polls while
+#                                         the receiver is up
+#
+# A notification is JSON: one message, {"message": {...}},
+# {"messages": [...]}, {"data": ...} or a bare list. Messages with a body
+# go straight into the message store and are handed to waiters at once;
+# notifications without one (e.g. {"email_id": ..., "message_id": ...})
+# only wake the waiters, which then poll. Notifications for another
+# mailbox are acknowledged and ignored, and messages whose ID is not a
+# plain token (it becomes a file name in the store) are dropped. Polling
+# stays as the fallback, so a provider that never calls back costs
+# nothing but a slower poll.
+PORT_ENV = 'WEBHOOK_PORT'
+HOST_ENV = 'WEBHOOK_HOST'
+PATH_ENV = 'WEBHOOK_PATH'
+SECRET_ENV = 'WEBHOOK_SECRET'
+FALLBACK_INTERVAL_ENV = 'WEBHOOK_FALLBACK_INTERVAL'
+DEFAULT_HOST = '127.0.0.1'
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+DEFAULT_PATH = '/webhook/boomlify'
+DEFAULT_FALLBACK_INTERVAL = 60
+SECRET_HEADER = 'X-Webhook-Secret'
+MAX_BODY_BYTES = 5 * 1024 * 1024
+
+# A pushed item carrying one of these is a full message, not just a ping
+BODY_FIELDS = ('subject', 'text', 'body', 'content', 'html', 'html_body')
+EMAIL_ID_KEYS = ('email_id', 'emailId', 'mailbox_id', 'inbox_id')
+WRAPPER_KEYS = ('messages', 'message', 'data')
+MESSAGE_ID_PATTERN = re.compile(r'[A-Za-z0-9_.-]+')
+
+def fallback_interval():
+    """Seconds between polls while pushes are being received"""
+    try:
+        return max(float(os.environ.get(FALLBACK_INTERVAL_ENV, DEFAULT_FALLBACK_INTERVAL)), 1.0)
+    except ValueError:
+        return float(DEFAULT_FALLBACK_INTERVAL)
+
+def _email_id_of(item, default=None):
+    if isinstance(item, dict):
+        for key in EMAIL_ID_KEYS:
+            if item.get(key):
+                return str(item[key])
+    return default
+
+def valid_message_id(message_id):
+    """Whether a pushed message ID is safe to use as a file name"""
+    message_id = str(message_id)
+    return bool(MESSAGE_ID_PATTERN.fullmatch(message_id)) and '..' not in message_id
+
+def parse_notification(payload):
+    """
+    Split a webhook payload into messages and bare notifications
+
+    Args:
+        payload: Decoded JSON body of the request
+
+    Returns:
+        list: (email_id, item) pairs - item is a Message when the payload
+            carried the message itself, else the notified message ID (may be None);
+            items with an ID that is not a plain token are dropped
+    """
+    email_id = _email_id_of(payload)
+    items = payload
+    if isinstance(payload, dict):
+        items = [payload]
+        for key in WRAPPER_KEYS:
+            if key in payload:
+                value = payload[key]
+                items = value if isinstance(value, list) else [value]
+                break
+    if not isinstance(items, list):
+        return []
+
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_email_id = _email_id_of(item, email_id)
+        message_id = item.get('message_id') or item.get('id')
+        if message_id and not valid_message_id(message_id):
+            log.warning(f"⚠️ Dropping pushed item with invalid message ID {clip(str(message_id))!r}")
+            continue
+        if item.get('id') and any(field in item for field in BODY_FIELDS):
+            parsed.append((item_email_id, Message.from_dict(item)))
+        else:
+            parsed.append((item_email_id, message_id))
+    return parsed
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    server_version = 'PipelineWebhook/1.0'
+
+    def log_message(self, format, *args):
+        log.debug(f"📡 {self.address_string()} {format % args}")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self, query):
+        secret = self.server.receiver.secret
+        if not secret:
+            return True
+        offered = self.headers.get(SECRET_HEADER) or (parse_qs(query).get('token') or [''])[0]
+        return hmac.compare_digest(offered.encode('utf-8'), secret.encode('utf-8'))
+
+    def do_GET(self):
+        # Providers often check the URL before enabling a webhook
+        url = urlsplit(self.path)
+        if url.path != self.server.receiver.path:
+            self._send_json(404, {'success': False, 'error': 'Not found'})
+            return
+        self._send_json(200, {'success': True, 'status': 'listening'})
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        url = urlsplit(self.path)
+        if url.path != receiver.path:
+            self._send_json(404, {'success': False, 'error': 'Not found'})
+            return
+        if not self._authorized(url.query):
+            receiver.count('rejected')
+            self._send_json(401, {'success': False, 'error': 'Bad or missing webhook secret'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            receiver.count('rejected')
+            self._send_json(413, {'success': False, 'error': 'Notification too large'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8') or 'null')
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            receiver.count('rejected')
+            self._send_json(400, {'success': False, 'error': f"Invalid JSON: {e}"})
+            return
+
+        accepted = receiver.deliver(parse_notification(payload))
+        self._send_json(200, {'success': True, 'accepted': accepted})
+
+class WebhookReceiver:
+    def __init__(self, email_id=None, host=DEFAULT_HOST, port=0, path=DEFAULT_PATH, secret=None, store=True):
+        """
+        Local HTTP receiver for inbound-message notifications
+
+        Args:
+            email_id (str): Only accept notifications for this mailbox
+                (notifications that don't name a mailbox are always accepted)
+            host (str): Interface to bind
+            port (int): Port to bind (0 picks a free port)
+            path (str): Path the provider POSTs to
+            secret (str): Shared secret required on every notification (None = open)
+            store (bool): Save pushed messages to the message store
+        """
+        self.email_id = email_id
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.store = store
+        self.cond = threading.Condition()
+        self.pending = []
+        self.pinged = False
+        self.woken = False
+        self.stats = {'notifications': 0, 'messages': 0, 'pings': 0, 'ignored': 0, 'rejected': 0}
+        self.httpd = None
+        self.thread = None
+
+    @classmethod
+    def from_env(cls, email_id=None):
+        """Receiver configured from WEBHOOK_* (None when WEBHOOK_PORT is unset or 0)"""
+        try:
+            port = int(os.environ.get(PORT_ENV) or 0)
+        except ValueError:
+            log.warning(f"⚠️ Ignoring invalid {PORT_ENV}={os.environ.get(PORT_ENV)!r}")
+            return None
+        if not port:
+            return None
+        host = os.environ.get(HOST_ENV) or DEFAULT_HOST
+        secret = os.environ.get(SECRET_ENV) or None
+        if host not in LOOPBACK_HOSTS and not secret:
+            log.error(f"❌ {HOST_ENV}={host} exposes the receiver: set {SECRET_ENV} (polling instead)")
+            return None
+        return cls(email_id=email_id,
+                   host=host,
+                   port=port,
+                   path=os.environ.get(PATH_ENV) or DEFAULT_PATH,
+                   secret=secret)
+
+    @property
+    def url(self):
+        """URL notifications are POSTed to"""
+        host = '127.0.0.1' if self.host in ('', '0.0.0.0') else self.host
+        return f"http://{host}:{self.port}{self.path}"
+
+    def start(self):
+        """Start serving in a background thread"""
+        self.httpd = ThreadingHTTPServer((self.host, self.port), WebhookHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.receiver = self
+        self.port = self.httpd.server_address[1]
+        # A short poll interval keeps stop() - and so the step after the watch - prompt
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05},
+                                       name='webhook-receiver', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and wake any waiter"""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+        with self.cond:
+            self.cond.notify_all()
+
+    def count(self, key, amount=1):
+        with self.cond:
+            self.stats[key] += amount
+
+    def deliver(self, items):
+        """
+        Take the parsed items of one notification
+
+        Messages are saved to the message store before waiters are woken,
+        so whoever wakes up can already read them from disk.
+
+        Args:
+            items (list): (email_id, Message or message ID) pairs from parse_notification
+
+        Returns:
+            int: Items accepted for this receiver's mailbox
+        """
+        messages = []
+        pings = 0
+        ignored = 0
+        for email_id, item in items:
+            if self.email_id and email_id and email_id != self.email_id:
+                ignored += 1
+            elif isinstance(item, Message):
+                messages.append(item)
+            else:
+                pings += 1
+
+        if self.store:
+            for message in messages:
+                try:
+                    save_message(message.id, message)
+                except (OSError, ValueError, TypeError) as e:
+                    log.warning(f"⚠️ Could not store pushed message {clip(message.id)}: {e}")
+
+        with self.cond:
+            self.stats['notifications'] += 1
+            self.stats['messages'] += len(messages)
+            self.stats['pings'] += pings
+            self.stats['ignored'] += ignored
+            self.pending.extend(messages)
+            if pings or not items:
+                self.pinged = True
+            if messages or self.pinged:
+                self.cond.notify_all()
+        return len(messages) + pings
+
+    def wake(self):
+        """End the current wait() early, e.g. when the watch is being stopped"""
+        with self.cond:
+            self.woken = True
+            self.cond.notify_all()
+
+    def wait(self, timeout):
+        """
+        Wait for a notification
+
+        Args:
+            timeout (float): Longest wait in seconds (capped by the step deadline)
+
+        Returns:
+            tuple: (messages, pinged) - the pushed messages, and whether a
+                notification without a body asked for a poll
+        """
+        timeout = deadline.wait_timeout(timeout, 'webhook wait')
+        with deadline.span('webhook wait'), self.cond:
+            self.cond.wait_for(lambda: self.pending or self.pinged or self.woken or self.httpd is None, timeout)
+            self.woken = False
+            messages, self.pending = self.pending, []
+            pinged, self.pinged = self.pinged, False
+        return messages, pinged
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+@contextlib.contextmanager
+def receiving(email_id=None):
+    """
+    Run the receiver configured by WEBHOOK_* for the block
+
+    Yields:
+        WebhookReceiver: The running receiver, or None when webhooks are off
+            or the port can't be bound (callers then just poll)
+    """
+    receiver = WebhookReceiver.from_env(email_id)
+    if receiver is None:
+        yield None
+        return
+    try:
+        receiver.start()
+    except OSError as e:
+        log.warning(f"⚠️ Webhook receiver not started ({receiver.host}:{receiver.port}): {e} - polling only")
+        yield None
+        return
+    log.info(f"📡 Listening for pushed messages on {receiver.url}")
+    try:
+        yield receiver
+    finally:
+        receiver.stop()
+        log.info(f"📡 Webhook receiver stopped: {receiver.stats['notifications']} notifications, "
+                 f"{receiver.stats['messages']} messages pushed")
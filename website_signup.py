@@ -1,5 +1,4 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -10,9 +9,20 @@ import time
 import os
 import subprocess
 import sys
-import json
 import datetime
 import tempfile
+import shutil
+from step_profiler import profiled
+import deadline
+import browser_processes
+import pipeline_metrics
+import navigation_timing
+import page_objects
+import webdriver_trace
+from run_state import get_email, save_section, state_path
+
+# Sign-up page URL (override with EMBYIL_SIGNUP_URL, e.g. to use an offline fixture)
+SIGNUP_URL = os.environ.get('EMBYIL_SIGNUP_URL', 'https://client.embyiltv.io/sign-up')
 
 class EmbyILRegistration:
     def __init__(self, headless=True):
@@ -23,6 +33,7 @@ class EmbyILRegistration:
             headless (bool): Run browser in headless mode (without GUI)
         """
         self.driver = None
+        self.profile_dir = None
         self.headless = headless
         self.browser_type = None
         self.setup_driver()
@@ -71,6 +82,7 @@ class EmbyILRegistration:
     def setup_driver(self):
         """Setup WebDriver with Firefox as primary choice, Chrome as fallback"""
         print("🔧 Setting up WebDriver - Firefox first, Chrome as fallback...")
+        browser_processes.prepare()
         
         # Try Firefox first (more stable in Docker)
         methods = [
@@ -84,8 +96,16 @@ class EmbyILRegistration:
                 try:
                     print(f"🔄 Attempting {browser_name} (attempt {attempt + 1}/2)...")
                     
-                    self.driver = method()
+                    self.profile_dir = None
+                    started = time.monotonic()
+                    with deadline.span('start browser'):
+                        self.driver = method()
+                    pipeline_metrics.DRIVER_START.observe(time.monotonic() - started, browser=browser_name,
+                                                          outcome='ok' if self.driver else 'failed')
                     if self.driver:
+                        browser_processes.register(self.driver, f"signup {browser_name}",
+                                                   [self.profile_dir] if self.profile_dir else [])
+                        webdriver_trace.trace(self.driver, f"signup {browser_name}")
                         print(f"✅ Driver created with {browser_name}")
                         self.browser_type = browser_name
                         
@@ -100,21 +120,21 @@ class EmbyILRegistration:
                             return
                         except Exception as e:
                             print(f"❌ Basic test failed: {e}")
-                            self.driver.quit()
+                            browser_processes.quit_driver(self.driver)
                             self.driver = None
                             
                 except Exception as e:
                     print(f"❌ {browser_name} attempt {attempt + 1} failed: {str(e)}")
                     if self.driver:
                         try:
-                            self.driver.quit()
+                            browser_processes.quit_driver(self.driver)
                         except:
                             pass
                         self.driver = None
                     
                     if attempt < 1:  # Not the last attempt
                         print("⏳ Waiting 3 seconds before retry...")
-                        time.sleep(3)
+                        deadline.sleep(3)
 
         raise Exception("All browser initialization methods failed. Neither Firefox nor Chrome are working in this Docker environment.")
 
@@ -141,6 +161,7 @@ class EmbyILRegistration:
         
         # Create Firefox profile directory
         profile_dir = tempfile.mkdtemp(prefix="firefox_", suffix="_profile")
+        self.profile_dir = profile_dir
         firefox_options.set_preference("profile", profile_dir)
         
         print(f"📁 Firefox profile directory: {profile_dir}")
@@ -150,6 +171,7 @@ class EmbyILRegistration:
             return webdriver.Firefox(service=service, options=firefox_options)
         except Exception as e:
             print(f"Firefox initialization failed: {e}")
+            shutil.rmtree(profile_dir, ignore_errors=True)
             return None
 
     def _try_chrome_minimal(self):
@@ -192,26 +214,24 @@ class EmbyILRegistration:
         chrome_options.add_argument("--window-size=1280,720")
         
         user_data_dir = tempfile.mkdtemp(prefix="chrome_", suffix="_profile")
+        self.profile_dir = user_data_dir
         chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
         
         try:
             return webdriver.Chrome(options=chrome_options)
         except Exception as e:
             print(f"Full Chrome failed: {e}")
+            shutil.rmtree(user_data_dir, ignore_errors=True)
             return None
 
     def read_email_from_file(self):
-        """Read email address from email_info.txt file"""
+        """Read email address from the run state saved by create_email.py"""
         try:
-            if os.path.exists('email_info.txt'):
-                with open('email_info.txt', 'r') as f:
-                    content = f.read()
-                    for line in content.split('\n'):
-                        if 'EMAIL_ADDRESS=' in line:
-                            email = line.split('=')[1].strip()
-                            print(f"📧 Using email from file: {email}")
-                            return email
-            print("❌ Could not read email from email_info.txt")
+            email = get_email()[1]
+            if email:
+                print(f"📧 Using email from run state: {email}")
+                return email
+            print(f"❌ Could not read email from {state_path()}")
             return None
         except Exception as e:
             print(f"❌ Error reading email file: {e}")
@@ -234,7 +254,7 @@ class EmbyILRegistration:
         return first_name, last_name, password
 
     def save_signup_info(self, first_name, last_name, email, password, success=False):
-        """Save signup information to JSON file"""
+        """Save signup information to the run state"""
         signup_info = {
             'timestamp': datetime.datetime.now().isoformat(),
             'first_name': first_name,
@@ -243,21 +263,13 @@ class EmbyILRegistration:
             'password': password,
             'success': success,
             'browser_used': self.browser_type or 'Unknown',
-            'url': 'https://client.embyiltv.io/sign-up',
+            'url': SIGNUP_URL,
             'note': 'Fixed password Aa123456! used for all registrations'
         }
         
-        filename = f"signup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
         try:
-            with open(filename, 'w') as f:
-                json.dump(signup_info, f, indent=2)
-            print(f"💾 Signup info saved to: {filename}")
-            
-            # Also save as signup_info.json (for Jenkins pipeline compatibility)
-            with open('signup_info.json', 'w') as f:
-                json.dump(signup_info, f, indent=2)
-            print("💾 Also saved as: signup_info.json")
+            save_section('signup', signup_info)
+            print(f"💾 Signup info saved to: {state_path()}")
             
         except Exception as e:
             print(f"❌ Failed to save signup info: {e}")
@@ -268,46 +280,17 @@ class EmbyILRegistration:
         
         try:
             print(f"🌐 Navigating to registration page using {self.browser_type}...")
-            self.driver.get("https://client.embyiltv.io/sign-up")
+            deadline.bound_driver(self.driver)
+            with deadline.span('load sign-up page'):
+                navigation_timing.load(self.driver, SIGNUP_URL, 'sign-up')
 
-            wait = WebDriverWait(self.driver, 20)
-            time.sleep(5)
+            wait = WebDriverWait(self.driver, deadline.wait_timeout(20))
+            deadline.sleep(5)
 
             # Take screenshot before filling
             self.driver.save_screenshot("signup_before_filling.png")
             print("📸 Screenshot saved: signup_before_filling.png")
 
-            # Simplified field selectors
-            field_selectors = {
-                'first_name': [
-                    'input[name="firstName"]',
-                    'input[name="first_name"]',
-                    'input[placeholder*="First"]',
-                    'input[type="text"]:first-of-type'
-                ],
-                'last_name': [
-                    'input[name="lastName"]',
-                    'input[name="last_name"]',
-                    'input[placeholder*="Last"]',
-                    'input[type="text"]:nth-of-type(2)'
-                ],
-                'email': [
-                    'input[name="email"]',
-                    'input[type="email"]',
-                    'input[placeholder*="Email"]'
-                ],
-                'password': [
-                    'input[name="password"]',
-                    'input[type="password"]',
-                    'input[placeholder*="Password"]'
-                ],
-                'password_confirm': [
-                    'input[name="confirmPassword"]',
-                    'input[name="password_confirmation"]',
-                    'input[type="password"]:nth-of-type(2)'
-                ]
-            }
-
             # Fill fields
             fields_filled = 0
             field_data = {
@@ -318,16 +301,18 @@ class EmbyILRegistration:
                 'password_confirm': password_confirm
             }
             
-            for field_name, selectors in field_selectors.items():
-                element = self.find_element_by_selectors(selectors)
+            # One snapshot resolves every field (see page_objects.py)
+            page = page_objects.take(self.driver, page_objects.SIGN_UP, timeout=5)
+            for field_name in field_data:
+                element = page.element(field_name)
                 if element:
                     try:
                         self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", element)
-                        time.sleep(1)
+                        deadline.sleep(1)
                         element.clear()
-                        time.sleep(0.5)
+                        deadline.sleep(0.5)
                         element.send_keys(field_data[field_name])
-                        time.sleep(1)
+                        deadline.sleep(1)
                         print(f"✅ {field_name.replace('_', ' ').title()} filled successfully")
                         fields_filled += 1
                     except Exception as e:
@@ -343,26 +328,20 @@ class EmbyILRegistration:
 
             # Find and click submit button
             print("🔘 Looking for submit button...")
-            time.sleep(3)
+            deadline.sleep(3)
             
-            button_selectors = [
-                'button[type="submit"]',
-                'input[type="submit"]',
-                '.submit-button',
-                '.btn-submit',
-                '.btn-primary'
-            ]
-
-            submit_button = self.find_element_by_selectors(button_selectors)
+            # Re-read the page: the button may only be enabled once the form is valid
+            page = page.refresh(timeout=5, wait_for=('submit',))
+            submit_button = page.element('submit')
 
             if submit_button:
                 try:
                     print("🎯 Attempting to click submit button...")
                     self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", submit_button)
-                    time.sleep(2)
+                    deadline.sleep(2)
                     
                     wait.until(EC.element_to_be_clickable(submit_button))
-                    time.sleep(1)
+                    deadline.sleep(1)
                     
                     # Try clicking
                     submit_button.click()
@@ -370,7 +349,7 @@ class EmbyILRegistration:
                     
                     # Wait for response
                     print("⏳ Waiting for response...")
-                    time.sleep(8)
+                    deadline.sleep(8)
                     
                     # Take screenshot after submit
                     self.driver.save_screenshot("signup_after_submit.png")
@@ -386,7 +365,7 @@ class EmbyILRegistration:
                 print("❌ No submit button found!")
                 self.driver.save_screenshot("signup_no_button_found.png")
                 
-            time.sleep(5)
+            deadline.sleep(5)
                 
         except Exception as e:
             print(f"❌ An error occurred during signup: {str(e)}")
@@ -397,24 +376,12 @@ class EmbyILRegistration:
         self.save_signup_info(first_name, last_name, email, password, success)
         return success
 
-    def find_element_by_selectors(self, selectors):
-        """Try to find element using multiple selectors"""
-        for selector in selectors:
-            try:
-                wait = WebDriverWait(self.driver, 5)
-                element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
-                
-                if element.is_displayed() and element.is_enabled():
-                    return element
-            except Exception:
-                continue
-        return None
-
     def close(self):
         """Close the browser"""
         if self.driver:
+            webdriver_trace.report(self.driver)
             try:
-                self.driver.quit()
+                browser_processes.quit_driver(self.driver)
                 print(f"🔒 {self.browser_type} browser closed successfully")
             except Exception as e:
                 print(f"⚠️ Error closing browser: {e}")
@@ -473,4 +440,5 @@ def main():
         print("🏁 Script finished")
 
 if __name__ == "__main__":
-    main()
+    with profiled('website_signup'), deadline.step_deadline('website_signup'):
+        main()